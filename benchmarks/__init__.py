@@ -0,0 +1,36 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+"""Performance benchmarks of PyWebP-Gtk.
+
+Importing this package points the XDG data and cache folders to a temporary folder, so settings, conversion cache
+and thumbnails written by the benchmarks never touch the user ones.
+"""
+
+import os
+import tempfile
+
+_tmp_home = tempfile.mkdtemp(prefix="pywebp-bench-home-")
+os.environ["XDG_DATA_HOME"] = os.path.join(_tmp_home, "data")
+os.environ["XDG_CACHE_HOME"] = os.path.join(_tmp_home, "cache")
@@ -0,0 +1,90 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+"""Compare the encoder backends on small and large images.
+
+Run from the project root with:
+    python -m benchmarks.backends_bench
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.corpus import generate_corpus
+from pywebp.backends import BACKENDS
+from pywebp.converter import Converter
+
+# (label, number of files, width, height)
+CASES = [
+    ("small", 200, 64, 64),
+    ("large", 8, 2048, 2048),
+]
+
+
+def run_case(backend, paths, workers):
+    """Convert a set of images and measure the elapsed time
+
+    Args:
+        backend: the EncoderBackend class to use
+        paths: full paths of the input images
+        workers: number of parallel conversions
+
+    Returns:
+        elapsed seconds, or None if some conversion failed
+    """
+    converter = Converter(workers, backend())
+    # measure the encoders, not the conversion cache
+    converter.cache = None
+    jobs = converter.make_jobs(paths, True)
+    start = time.perf_counter()
+    converter.run(jobs)
+    elapsed = time.perf_counter() - start
+    failed = [job for job in jobs if job.error is not None]
+    if failed:
+        print("  %s: %d failed, first error: %s" % (backend.name, len(failed), failed[0].error))
+        return None
+    return elapsed
+
+
+def main():
+    workers_list = sorted({1, os.cpu_count() or 1})
+    backends = [backend for backend in BACKENDS.values() if backend.is_available()]
+    with tempfile.TemporaryDirectory(prefix="pywebp-bench-") as tmp_dir:
+        corpus = generate_corpus(tmp_dir, CASES)
+        for label, count, width, height in CASES:
+            paths = corpus[label]
+            print("%s: %d images %dx%d" % (label, count, width, height))
+            for workers in workers_list:
+                for backend in backends:
+                    elapsed = run_case(backend, paths, workers)
+                    if elapsed is not None:
+                        print("  %-10s workers=%-3d %8.3fs  %8.1f img/s"
+                              % (backend.name, workers, elapsed, count / elapsed))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+"""Synthetic image corpus for the benchmarks.
+
+Images are made of shifted gradients, so that they do not compress to nothing, and are fully reproducible.
+"""
+
+import os
+
+import gi
+
+gi.require_version("GdkPixbuf", "2.0")
+from gi.repository import GLib, GdkPixbuf
+
+# (label, number of files, width, height) of the default corpus
+DEFAULT_SETS = [
+    ("small", 200, 64, 64),
+    ("medium", 40, 640, 480),
+    ("large", 8, 2048, 2048),
+]
+
+
+def make_pixbuf(width, height, seed=0) -> GdkPixbuf.Pixbuf:
+    """Create a synthetic RGB image
+
+    Args:
+        width: image width
+        height: image height
+        seed: changes the pattern, so that images of the same size have different content
+
+    Returns:
+        the image as a Pixbuf
+    """
+    row_length = width * 3
+    pattern = bytes((i * 31 + i // 7 + seed * 13) % 251 for i in range(row_length + 256))
+    pixels = b"".join(pattern[y % 256:y % 256 + row_length] for y in range(height))
+    return GdkPixbuf.Pixbuf.new_from_bytes(GLib.Bytes.new(pixels), GdkPixbuf.Colorspace.RGB, False, 8,
+                                           width, height, row_length)
+
+
+def make_image(path, width, height, seed=0):
+    """Write a synthetic image, in the format given by the path extension (png or jpeg)
+
+    Args:
+        path: full path of the image
+        width: image width
+        height: image height
+        seed: changes the pattern, so that images of the same size have different content
+    """
+    image_type = "jpeg" if path.lower().endswith((".jpg", ".jpeg")) else "png"
+    make_pixbuf(width, height, seed).savev(path, image_type, [], [])
+
+
+def generate_corpus(folder, sets=None, image_type="png") -> {str: [str]}:
+    """Write a corpus of synthetic images
+
+    Args:
+        folder: folder of the images
+        sets: list of (label, number of files, width, height). Default is DEFAULT_SETS
+        image_type: "png" or "jpg"
+
+    Returns:
+        a dict with the full paths of the images of each set label
+    """
+    corpus = {}
+    for label, count, width, height in sets if sets is not None else DEFAULT_SETS:
+        corpus[label] = []
+        for index in range(count):
+            path = os.path.join(folder, "%s-%04d.%s" % (label, index, image_type))
+            make_image(path, width, height, index)
+            corpus[label].append(path)
+    return corpus
@@ -0,0 +1,124 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+"""Measure the insertion of many rows in the IconStore, one by one and with add_many.
+
+Needs a display. Run from the project root with:
+    python -m benchmarks.iconstore_bench [ROWS]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import gi
+
+gi.require_version("Gtk", "3.0")
+from gi.repository import Gtk, GLib
+from pywebp.iconstore import IconStore
+
+DEFAULT_ROWS = 50000
+
+
+def make_files(folder, count) -> [str]:
+    """Create empty files to be added to the model
+
+    Args:
+        folder: folder of the files
+        count: number of files
+
+    Returns:
+        full paths of the files
+    """
+    paths = []
+    for index in range(count):
+        path = os.path.join(folder, "image-%06d.png" % index)
+        open(path, "wb").close()
+        paths.append(path)
+    return paths
+
+
+def make_view() -> (Gtk.IconView, IconStore):
+    """Create an IconView inside a realized window, like the one of the application
+
+    Returns:
+        a (view, store) tuple
+    """
+    store = IconStore()
+    view = Gtk.IconView()
+    view.set_text_column(0)
+    view.set_pixbuf_column(1)
+    view.set_model(store)
+    scroll_win = Gtk.ScrolledWindow()
+    scroll_win.add(view)
+    window = Gtk.Window()
+    window.resize(980, 400)
+    window.add(scroll_win)
+    window.show_all()
+    return view, store
+
+
+def flush_events():
+    """Run the main loop until there is nothing left to do, so that pending layouts are included in timings
+    """
+    while Gtk.events_pending():
+        Gtk.main_iteration()
+
+
+def bench_one_by_one(paths) -> float:
+    view, store = make_view()
+    start = time.perf_counter()
+    for path in paths:
+        store.add_to_model(path)
+    flush_events()
+    return time.perf_counter() - start
+
+
+def bench_add_many(paths) -> float:
+    view, store = make_view()
+    loop = GLib.MainLoop()
+    start = time.perf_counter()
+    store.add_many(paths, view, lambda count: loop.quit())
+    if len(paths) > 0 and len(store) < len(paths):
+        loop.run()
+    flush_events()
+    return time.perf_counter() - start
+
+
+def main():
+    if not Gtk.init_check(sys.argv)[0]:
+        print("A display is needed to run this benchmark")
+        return 1
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS
+    with tempfile.TemporaryDirectory(prefix="pywebp-bench-") as tmp_dir:
+        paths = make_files(tmp_dir, rows)
+        for name, bench in (("add_many", bench_add_many), ("add_to_model", bench_one_by_one)):
+            elapsed = bench(paths)
+            print("%-13s %d rows %8.3fs  %10.0f rows/s" % (name, rows, elapsed, rows / elapsed))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
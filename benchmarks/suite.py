@@ -0,0 +1,277 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+"""Benchmark suite of PyWebP-Gtk, failing when a result regresses past the stored baseline.
+
+Run from the project root with:
+    python -m benchmarks.suite [--update-baseline] [--tolerance 0.5] [--only NAME ...]
+
+Every benchmark measures the seconds taken by a fixed workload on a synthetic corpus, keeping the best of a few
+repeats. Results are compared with benchmarks/baseline.json: a benchmark fails when it is slower than its baseline
+by more than the tolerance. Baselines depend on the machine: they are recorded with --update-baseline
+(make pywebp-bench-baseline) on the reference machine, committed, and refreshed when that machine changes.
+A benchmark without baseline fails the run, so the gate never passes by recording what it measures.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import gi
+
+gi.require_version("GdkPixbuf", "2.0")
+from gi.repository.GdkPixbuf import Pixbuf
+from benchmarks.corpus import generate_corpus, make_image
+from pywebp.backends import BACKENDS
+from pywebp.converter import Converter
+from pywebp.iconstore import IconStore
+from pywebp.rowfilter import parse_filter
+from pywebp.settings import settings
+from pywebp.thumbcache import ThumbnailCache
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "baseline.json")
+DEFAULT_TOLERANCE = 0.5
+REPEATS = 3
+# rows of the IconStore benchmarks
+STORE_ROWS = 20000
+SETTINGS_READS = 1000
+SETTINGS_WRITES = 100
+
+
+def best_of(func, repeats=REPEATS) -> float:
+    """Run a workload several times
+
+    Args:
+        func: the workload, called without arguments
+        repeats: number of runs
+
+    Returns:
+        the seconds taken by the fastest run
+    """
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def make_store_files(folder, count) -> [str]:
+    """Create many small images sharing the same content, to be added to the IconStore
+
+    Args:
+        folder: folder of the images
+        count: number of images
+
+    Returns:
+        full paths of the images
+    """
+    source = os.path.join(folder, "source.png")
+    make_image(source, 16, 16)
+    paths = []
+    for index in range(count):
+        path = os.path.join(folder, "row-%06d.png" % index)
+        try:
+            os.link(source, path)
+        except OSError:
+            shutil.copyfile(source, path)
+        paths.append(path)
+    return paths
+
+
+class Suite:
+    """Benchmarks sharing the same corpus. Each bench_* method returns the seconds of its workload.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.corpus = generate_corpus(os.path.join(folder, "corpus"))
+        os.makedirs(os.path.join(folder, "rows"))
+        self.rows = make_store_files(os.path.join(folder, "rows"), STORE_ROWS)
+
+    def bench_thumbnail_decode(self) -> float:
+        """Decode 128px thumbnails of the medium images from the full-size files"""
+        paths = self.corpus["medium"]
+        return best_of(lambda: [Pixbuf.new_from_file_at_scale(path, 128, 128, True) for path in paths])
+
+    def bench_thumbnail_cache_hit(self) -> float:
+        """Load 128px thumbnails of the medium images from a warm thumbnail cache"""
+        cache = ThumbnailCache(os.path.join(self.folder, "thumbnails"), os.path.join(self.folder, "private"))
+        paths = self.corpus["medium"]
+        for path in paths:
+            cache.load(path, 128, 128)
+        return best_of(lambda: [cache.load(path, 128, 128) for path in paths])
+
+    def bench_iconstore_add_many(self) -> float:
+        """Populate an IconStore with STORE_ROWS rows"""
+        def _populate():
+            store = IconStore()
+            store.add_many(self.rows, chunk_size=len(self.rows))
+            store.clear()
+        return best_of(_populate)
+
+    def bench_iconstore_is_duplicate(self) -> float:
+        """Check STORE_ROWS paths for duplicates in a populated IconStore"""
+        store = IconStore()
+        store.add_many(self.rows, chunk_size=len(self.rows))
+        elapsed = best_of(lambda: [store.is_duplicate(path) for path in self.rows])
+        store.clear()
+        return elapsed
+
+    def bench_iconstore_sort(self) -> float:
+        """Sort a populated IconStore of STORE_ROWS rows by name, descending and ascending"""
+        store = IconStore()
+        store.add_many(self.rows, chunk_size=len(self.rows))
+        elapsed = best_of(lambda: [store.sort_rows("name", reverse) for reverse in (True, False)])
+        store.clear()
+        return elapsed
+
+    def bench_iconstore_filter(self) -> float:
+        """Filter a populated IconStore of STORE_ROWS rows by size, hiding and showing every row"""
+        store = IconStore()
+        store.add_many(self.rows, chunk_size=len(self.rows))
+        elapsed = best_of(lambda: [store.set_filter(parse_filter(expression)) for expression in ("> 5 MB", "")])
+        store.clear()
+        return elapsed
+
+    def bench_settings_read(self) -> float:
+        """Read an integer list setting SETTINGS_READS times"""
+        return best_of(lambda: [settings.get_integer_list("default_thumbsize") for _ in range(SETTINGS_READS)])
+
+    def bench_settings_write(self) -> float:
+        """Write a boolean setting SETTINGS_WRITES times"""
+        value = settings.get_boolean("darkmode")
+        elapsed = best_of(lambda: [settings.set_boolean("darkmode", index % 2 == 0)
+                                   for index in range(SETTINGS_WRITES)])
+        settings.set_boolean("darkmode", value)
+        return elapsed
+
+    def _bench_convert(self, label) -> float:
+        """Convert a set of the corpus to webp, without conversion cache"""
+        backend = [backend for backend in BACKENDS.values() if backend.is_available()][-1]
+        converter = Converter(None, backend())
+        converter.cache = None
+        output_dir = os.path.join(self.folder, "output")
+        os.makedirs(output_dir, exist_ok=True)
+
+        def _convert():
+            jobs = converter.run(converter.make_jobs(self.corpus[label], True, output_dir))
+            failed = [job for job in jobs if job.error is not None]
+            if failed:
+                raise RuntimeError("conversion of %s failed: %s" % (failed[0].src, failed[0].error))
+        return best_of(_convert, 1)
+
+    def bench_convert_small(self) -> float:
+        """Convert the small images to webp with every worker"""
+        return self._bench_convert("small")
+
+    def bench_convert_large(self) -> float:
+        """Convert the large images to webp with every worker"""
+        return self._bench_convert("large")
+
+    def names(self) -> [str]:
+        """Names of all the benchmarks
+
+        Returns:
+            the benchmark names, in declaration order
+        """
+        return [name[len("bench_"):] for name in type(self).__dict__ if name.startswith("bench_")]
+
+
+def load_baseline() -> dict:
+    """Read the stored baseline
+
+    Returns:
+        a dict of seconds by benchmark name, empty if there is no baseline yet
+    """
+    if not os.path.exists(BASELINE_FILE):
+        return {}
+    with open(BASELINE_FILE) as baseline_file:
+        return json.load(baseline_file)
+
+
+def save_baseline(results):
+    """Store the results as the new baseline
+
+    Args:
+        results: dict of seconds by benchmark name
+    """
+    with open(BASELINE_FILE, "w") as baseline_file:
+        json.dump(results, baseline_file, indent=4, sort_keys=True)
+        baseline_file.write("\n")
+
+
+def main(args=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite", description=__doc__.splitlines()[0])
+    parser.add_argument("--update-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed slowdown over the baseline, 0.5 means 50%% slower (default %(default)s)")
+    parser.add_argument("--only", nargs="+", metavar="NAME", help="run only these benchmarks")
+    args = parser.parse_args(args)
+
+    baseline = load_baseline()
+    results = {}
+    regressions = []
+    missing = []
+    with tempfile.TemporaryDirectory(prefix="pywebp-bench-") as tmp_dir:
+        suite = Suite(tmp_dir)
+        for name in suite.names():
+            if args.only and name not in args.only:
+                continue
+            results[name] = elapsed = getattr(suite, "bench_" + name)()
+            line = "%-24s %9.4fs" % (name, elapsed)
+            if name in baseline:
+                ratio = elapsed / baseline[name] if baseline[name] > 0 else 1.0
+                line += "  baseline %9.4fs  %+6.1f%%" % (baseline[name], (ratio - 1) * 100)
+                if ratio > 1 + args.tolerance:
+                    regressions.append(name)
+                    line += "  REGRESSION"
+            else:
+                missing.append(name)
+                line += "  NO BASELINE"
+            print(line)
+
+    if args.update_baseline:
+        baseline.update(results)
+        save_baseline(baseline)
+        print("Baseline saved to %s" % BASELINE_FILE)
+        return 0
+    if missing:
+        print("%d benchmarks have no baseline in %s: %s\nRecord it on the reference machine with "
+              "make pywebp-bench-baseline and commit it" % (len(missing), BASELINE_FILE, ", ".join(missing)),
+              file=sys.stderr)
+        return 2
+    if regressions:
+        print("%d benchmarks regressed past the baseline: %s" % (len(regressions), ", ".join(regressions)))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
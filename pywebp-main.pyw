@@ -2,11 +2,17 @@
 import signal
 import sys
 
-from pywebp.app import PyWebP
+from pywebp import cli, instrument
 
 if __name__ == '__main__':
+    args = instrument.configure(sys.argv[1:], install=False)
+    if cli.is_headless(args):
+        sys.exit(cli.main(args))
+    # the instrumentation watches the Gtk main loop, only the application has one
+    instrument.configure(sys.argv[1:])
+    from pywebp.app import PyWebP
     # signal.signal(signal.SIGINT, signal.SIG_DFL)  # ^C
-    PyWebP().run(sys.argv)
+    PyWebP().run(sys.argv[:1] + args)
 
 
 
@@ -23,20 +23,24 @@
 #
 #
 
-import sys
 import os
 import gi
 
 gi.require_version("Gtk", "3.0")
 gi.require_version("Gdk", "3.0")
-from gi.repository import Gtk, Gio, Gdk, GObject
+from gi.repository import Gtk, Gio, Gdk
 from gi.repository.GdkPixbuf import Pixbuf
 from pywebp.settings import settings
 from pywebp.settings_panel import SettingsPanel
+from pywebp.statusbus import status_bus
 from pywebp.toolbar import Toolbar
 from pywebp.iconview import IconView
 from pywebp.iconstore import IconStore
-from webptools import cwebp, dwebp
+from pywebp.backends import get_backend
+from pywebp.converter import ConversionJob, Converter, partial_path
+from pywebp.journal import BatchJournal
+from pywebp.tuning import QualityTuner
+from pywebp.variants import VariantGenerator
 
 LOGO_PATH = os.path.join(os.path.dirname(__file__), 'images/webp-logo.svg')
 
@@ -57,6 +61,8 @@ class PyWebP(Gtk.Application):
         self.toolbar = None
         self.statusbar = None
         self.popover = None
+        self.converter = None
+        self.journal = None
 
     def do_activate(self):
         """Activate method required
@@ -64,14 +70,58 @@ class PyWebP(Gtk.Application):
         self._init_widgets()
         self._create_window_structure()
         self._init_style(settings.get_boolean("darkmode"))
+        settings.connect("changed", self._on_setting_changed)
         self.add_window(self.window)
         self.window.show_all()
+        self._offer_resume()
 
     def do_shutdown(self):
         """Callback when app is closed
+
+        Background work is stopped and the settings are saved. A conversion still running is left in the journal,
+        to be resumed at the next launch.
         """
+        # widgets are created by do_activate, which is not called if the application did not start
+        if getattr(self, "toolbar", None) is not None:
+            self.toolbar.shutdown()
+        if getattr(self, "iconview", None) is not None:
+            self.iconview.cancel_imports()
+        if getattr(self, "journal", None) is not None:
+            self.journal.close()
+        settings.flush()
         Gtk.Application.do_shutdown(self)
-        sys.exit()
+
+    def _offer_resume(self):
+        """Ask to resume the conversion interrupted by the last close or crash, if any
+        """
+        state = self.journal.unfinished()
+        if state is None:
+            return
+        total, entries = state
+        entries = [entry for entry in entries if os.path.isfile(entry[0])]
+        if len(entries) == 0:
+            self.journal.discard()
+            return
+
+        dialog = Gtk.MessageDialog(transient_for=self.window, modal=True, message_type=Gtk.MessageType.QUESTION,
+                                   buttons=Gtk.ButtonsType.YES_NO, text="Resume the interrupted conversion?")
+        dialog.format_secondary_text("%d of %d files are still to convert." % (len(entries), total))
+        response = dialog.run()
+        dialog.destroy()
+        if response != Gtk.ResponseType.YES:
+            self.journal.discard()
+            return
+
+        jobs = []
+        for src, dst, to_webp, options in entries:
+            # outputs interrupted while written
+            try:
+                os.remove(partial_path(dst))
+            except OSError:
+                pass
+            jobs.append(ConversionJob(src, dst, to_webp, options))
+        self.iconview.add_many([job.src for job in jobs])
+        self.toolbar.start_conversion(jobs)
 
     def _init_widgets(self):
         """Initialize widgets
@@ -81,6 +131,11 @@ class PyWebP(Gtk.Application):
         self.iconview = IconView(self)
         self.toolbar = Toolbar(self)
         self.statusbar = Gtk.Statusbar()
+        self.progressbar = Gtk.ProgressBar()
+        self.converter = Converter()
+        # converter settings changed while a batch runs, applied before the next one
+        self._pending_settings = set()
+        self.journal = BatchJournal()
 
     def _create_window_structure(self):
         """Generate the Gui structure
@@ -101,6 +156,25 @@ class PyWebP(Gtk.Application):
         self.init_popover(settings_btn, SettingsPanel(self))
         self.header_bar.pack_end(settings_btn)
 
+        sort_desc_btn = Gtk.ToggleButton()
+        sort_desc_btn.set_image(Gtk.Image.new_from_icon_name('view-sort-descending-symbolic', Gtk.IconSize.BUTTON))
+        sort_desc_btn.set_tooltip_text("Descending order")
+        self.header_bar.pack_end(sort_desc_btn)
+        sort_combo = Gtk.ComboBoxText()
+        for key, label in (("name", "Name"), ("size", "Size"), ("width", "Width"), ("height", "Height"),
+                           ("mtime", "Date")):
+            sort_combo.append(key, label)
+        sort_combo.set_tooltip_text("Sort by")
+        sort_combo.connect("changed", self.on_sort_changed, sort_desc_btn)
+        sort_desc_btn.connect("toggled", lambda button: self.on_sort_changed(sort_combo, button))
+        self.header_bar.pack_end(sort_combo)
+
+        filter_entry = Gtk.SearchEntry()
+        filter_entry.set_placeholder_text("> 5 MB, >= 1920x1080, name")
+        filter_entry.set_tooltip_text("Filter by size, dimensions or name")
+        filter_entry.connect("search-changed", self.on_filter_changed)
+        self.header_bar.pack_end(filter_entry)
+
         self.window.set_titlebar(self.header_bar)
 
         scroll_win = Gtk.ScrolledWindow()
@@ -113,6 +187,11 @@ class PyWebP(Gtk.Application):
         self.statusbar.set_margin_right(0)
         self.statusbar.set_margin_bottom(0)
         self.statusbar.set_vexpand(False)
+        self.progressbar.set_show_text(True)
+        self.progressbar.set_valign(Gtk.Align.CENTER)
+        self.progressbar.set_no_show_all(True)
+        self.statusbar.pack_end(self.progressbar, True, True, 0)
+        status_bus.attach(self.statusbar, self.progressbar)
 
         """
         v_box = Gtk.VBox()
@@ -180,6 +259,63 @@ class PyWebP(Gtk.Application):
             prefs_css.remove_class('dark')
         print('app.toggle_darkmode done')
 
+    def on_filter_changed(self, entry):
+        """Show only the thumbnails matching the filter expression
+
+        Args:
+            entry: the filter Gtk.SearchEntry
+        """
+        context_id = self.statusbar.get_context_id("filter")
+        try:
+            shown = self.iconview.set_filter(entry.get_text())
+        except ValueError as error:
+            entry.get_style_context().add_class("error")
+            self.push_status_message("Invalid filter: %s" % error, context_id, 4)
+            return
+        entry.get_style_context().remove_class("error")
+        if entry.get_text().strip():
+            self.push_status_message("%d files shown" % shown, context_id, 4)
+
+    def on_sort_changed(self, combo, desc_btn):
+        """Sort the thumbnails by the chosen key
+
+        Args:
+            combo: the sort Gtk.ComboBoxText
+            desc_btn: the Gtk.ToggleButton choosing the descending order
+        """
+        key = combo.get_active_id()
+        if key is not None:
+            self.iconview.sort_rows(key, desc_btn.get_active())
+
+    def _on_setting_changed(self, storage, key):
+        """React to a changed setting
+
+        Args:
+            storage: the SettingStorage emitting the signal
+            key: name of the changed setting
+        """
+        if key == "darkmode":
+            self.toggle_darkmode(storage.get_boolean(key))
+        elif key in ("backend", "target_size_kb", "min_ssim_permille", "variants_enabled", "variant_widths"):
+            self._pending_settings.add(key)
+            self.apply_converter_settings()
+
+    def apply_converter_settings(self):
+        """Rebuild the backend, tuner and variant generator of the converter after their settings changed
+
+        The running batch keeps the ones it started with: changes are deferred until no batch is running.
+        """
+        if not self._pending_settings or self.converter.is_running():
+            return
+        keys = self._pending_settings
+        self._pending_settings = set()
+        if "backend" in keys:
+            self.converter.backend = get_backend()
+        if keys & {"backend", "target_size_kb", "min_ssim_permille"}:
+            self.converter.tuner = QualityTuner.from_settings(self.converter.backend, self.converter.cache)
+        if keys & {"backend", "variants_enabled", "variant_widths"}:
+            self.converter.variants = VariantGenerator.from_settings(self.converter.backend)
+
     def on_about(self, button):
         """Create and display an about us dialog window
 
@@ -277,11 +413,13 @@ SOFTWARE.
     def push_status_message(self, message, context_id, timeout=5):
         """Show message in status bar for a some seconds
 
+        Messages go through the StatusBus, so they can be posted from any thread and a burst of messages of the
+        same context only shows the last one.
+
         Args:
             message: text message to show in statusbar
             context_id: context id of the message
             timeout: timeout of the message in seconds. Default is 5
         """
-        self.statusbar.push(context_id, '>>  ' + message)
-        GObject.timeout_add(timeout * 1000, self.statusbar.pop, context_id)
+        status_bus.post_message(message, context_id, timeout)
 
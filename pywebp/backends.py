@@ -0,0 +1,373 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import os
+import ctypes
+import ctypes.util
+import re
+import shlex
+import shutil
+import subprocess
+import sys
+import time
+import gi
+
+gi.require_version("GdkPixbuf", "2.0")
+from gi.repository import GLib, GdkPixbuf
+from pywebp.settings import settings
+
+try:
+    from webptools.webpbin import getcwebp, getdwebp
+except ImportError:
+    getcwebp = getdwebp = None
+
+
+class ConversionError(Exception):
+    """Raised by an EncoderBackend when an image can not be converted."""
+
+
+# timings printed by cwebp/dwebp -v, read input and decode picture are counted as decode time
+TIMING_PATTERN = re.compile(r"^Time to (read input|decode picture|encode picture|write output): ([0-9.]+)\s*s",
+                            re.MULTILINE)
+DECODE_STEPS = ("read input", "decode picture")
+
+
+class EncoderBackend:
+    """Interface of the encoders used by the Converter.
+
+    Attributes:
+        name: name of the backend, as stored in the "backend" setting
+    """
+
+    name = None
+
+    @staticmethod
+    def is_available() -> bool:
+        """Check if the backend can be used on this system
+
+        Returns:
+            True if the backend is usable, False otherwise
+        """
+        return True
+
+    def check_options(self, options):
+        """Validate command line options before a conversion starts
+
+        Args:
+            options: cwebp or dwebp command line options
+
+        Returns:
+            the options split in a list of arguments
+
+        Raises:
+            ConversionError: if the options can not be used by the backend
+        """
+        try:
+            return shlex.split(options)
+        except ValueError as error:
+            raise ConversionError("invalid options %r: %s" % (options, error))
+
+    def encode(self, src, dst, options="", control=None):
+        """Convert an image to webp
+
+        Args:
+            src: full path of the input image
+            dst: full path of the webp output image
+            options: cwebp command line options
+            control: the BatchControl of the batch running the conversion, None if not controlled
+
+        Returns:
+            a dict with the seconds spent decoding the input ("decode") and encoding the output ("encode"),
+            empty if the backend can not measure them
+
+        Raises:
+            ConversionError: if the image can not be converted
+        """
+        raise NotImplementedError
+
+    def decode(self, src, dst, options="", control=None):
+        """Convert a webp image to png
+
+        Args:
+            src: full path of the webp input image
+            dst: full path of the png output image
+            options: dwebp command line options
+            control: the BatchControl of the batch running the conversion, None if not controlled
+
+        Returns:
+            a dict with the seconds spent decoding the input ("decode") and encoding the output ("encode"),
+            empty if the backend can not measure them
+
+        Raises:
+            ConversionError: if the image can not be converted
+        """
+        raise NotImplementedError
+
+
+class WebptoolsBackend(EncoderBackend):
+    """Run the cwebp/dwebp executables shipped with webptools, one process per image.
+
+    The executables found in PATH are used if webptools does not ship them for this platform.
+    """
+
+    name = "webptools"
+
+    @staticmethod
+    def _binary(name):
+        """Find an executable of the libwebp tools
+
+        Args:
+            name: "cwebp" or "dwebp"
+
+        Returns:
+            full path of the executable, or None if not found
+        """
+        getter = getcwebp if name == "cwebp" else getdwebp
+        path = getter(bin_path=None) if getter is not None else None
+        if path is None or not os.access(path, os.X_OK):
+            path = shutil.which(name)
+        return path
+
+    @staticmethod
+    def is_available() -> bool:
+        return WebptoolsBackend._binary("cwebp") is not None
+
+    def encode(self, src, dst, options="", control=None):
+        return self._run(["cwebp", "-v"] + self.check_options(options) + [src, "-o", dst], control)
+
+    def decode(self, src, dst, options="", control=None):
+        return self._run(["dwebp", "-v", src] + self.check_options(options) + ["-o", dst], control)
+
+    def _run(self, args, control=None):
+        """Run a libwebp tool and wait for it to end
+
+        Args:
+            args: command line, the first item is the executable name
+            control: the BatchControl tracking the process, None to run it untracked
+
+        Returns:
+            a dict with the decode and encode seconds printed by the tool
+
+        Raises:
+            ConversionError: if the executable is missing or returns a non-zero exit code
+            BatchCancelled: if the batch is cancelled
+        """
+        binary = self._binary(args[0])
+        if binary is None:
+            raise ConversionError("%s executable not found" % args[0])
+        try:
+            if control is not None:
+                # tracked, to be suspended or terminated with the batch
+                process = control.run([binary] + args[1:])
+            else:
+                process = subprocess.run([binary] + args[1:], stdin=subprocess.DEVNULL,
+                                         stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except OSError as error:
+            raise ConversionError(str(error))
+        output = process.stderr.decode(errors="replace")
+        if process.returncode != 0:
+            raise ConversionError(TIMING_PATTERN.sub("", output).strip())
+        timings = {}
+        for step, seconds in TIMING_PATTERN.findall(output):
+            key = "decode" if step in DECODE_STEPS else "encode"
+            timings[key] = timings.get(key, 0) + float(seconds)
+        return timings
+
+
+class LibwebpBackend(EncoderBackend):
+    """Encode and decode in-process, calling libwebp through ctypes.
+
+    Images are read and written with GdkPixbuf. Both ctypes foreign calls and PyGObject calls release the GIL,
+    so the Converter workers run in parallel without forking a process for every image.
+    Only the "-q" and "-lossless" options are supported, other cwebp/dwebp options are ignored.
+    In-process calls can not be suspended or terminated, the BatchControl is only honoured between images.
+    """
+
+    name = "libwebp"
+    _lib = None
+    _free = None
+
+    @classmethod
+    def _load(cls):
+        """Load libwebp shared library and declare the prototypes of the simple encoding/decoding API
+
+        Returns:
+            the ctypes library, or None if libwebp is not installed
+        """
+        if cls._lib is None:
+            path = ctypes.util.find_library("webp")
+            if path is None:
+                return None
+            lib = ctypes.CDLL(path)
+            out_ptr = ctypes.POINTER(ctypes.POINTER(ctypes.c_uint8))
+            for func in (lib.WebPEncodeRGB, lib.WebPEncodeRGBA):
+                func.argtypes = [ctypes.c_char_p, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_float, out_ptr]
+                func.restype = ctypes.c_size_t
+            for func in (lib.WebPEncodeLosslessRGB, lib.WebPEncodeLosslessRGBA):
+                func.argtypes = [ctypes.c_char_p, ctypes.c_int, ctypes.c_int, ctypes.c_int, out_ptr]
+                func.restype = ctypes.c_size_t
+            lib.WebPDecodeRGBA.argtypes = [ctypes.c_char_p, ctypes.c_size_t,
+                                           ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_int)]
+            lib.WebPDecodeRGBA.restype = ctypes.POINTER(ctypes.c_uint8)
+            # WebPFree is exported since libwebp 1.0, older versions allocate with malloc
+            free = getattr(lib, "WebPFree", None) or ctypes.CDLL(ctypes.util.find_library("c")).free
+            free.argtypes = [ctypes.c_void_p]
+            free.restype = None
+            cls._free = free
+            cls._lib = lib
+        return cls._lib
+
+    @staticmethod
+    def is_available() -> bool:
+        return LibwebpBackend._load() is not None
+
+    def check_options(self, options):
+        self._parse_options(options)
+        return super().check_options(options)
+
+    def _parse_options(self, options):
+        """Read quality and lossless flag from cwebp command line options
+
+        Args:
+            options: cwebp command line options
+
+        Returns:
+            a (quality, lossless) tuple
+
+        Raises:
+            ConversionError: if the quality is not a number between 0 and 100
+        """
+        quality = 75.0
+        lossless = False
+        args = super().check_options(options)
+        for index, arg in enumerate(args):
+            if arg == "-q" and index + 1 < len(args):
+                try:
+                    quality = float(args[index + 1])
+                except ValueError:
+                    raise ConversionError("invalid quality %r" % args[index + 1])
+                if not 0 <= quality <= 100:
+                    raise ConversionError("quality %s is out of the 0-100 range" % args[index + 1])
+            elif arg == "-lossless":
+                lossless = True
+        return quality, lossless
+
+    def encode(self, src, dst, options="", control=None):
+        lib = self._load()
+        if lib is None:
+            raise ConversionError("libwebp shared library not found")
+        start = time.perf_counter()
+        try:
+            pixbuf = GdkPixbuf.Pixbuf.new_from_file(src)
+        except GLib.Error as error:
+            raise ConversionError(error.message)
+        decoded = time.perf_counter()
+        self.encode_pixbuf(pixbuf, dst, options)
+        return {"decode": decoded - start, "encode": time.perf_counter() - decoded}
+
+    def encode_pixbuf(self, pixbuf, dst, options=""):
+        """Encode an already decoded image to webp
+
+        Args:
+            pixbuf: the GdkPixbuf.Pixbuf to encode
+            dst: full path of the webp output image
+            options: cwebp command line options
+
+        Raises:
+            ConversionError: if the image can not be encoded
+        """
+        lib = self._load()
+        quality, lossless = self._parse_options(options)
+        alpha = pixbuf.get_has_alpha()
+        pixels = pixbuf.get_pixels()
+        output = ctypes.POINTER(ctypes.c_uint8)()
+        args = [pixels, pixbuf.get_width(), pixbuf.get_height(), pixbuf.get_rowstride()]
+        if lossless:
+            func = lib.WebPEncodeLosslessRGBA if alpha else lib.WebPEncodeLosslessRGB
+        else:
+            func = lib.WebPEncodeRGBA if alpha else lib.WebPEncodeRGB
+            args.append(quality)
+        size = func(*args, ctypes.byref(output))
+        if size == 0:
+            raise ConversionError("libwebp failed to encode %s" % dst)
+        try:
+            with open(dst, "wb") as out_file:
+                out_file.write(ctypes.string_at(output, size))
+        except OSError as error:
+            raise ConversionError(str(error))
+        finally:
+            self._free(output)
+
+    def decode(self, src, dst, options="", control=None):
+        lib = self._load()
+        if lib is None:
+            raise ConversionError("libwebp shared library not found")
+        try:
+            with open(src, "rb") as in_file:
+                data = in_file.read()
+        except OSError as error:
+            raise ConversionError(str(error))
+        start = time.perf_counter()
+        width = ctypes.c_int()
+        height = ctypes.c_int()
+        output = lib.WebPDecodeRGBA(data, len(data), ctypes.byref(width), ctypes.byref(height))
+        if not output:
+            raise ConversionError("libwebp failed to decode %s" % src)
+        try:
+            rgba = ctypes.string_at(output, width.value * height.value * 4)
+        finally:
+            self._free(output)
+        pixbuf = GdkPixbuf.Pixbuf.new_from_bytes(GLib.Bytes.new(rgba), GdkPixbuf.Colorspace.RGB, True, 8,
+                                                 width.value, height.value, width.value * 4)
+        decoded = time.perf_counter()
+        try:
+            pixbuf.savev(dst, "png", [], [])
+        except GLib.Error as error:
+            raise ConversionError(error.message)
+        return {"decode": decoded - start, "encode": time.perf_counter() - decoded}
+
+
+BACKENDS = {
+    WebptoolsBackend.name: WebptoolsBackend,
+    LibwebpBackend.name: LibwebpBackend,
+}
+
+
+def get_backend(name=None) -> EncoderBackend:
+    """Create the encoder backend chosen in settings
+
+    Args:
+        name: name of the backend. Default is the "backend" setting
+
+    Returns:
+        an EncoderBackend instance, the webptools one if the requested backend is unknown or not available
+    """
+    if name is None:
+        name = settings.get_string("backend")
+    backend = BACKENDS.get(name, WebptoolsBackend)
+    if backend is not WebptoolsBackend and not backend.is_available():
+        print("Encoder backend %s not available, using %s" % (name, WebptoolsBackend.name), file=sys.stderr)
+        backend = WebptoolsBackend
+    return backend()
@@ -0,0 +1,301 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import os
+import hashlib
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+
+from pywebp.settings import DATA_DIR, settings
+
+CACHE_DIR = os.path.join(DATA_DIR, 'cache')
+CACHE_DB = 'cache.db'
+# size of the blocks read when hashing an input file
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_digest(path) -> str:
+    """Hash the content of a file
+
+    Args:
+        path: full path of the file
+
+    Returns:
+        the hex sha256 digest of the file bytes
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as in_file:
+        block = in_file.read(HASH_BLOCK_SIZE)
+        while block:
+            digest.update(block)
+            block = in_file.read(HASH_BLOCK_SIZE)
+    return digest.hexdigest()
+
+
+class ConversionCache:
+    """Content-addressed cache of converted images, stored under DATA_DIR.
+
+    Each entry is keyed by the hash of the input bytes plus the backend, direction and options of the conversion,
+    so a hit can be copied to the output path without encoding again.
+    An sqlite index keeps entry sizes and last access time, used to evict the least recently used entries when
+    the cache grows over its size cap, and remembers the digest of each input file by size and mtime, so that
+    unchanged files are not read again. The quality found by the QualityTuner for each input and goal is kept
+    too, so the search is not run again.
+
+    Attributes:
+        path: folder of the cache
+        max_bytes: maximum size of the cached outputs
+    """
+
+    def __init__(self, path=CACHE_DIR, max_bytes=None):
+        self.path = path
+        if max_bytes is None:
+            max_bytes = settings.get_integer("cache_size_mb") * 1024 * 1024
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(self.path, 'objects'), exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(self.path, CACHE_DB), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS entries "
+                         "(key TEXT PRIMARY KEY, size INTEGER NOT NULL, last_used REAL NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS digests "
+                         "(path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, "
+                         "digest TEXT NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS tuning "
+                         "(digest TEXT NOT NULL, goal TEXT NOT NULL, quality INTEGER NOT NULL, "
+                         "PRIMARY KEY (digest, goal))")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self._db.commit()
+        self._size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _object_path(self, key) -> str:
+        """Path of the cached output of an entry
+
+        Args:
+            key: the entry key
+
+        Returns:
+            full path of the cached file
+        """
+        return os.path.join(self.path, 'objects', key[:2], key)
+
+    def input_digest(self, path) -> str:
+        """Hash of an input file, read from the index if the file size and mtime did not change
+
+        Args:
+            path: full path of the input file
+
+        Returns:
+            the hex digest of the file bytes
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._lock:
+            row = self._db.execute("SELECT size, mtime_ns, digest FROM digests WHERE path = ?", (path,)).fetchone()
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return row[2]
+        digest = file_digest(path)
+        self._write("INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?)",
+                    (path, stat.st_size, stat.st_mtime_ns, digest))
+        return digest
+
+    def make_key(self, job, backend_name) -> str:
+        """Build the cache key of a conversion
+
+        Args:
+            job: the ConversionJob
+            backend_name: name of the encoder backend doing the conversion
+
+        Returns:
+            the hex digest of input bytes plus the exact encoder arguments
+        """
+        key = hashlib.sha256()
+        key.update(self.input_digest(job.src).encode())
+        for value in (backend_name, "cwebp" if job.to_webp else "dwebp", job.options):
+            key.update(b"\0" + value.encode())
+        return key.hexdigest()
+
+    def tuned_quality(self, digest, goal):
+        """Quality found by a previous search for an input
+
+        Args:
+            digest: hex digest of the input bytes
+            goal: description of the search goal and options
+
+        Returns:
+            the cwebp quality, None if the search was never run
+        """
+        with self._lock:
+            row = self._db.execute("SELECT quality FROM tuning WHERE digest = ? AND goal = ?",
+                                   (digest, goal)).fetchone()
+        return row[0] if row is not None else None
+
+    def store_tuned_quality(self, digest, goal, quality):
+        """Remember the quality found by a search
+
+        Args:
+            digest: hex digest of the input bytes
+            goal: description of the search goal and options
+            quality: the cwebp quality
+        """
+        self._write("INSERT OR REPLACE INTO tuning VALUES (?, ?, ?)", (digest, goal, quality))
+
+    def fetch(self, key, dst) -> bool:
+        """Write the cached output of an entry to dst
+
+        Args:
+            key: the entry key
+            dst: full path of the output file
+
+        Returns:
+            True on cache hit, False otherwise
+        """
+        with self._lock:
+            row = self._db.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return False
+        self._write("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        try:
+            shutil.copyfile(self._object_path(key), dst)
+        except FileNotFoundError:
+            # object removed behind our back, forget the entry
+            self._forget(key)
+            return False
+        return True
+
+    def store(self, key, output) -> bool:
+        """Add a converted file to the cache, evicting the least recently used entries if needed
+
+        The cache is best effort: an entry that can not be written, for example on a full or read-only disk, is
+        reported on stderr and skipped, the conversion itself succeeded.
+
+        Args:
+            key: the entry key
+            output: full path of the converted file
+
+        Returns:
+            True if the entry is stored, False otherwise
+        """
+        object_path = self._object_path(key)
+        tmp_path = object_path + ".tmp%d" % threading.get_ident()
+        try:
+            size = os.path.getsize(output)
+            if size > self.max_bytes:
+                return False
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            shutil.copyfile(output, tmp_path)
+            os.replace(tmp_path, object_path)
+            with self._lock:
+                size_before = self._size
+                try:
+                    row = self._db.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+                    self._db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)", (key, size, time.time()))
+                    self._size += size - (row[0] if row is not None else 0)
+                    self._evict()
+                    self._db.commit()
+                except sqlite3.Error:
+                    # evicted objects whose entries come back are forgotten by fetch
+                    self._db.rollback()
+                    self._size = size_before
+                    raise
+        except (OSError, sqlite3.Error) as error:
+            print("Unable to cache %s: %s" % (output, error), file=sys.stderr)
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
+        return True
+
+    def _evict(self):
+        """Remove the least recently used entries until the cache fits max_bytes. Must hold the lock.
+        """
+        while self._size > self.max_bytes:
+            rows = self._db.execute("SELECT key, size FROM entries ORDER BY last_used LIMIT 64").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._size -= size
+                try:
+                    os.remove(self._object_path(key))
+                except FileNotFoundError:
+                    pass
+                if self._size <= self.max_bytes:
+                    break
+
+    def _write(self, sql, parameters):
+        """Run a statement updating the index and commit it, reporting a failure on stderr instead of raising
+
+        Args:
+            sql: the SQL statement
+            parameters: values of its placeholders
+        """
+        with self._lock:
+            try:
+                self._db.execute(sql, parameters)
+                self._db.commit()
+            except sqlite3.Error as error:
+                self._db.rollback()
+                print("Unable to update the conversion cache: %s" % error, file=sys.stderr)
+
+    def _forget(self, key):
+        """Remove an entry from the index
+
+        Args:
+            key: the entry key
+        """
+        with self._lock:
+            row = self._db.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._db.commit()
+                self._size -= row[0]
+
+    def info(self) -> dict:
+        """Describe the cache content
+
+        Returns:
+            a dict with path, number of entries, size and maximum size in bytes
+        """
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {"path": self.path, "entries": entries, "size": self._size, "max_size": self.max_bytes}
+
+    def clear(self):
+        """Remove all the cached outputs, the remembered input digests and tuned qualities
+        """
+        with self._lock:
+            self._db.execute("DELETE FROM entries")
+            self._db.execute("DELETE FROM digests")
+            self._db.execute("DELETE FROM tuning")
+            self._db.commit()
+            self._size = 0
+            shutil.rmtree(os.path.join(self.path, 'objects'), ignore_errors=True)
+            os.makedirs(os.path.join(self.path, 'objects'), exist_ok=True)
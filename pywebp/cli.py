@@ -0,0 +1,374 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+
+from gi.repository import GLib
+from pywebp.backends import BACKENDS, get_backend
+from pywebp.cache import ConversionCache
+from pywebp.control import BatchControl
+from pywebp.converter import ConversionQueue, Converter, find_input_files
+from pywebp.report import BatchReport
+from pywebp.rowfilter import parse_size
+from pywebp.settings import settings
+from pywebp.tuning import QualityTuner
+from pywebp.variants import VariantGenerator, write_manifests
+from pywebp.watcher import SETTLE_INTERVAL, DirectoryWatcher
+
+# exit codes of the headless mode
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+
+COMMANDS = ("convert", "watch", "cache")
+
+
+def is_headless(args) -> bool:
+    """Check if the command line asks for the headless mode
+
+    Args:
+        args: command line arguments, without the program name
+
+    Returns:
+        True if the first argument is a headless command, False to start the Gtk application
+    """
+    return len(args) > 0 and args[0] in COMMANDS
+
+
+def emit(event, **fields):
+    """Print a progress event as a single JSON line on stdout
+
+    Args:
+        event: name of the event
+        fields: values of the event
+    """
+    fields["event"] = event
+    sys.stdout.write(json.dumps(fields) + "\n")
+    sys.stdout.flush()
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    """Create the command line parser of the headless mode
+
+    Returns:
+        the argument parser
+    """
+    parser = argparse.ArgumentParser(prog="pywebp", description="Convert images to/from WebP without a display. "
+                                                                "Progress is printed as JSON lines on stdout.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    convert = commands.add_parser("convert", help="convert files, glob patterns or directories")
+    convert.add_argument("sources", nargs="+", help="files, glob patterns or directories to convert")
+    convert.add_argument("-r", "--recursive", action="store_true", help="walk directories and ** patterns recursively")
+    _add_conversion_arguments(convert)
+
+    watch = commands.add_parser("watch", help="convert the new images of directories as they are written")
+    watch.add_argument("folders", nargs="+", help="directories to watch")
+    watch.add_argument("-r", "--recursive", action="store_true", help="watch the sub-directories too")
+    watch.add_argument("--settle", type=int, default=SETTLE_INTERVAL, metavar="MS",
+                       help="milliseconds the size of a new file must stay the same before converting it, when "
+                            "the writer does not signal the end of the writes (default %(default)s)")
+    _add_conversion_arguments(watch)
+
+    cache = commands.add_parser("cache", help="inspect or clear the conversion cache")
+    cache.add_argument("--clear", action="store_true", help="remove every cached conversion")
+    return parser
+
+
+def _add_conversion_arguments(parser):
+    """Add the arguments shared by the commands converting images
+
+    Args:
+        parser: the parser of the command
+    """
+    direction = parser.add_mutually_exclusive_group()
+    direction.add_argument("--to-webp", dest="to_webp", action="store_true", default=None,
+                           help="convert images to webp (default from settings)")
+    direction.add_argument("--from-webp", dest="to_webp", action="store_false",
+                           help="convert webp images to png")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="number of parallel conversions (default from settings, one per cpu core)")
+    parser.add_argument("-o", "--output-dir", default=None,
+                        help="folder of the output images (default next to each input image)")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=None,
+                        help="encoder backend (default from settings)")
+    parser.add_argument("--options", default=None,
+                        help="cwebp/dwebp command line options (default from settings)")
+    parser.add_argument("--no-cache", dest="use_cache", action="store_false",
+                        help="always convert, without reading or filling the conversion cache")
+    goal = parser.add_mutually_exclusive_group()
+    goal.add_argument("--target-size", type=parse_size, default=None, metavar="SIZE",
+                      help="search the highest quality of each image with an output up to SIZE, like 50K")
+    goal.add_argument("--min-ssim", type=float, default=None, metavar="SSIM",
+                      help="search the lowest quality of each image reaching SSIM, like 0.95 (needs numpy)")
+    goal.add_argument("--min-psnr", type=float, default=None, metavar="DB",
+                      help="search the lowest quality of each image reaching a PSNR of DB (needs numpy)")
+    parser.add_argument("--widths", type=_parse_widths, default=None, metavar="W,W,...",
+                        help="also write each webp output at these widths, like 320,640,1280,2560")
+    parser.add_argument("--manifest", default=None, metavar="FILE",
+                        help="JSON manifest of the variants (default variants.json in each output folder)")
+    parser.add_argument("--report", default=None, metavar="FILE",
+                        help="export the metrics of every job when the command ends, as JSON if FILE ends with "
+                             ".json, as CSV otherwise")
+
+
+def _parse_widths(value) -> [int]:
+    """Parse the --widths argument
+
+    Args:
+        value: comma separated widths in pixels
+
+    Returns:
+        the list of widths
+
+    Raises:
+        argparse.ArgumentTypeError: if a width is not a positive integer
+    """
+    try:
+        widths = [int(width) for width in value.split(",") if width.strip()]
+    except ValueError:
+        widths = []
+    if len(widths) == 0 or min(widths) < 1:
+        raise argparse.ArgumentTypeError("invalid widths: %r" % value)
+    return widths
+
+
+def _make_converter(args):
+    """Create the Converter and resolve the conversion direction of a command
+
+    Args:
+        args: parsed command line arguments
+
+    Returns:
+        (the Converter, True if converting to webp), or None if the arguments are invalid
+    """
+    if args.workers is not None and args.workers < 1:
+        emit("error", message="the number of workers must be at least 1")
+        return None
+
+    converter = Converter(args.workers, get_backend(args.backend))
+    if not args.use_cache:
+        converter.cache = None
+    try:
+        if args.target_size is not None:
+            converter.tuner = QualityTuner(converter.backend, target_size=args.target_size, cache=converter.cache)
+        elif args.min_ssim is not None:
+            converter.tuner = QualityTuner(converter.backend, metric="ssim", min_score=args.min_ssim,
+                                           cache=converter.cache)
+        elif args.min_psnr is not None:
+            converter.tuner = QualityTuner(converter.backend, metric="psnr", min_score=args.min_psnr,
+                                           cache=converter.cache)
+        else:
+            converter.tuner = QualityTuner.from_settings(converter.backend, converter.cache)
+    except ValueError as error:
+        emit("error", message=str(error))
+        return None
+    if args.widths is not None:
+        converter.variants = VariantGenerator(converter.backend, args.widths)
+    to_webp = args.to_webp
+    if to_webp is None:
+        to_webp = settings.get_boolean("to_webp")
+    return converter, to_webp
+
+
+def convert(args) -> int:
+    """Run the "convert" command
+
+    Args:
+        args: parsed command line arguments
+
+    Returns:
+        the exit code
+    """
+    created = _make_converter(args)
+    if created is None:
+        return EXIT_USAGE
+    converter, to_webp = created
+    paths = find_input_files(args.sources, to_webp, args.recursive)
+    jobs = converter.make_jobs(paths, to_webp, args.output_dir, args.options)
+    if len(jobs) == 0:
+        emit("error", message="no input files found")
+        return EXIT_USAGE
+
+    lock = threading.Lock()
+    report = BatchReport(len(jobs))
+    completed = [0]
+
+    def _on_job_done(job):
+        with lock:
+            completed[0] += 1
+            emit("job", variants=[v["width"] for v in job.variants], completed=completed[0], total=len(jobs),
+                 **report.add(job))
+
+    # SIGINT and SIGTERM cancel the batch, keeping the finished outputs
+    control = BatchControl()
+    handlers = {signum: signal.signal(signum, lambda signum, frame: control.cancel())
+                for signum in (signal.SIGINT, signal.SIGTERM)}
+    emit("start", total=len(jobs), workers=converter.workers, backend=converter.backend.name, to_webp=to_webp)
+    try:
+        converter.run(jobs, _on_job_done, control=control)
+    finally:
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+    if converter.variants is not None:
+        _write_manifests(jobs, args.manifest)
+    return _end(report, args.report)
+
+
+def _end(report, path):
+    """Report the totals of a command and export its metrics
+
+    Args:
+        report: the BatchReport of the command
+        path: full path of the exported report, None to not export it
+
+    Returns:
+        the exit code
+    """
+    report.finish()
+    summary = report.summary()
+    emit("end", **summary)
+    if path is not None:
+        try:
+            report.write(path)
+        except OSError as error:
+            emit("error", message="can not write the report: %s" % error)
+            return EXIT_FAILED
+        emit("report", path=path)
+    return EXIT_OK if summary["failed"] + summary["cancelled"] == 0 else EXIT_FAILED
+
+
+def _write_manifests(jobs, path):
+    """Write the manifests of the variants of a batch and report them
+
+    Args:
+        jobs: list of ConversionJob of the batch
+        path: full path of the manifest, None for one manifest in each output folder
+    """
+    try:
+        for manifest in write_manifests(jobs, path):
+            emit("manifest", path=manifest)
+    except OSError as error:
+        emit("error", message="can not write the manifest: %s" % error)
+
+
+def watch(args) -> int:
+    """Run the "watch" command, until interrupted with SIGINT or SIGTERM
+
+    Args:
+        args: parsed command line arguments
+
+    Returns:
+        the exit code
+    """
+    created = _make_converter(args)
+    if created is None:
+        return EXIT_USAGE
+    converter, to_webp = created
+    for folder in args.folders:
+        if not os.path.isdir(folder):
+            emit("error", message="%s is not a directory" % folder)
+            return EXIT_USAGE
+
+    lock = threading.Lock()
+    report = BatchReport()
+    completed = [0]
+
+    def _on_job_done(job):
+        with lock:
+            completed[0] += 1
+            emit("job", variants=[v["width"] for v in job.variants], completed=completed[0], **report.add(job))
+
+    def _on_batch_done(batch):
+        if converter.variants is not None:
+            with lock:
+                _write_manifests(batch, args.manifest)
+
+    conversions = ConversionQueue(converter, _on_job_done, _on_batch_done)
+
+    def _on_ready(path):
+        with lock:
+            report.total += 1
+            emit("queued", src=path)
+        conversions.put(converter.make_jobs([path], to_webp, args.output_dir, args.options)[0])
+
+    watcher = DirectoryWatcher(to_webp, _on_ready, args.recursive, args.settle)
+    try:
+        for folder in args.folders:
+            watcher.watch(folder)
+    except GLib.Error as error:
+        emit("error", message=error.message)
+        watcher.stop()
+        return EXIT_FAILED
+
+    loop = GLib.MainLoop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signum, loop.quit)
+    emit("watch", folders=watcher.folders(), workers=converter.workers, backend=converter.backend.name,
+         to_webp=to_webp)
+    loop.run()
+    watcher.stop()
+    conversions.close(wait=True)
+    return _end(report, args.report)
+
+
+def cache(args) -> int:
+    """Run the "cache" command
+
+    Args:
+        args: parsed command line arguments
+
+    Returns:
+        the exit code
+    """
+    conversion_cache = ConversionCache()
+    if args.clear:
+        conversion_cache.clear()
+    emit("cache", **conversion_cache.info())
+    return EXIT_OK
+
+
+def main(args=None) -> int:
+    """Entry point of the headless mode
+
+    Args:
+        args: command line arguments, without the program name. Default is sys.argv[1:]
+
+    Returns:
+        the exit code
+    """
+    args = _build_parser().parse_args(args)
+    if args.command == "convert":
+        return convert(args)
+    if args.command == "watch":
+        return watch(args)
+    if args.command == "cache":
+        return cache(args)
+    return EXIT_USAGE
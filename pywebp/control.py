@@ -0,0 +1,193 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import signal
+import subprocess
+import threading
+
+
+class BatchCancelled(Exception):
+    """A process was not started because the batch is cancelled
+    """
+    pass
+
+
+class BatchControl:
+    """Pause, resume and cancel a conversion batch from another thread.
+
+    Every method returns at once, so the Gtk main loop can call them. Pausing holds the jobs not started yet and
+    suspends the encoder processes running for the batch with SIGSTOP, resuming continues them with SIGCONT.
+    Cancelling terminates the running processes, and the jobs not finished end CANCELLED with their partial output
+    removed. In-process encoders, like the libwebp backend, can not be suspended: their running job ends first.
+
+    Attributes:
+        jobs: list of ConversionJob of the batch
+    """
+
+    RUNNING = "running"
+    PAUSED = "paused"
+    CANCELLED = "cancelled"
+
+    def __init__(self):
+        self.jobs = []
+        self._state = BatchControl.RUNNING
+        self._condition = threading.Condition()
+        self._processes = set()
+
+    @property
+    def state(self) -> str:
+        """One of RUNNING, PAUSED or CANCELLED
+        """
+        return self._state
+
+    @property
+    def cancelled(self) -> bool:
+        return self._state == BatchControl.CANCELLED
+
+    def pause(self) -> bool:
+        """Hold the jobs not started and suspend the running processes
+
+        Returns:
+            True if the batch is paused, False if it was not running
+        """
+        with self._condition:
+            if self._state != BatchControl.RUNNING:
+                return False
+            self._state = BatchControl.PAUSED
+            self._signal_all(getattr(signal, "SIGSTOP", None))
+        return True
+
+    def resume(self) -> bool:
+        """Continue a paused batch
+
+        Returns:
+            True if the batch is resumed, False if it was not paused
+        """
+        with self._condition:
+            if self._state != BatchControl.PAUSED:
+                return False
+            self._state = BatchControl.RUNNING
+            self._signal_all(getattr(signal, "SIGCONT", None))
+            self._condition.notify_all()
+        return True
+
+    def cancel(self) -> bool:
+        """Terminate the running processes and skip the jobs not started
+
+        Returns:
+            True if the batch is cancelled, False if it was already
+        """
+        with self._condition:
+            if self._state == BatchControl.CANCELLED:
+                return False
+            paused = self._state == BatchControl.PAUSED
+            self._state = BatchControl.CANCELLED
+            for process in self._processes:
+                try:
+                    process.terminate()
+                except OSError:
+                    pass
+            # a stopped process only handles SIGTERM once continued
+            if paused:
+                self._signal_all(getattr(signal, "SIGCONT", None))
+            self._condition.notify_all()
+        return True
+
+    def wait(self) -> bool:
+        """Block while the batch is paused
+
+        Returns:
+            True to go on, False if the batch is cancelled
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._state != BatchControl.PAUSED)
+            return self._state != BatchControl.CANCELLED
+
+    def run(self, args) -> subprocess.CompletedProcess:
+        """Run a process of the batch and wait for it to end, like subprocess.run with captured output
+
+        The process is suspended at once if the batch is paused.
+
+        Args:
+            args: command line of the process
+
+        Returns:
+            the CompletedProcess
+
+        Raises:
+            BatchCancelled: if the batch is cancelled
+            OSError: if the process can not be started
+        """
+        with self._condition:
+            if self._state == BatchControl.CANCELLED:
+                raise BatchCancelled()
+            process = subprocess.Popen(args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE)
+            self._processes.add(process)
+            if self._state == BatchControl.PAUSED:
+                self._signal(process, getattr(signal, "SIGSTOP", None))
+        try:
+            stdout, stderr = process.communicate()
+        finally:
+            with self._condition:
+                self._processes.discard(process)
+        if self._state == BatchControl.CANCELLED:
+            raise BatchCancelled()
+        return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
+
+    def progress(self) -> dict:
+        """Count the jobs of the batch by status
+
+        Returns:
+            a dict with the number of jobs of each status, and "total"
+        """
+        counts = {"total": len(self.jobs)}
+        for job in list(self.jobs):
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
+
+    def _signal_all(self, signum):
+        """Send a signal to the running processes, called with the condition held
+
+        Args:
+            signum: the signal, None if not supported on this platform
+        """
+        for process in self._processes:
+            self._signal(process, signum)
+
+    @staticmethod
+    def _signal(process, signum):
+        """Send a signal to a process, if it still runs
+
+        Args:
+            process: the subprocess.Popen
+            signum: the signal, None if not supported on this platform
+        """
+        if signum is None or process.poll() is not None:
+            return
+        try:
+            process.send_signal(signum)
+        except OSError:
+            pass
@@ -0,0 +1,569 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import os
+import fnmatch
+import glob
+import queue
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pywebp.backends import ConversionError, get_backend
+from pywebp.cache import ConversionCache, file_digest
+from pywebp.control import BatchCancelled
+from pywebp.dedup import find_duplicates
+from pywebp.probe import ProbeError, probe
+from pywebp.settings import settings
+from pywebp.tuning import QualityTuner, with_quality
+from pywebp.variants import VariantGenerator, variant_path
+
+WEBP_EXT = ".webp"
+# dwebp output format when converting from webp
+DECODED_EXT = ".png"
+# file name patterns of the images accepted as input, also used by the Gtk.FileFilter of the Toolbar
+IMAGE_PATTERNS = ["*.png", "*.jpg", "*.jpeg", "*.gif", "*.tif", "*.tiff", "*.xpm"]
+WEBP_PATTERNS = ["*.webp"]
+# decoded RGBA pixels plus encoder buffers, as a multiple of the RGBA size of an image
+MEMORY_FACTOR = 3
+# suffix of the outputs being written, renamed to the output path when complete
+PARTIAL_EXT = ".part"
+
+
+class ConversionJob:
+    """A single file conversion handled by the Converter.
+
+    Attributes:
+        src: full path of the input image
+        dst: full path of the output image
+        to_webp: True if the image is converted to webp, False if converted from webp
+        options: command line options passed to cwebp/dwebp
+        status: one of PENDING, RUNNING, DONE, FAILED or CANCELLED
+        error: error message if the conversion failed, None otherwise
+        cached: True if the output was copied from the ConversionCache instead of being converted
+        info: ImageInfo of the input read from its header when the job is scheduled, None if unknown
+        duplicate_of: input path of the job whose output was copied because the inputs are identical, None otherwise
+        quality: cwebp quality found by the QualityTuner, None if not tuned
+        variants: list of dict with width, height, path and bytes of the variants written by the VariantGenerator
+        queued_at: time.monotonic() when the job was queued or its batch started, None before
+        wait_time: seconds waited for a worker and for memory before the conversion started
+        decode_time: seconds spent decoding the input, None if unknown or included in encode_time
+        encode_time: seconds spent encoding the output, None if not encoded
+        elapsed: seconds of the whole conversion, quality search included
+        bytes_in: size of the input
+        bytes_out: size of the output, None if not written
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    def __init__(self, src, dst, to_webp, options=""):
+        self.src = src
+        self.dst = dst
+        self.to_webp = to_webp
+        self.options = options
+        self.status = ConversionJob.PENDING
+        self.error = None
+        self.cached = False
+        self.info = None
+        self.duplicate_of = None
+        self.quality = None
+        self.variants = []
+        self.queued_at = None
+        self.wait_time = None
+        self.decode_time = None
+        self.encode_time = None
+        self.elapsed = None
+        self.bytes_in = None
+        self.bytes_out = None
+
+    def __repr__(self):
+        return "ConversionJob(%r -> %r, %s)" % (self.src, self.dst, self.status)
+
+
+def output_path(src, to_webp, output_dir=None) -> str:
+    """Build the output file path of a conversion
+
+    Args:
+        src: full path of the input image
+        to_webp: True if the image is converted to webp, False otherwise
+        output_dir: folder of the output image. Default is the folder of the input image
+
+    Returns:
+        full path of the output image
+    """
+    if output_dir is None:
+        output_dir = os.path.dirname(src)
+    name = os.path.splitext(os.path.basename(src))[0]
+    return os.path.join(output_dir, name + (WEBP_EXT if to_webp else DECODED_EXT))
+
+
+def partial_path(dst) -> str:
+    """Path of an output while it is written, hidden next to the output
+
+    Args:
+        dst: full path of the output image
+
+    Returns:
+        full path of the partial output
+    """
+    return os.path.join(os.path.dirname(dst), "." + os.path.basename(dst) + PARTIAL_EXT)
+
+
+def input_patterns(to_webp) -> [str]:
+    """File name patterns of the images that can be converted
+
+    Args:
+        to_webp: True if the images are converted to webp, False otherwise
+
+    Returns:
+        a list of glob patterns
+    """
+    return IMAGE_PATTERNS if to_webp else WEBP_PATTERNS
+
+
+def is_input_file(path, to_webp) -> bool:
+    """Check if a file name matches the input patterns, ignoring case
+
+    Args:
+        path: file path to check
+        to_webp: True if the images are converted to webp, False otherwise
+
+    Returns:
+        True if the file can be converted, False otherwise
+    """
+    name = os.path.basename(path).lower()
+    return any(fnmatch.fnmatchcase(name, pattern) for pattern in input_patterns(to_webp))
+
+
+def find_input_files(sources, to_webp, recursive=False) -> [str]:
+    """Expand files, glob patterns and directories to the list of images to convert
+
+    Args:
+        sources: list of file paths, glob patterns or directories
+        to_webp: True if the images are converted to webp, False otherwise
+        recursive: if True directories are walked with all their sub-directories
+
+    Returns:
+        sorted list of full paths, without duplicates
+    """
+    found = set()
+    for source in sources:
+        if os.path.isdir(source):
+            for root, dirs, files in os.walk(source):
+                found.update(os.path.join(root, name) for name in files if is_input_file(name, to_webp))
+                if not recursive:
+                    break
+        elif os.path.isfile(source):
+            found.add(source)
+        else:
+            found.update(path for path in glob.glob(source, recursive=recursive)
+                         if os.path.isfile(path) and is_input_file(path, to_webp))
+    return sorted(os.path.abspath(path) for path in found)
+
+
+def default_workers() -> int:
+    """Number of parallel conversions set in settings
+
+    Returns:
+        the "workers" setting, or the number of cpu cores if it is 0 or less
+    """
+    workers = settings.get_integer("workers")
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return workers
+
+
+class Converter:
+    """Run batches of ConversionJob through a bounded pool of workers.
+
+    Jobs are fed to the pool by a dispatcher thread, so no more than `workers` conversions are queued or running
+    at the same time and the caller (usually the GTK main loop) is never blocked. The dispatcher reads the size of
+    each image from its header and holds back big images while the others would exceed the memory budget.
+    Jobs with identical inputs and arguments are converted once and the output is copied to the other jobs.
+    Outputs are written to a partial file renamed when complete, and a BatchJournal can record the progress of a
+    batch so that it can be resumed after a crash.
+    Callbacks are invoked from the worker threads: GUI code must forward them to the main loop with the StatusBus.
+
+    Attributes:
+        workers: maximum number of parallel conversions
+        backend: the EncoderBackend doing the conversions
+        cache: the ConversionCache used to skip unchanged conversions, None to always convert
+        memory_budget: estimated bytes of the images converted at the same time, big images wait for room
+        tuner: the QualityTuner choosing the quality of each image converted to webp, None to use the options
+        variants: the VariantGenerator writing each image converted to webp at several widths, None to not write them
+    """
+
+    def __init__(self, workers=None, backend=None, cache=None):
+        self.workers = workers if workers else default_workers()
+        self.memory_budget = settings.get_integer("convert_memory_mb") * 1024 * 1024
+        self.backend = backend if backend is not None else get_backend()
+        if cache is None and settings.get_boolean("cache_enabled"):
+            cache = ConversionCache()
+        self.cache = cache
+        self.tuner = QualityTuner.from_settings(self.backend, cache)
+        self.variants = VariantGenerator.from_settings(self.backend)
+        self._thread = None
+
+    def make_jobs(self, paths, to_webp=None, output_dir=None, options=None) -> [ConversionJob]:
+        """Create a conversion job for every input file
+
+        Args:
+            paths: full paths of the input images
+            to_webp: True to convert to webp, False from webp. Default is the "to_webp" setting
+            output_dir: folder of the output images. Default is the folder of each input image
+            options: cwebp/dwebp command line options. Default is the "cwebp_options"/"dwebp_options" setting
+
+        Returns:
+            a list of ConversionJob
+        """
+        if to_webp is None:
+            to_webp = settings.get_boolean("to_webp")
+        if options is None:
+            options = settings.get_string("cwebp_options" if to_webp else "dwebp_options")
+        return [ConversionJob(path, output_path(path, to_webp, output_dir), to_webp, options) for path in paths]
+
+    def is_running(self) -> bool:
+        """Check if a batch is in progress
+
+        Returns:
+            True if a batch is running, False otherwise
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, jobs, on_job_done=None, on_finished=None, journal=None, control=None) -> bool:
+        """Start a batch in background and return immediately
+
+        Args:
+            jobs: list of ConversionJob to run
+            on_job_done: callback called with the ConversionJob when it ends
+            on_finished: callback called with the list of jobs when the whole batch ends
+            journal: the BatchJournal recording the progress of the batch, None to not record it
+            control: the BatchControl pausing or cancelling the batch, None if it always runs to the end
+
+        Returns:
+            True if the batch is started, False if another batch is already running
+        """
+        if self.is_running():
+            return False
+        self._thread = threading.Thread(target=self.run, args=(jobs, on_job_done, on_finished, journal, control),
+                                        name="pywebp-converter", daemon=True)
+        self._thread.start()
+        return True
+
+    def run(self, jobs, on_job_done=None, on_finished=None, journal=None, control=None) -> [ConversionJob]:
+        """Run a batch and wait for it to end
+
+        Jobs of a cancelled batch that are not finished end CANCELLED, the journal of a cancelled batch is removed.
+
+        Args:
+            jobs: list of ConversionJob to run
+            on_job_done: callback called with the ConversionJob when it ends
+            on_finished: callback called with the list of jobs when the whole batch ends
+            journal: the BatchJournal recording the progress of the batch, None to not record it
+            control: the BatchControl pausing or cancelling the batch, None if it always runs to the end
+
+        Returns:
+            the list of jobs, with status and error updated
+        """
+        slots = threading.BoundedSemaphore(self.workers)
+        # estimated memory of the running jobs, a job waits until it fits the budget or nothing else runs
+        memory = threading.Condition()
+        in_flight = [0]
+
+        copies = self.find_duplicate_jobs(jobs)
+        if journal is not None:
+            journal.begin(jobs)
+        queued_at = time.monotonic()
+        for job in jobs:
+            if job.queued_at is None:
+                job.queued_at = queued_at
+        if control is not None:
+            control.jobs = jobs
+
+        def _done(job):
+            if journal is not None:
+                journal.job_done(job)
+            if on_job_done is not None:
+                on_job_done(job)
+
+        def _task(job, cost):
+            try:
+                if control is not None and not control.wait():
+                    job.status = ConversionJob.CANCELLED
+                else:
+                    self.convert_job(job, control)
+                _done(job)
+                for copy in copies.get(job, []):
+                    self.copy_job(job, copy)
+                    _done(copy)
+            finally:
+                with memory:
+                    in_flight[0] -= cost
+                    memory.notify_all()
+                slots.release()
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pywebp-worker") as pool:
+            for job in jobs:
+                if job.duplicate_of is not None:
+                    continue
+                if control is not None and not control.wait():
+                    break
+                cost = self.estimate_memory(job)
+                slots.acquire()
+                with memory:
+                    memory.wait_for(lambda: in_flight[0] == 0 or in_flight[0] + cost <= self.memory_budget)
+                    in_flight[0] += cost
+                pool.submit(_task, job, cost)
+
+        if control is not None:
+            # jobs never dispatched
+            for job in jobs:
+                if job.status == ConversionJob.PENDING:
+                    job.status = ConversionJob.CANCELLED
+                    _done(job)
+        if journal is not None:
+            journal.end()
+        if on_finished is not None:
+            on_finished(jobs)
+        return jobs
+
+    def find_duplicate_jobs(self, jobs) -> dict:
+        """Find the jobs converting identical inputs with the same arguments
+
+        The first job of each group is converted, the others get its input path in duplicate_of.
+        Only inputs sharing their size with another input are hashed, jobs of the same input are always grouped.
+
+        Args:
+            jobs: list of ConversionJob
+
+        Returns:
+            a dict of the duplicate jobs by the job converted for them
+        """
+        digest = self.cache.input_digest if self.cache is not None else file_digest
+        by_arguments = {}
+        for job in jobs:
+            by_arguments.setdefault((job.to_webp, job.options), []).append(job)
+        copies = {}
+        for same_arguments in by_arguments.values():
+            by_src = {}
+            for job in same_arguments:
+                by_src.setdefault(job.src, []).append(job)
+            groups = find_duplicates(list(by_src), digest)
+            # jobs of the same input are duplicates too, whatever its content
+            grouped = {src for group in groups for src in group}
+            groups.extend([src] for src, same_src in by_src.items() if len(same_src) > 1 and src not in grouped)
+            for group in groups:
+                group_jobs = [job for src in group for job in by_src[src]]
+                first = group_jobs[0]
+                copies[first] = group_jobs[1:]
+                for job in group_jobs[1:]:
+                    job.duplicate_of = first.src
+        return copies
+
+    @staticmethod
+    def copy_job(job, copy) -> ConversionJob:
+        """Complete a duplicate job with the output of the job converted for it
+
+        Args:
+            job: the converted ConversionJob
+            copy: the ConversionJob with the same input bytes and arguments
+
+        Returns:
+            the copy, with status and error updated
+        """
+        copy.cached = job.cached
+        copy.variants = [dict(variant, path=variant_path(copy.dst, variant["width"])) for variant in job.variants]
+        if job.status != ConversionJob.DONE:
+            copy.status = ConversionJob.CANCELLED if job.status == ConversionJob.CANCELLED else ConversionJob.FAILED
+            copy.error = job.error
+            return copy
+        try:
+            if os.path.abspath(copy.dst) != os.path.abspath(job.dst):
+                for src, dst in [(job.dst, copy.dst)] + [
+                        (variant["path"], variant_path(copy.dst, variant["width"])) for variant in job.variants]:
+                    partial = partial_path(dst)
+                    shutil.copyfile(src, partial)
+                    os.replace(partial, dst)
+        except OSError as error:
+            copy.status = ConversionJob.FAILED
+            copy.error = str(error)
+        else:
+            copy.status = ConversionJob.DONE
+            copy.bytes_in = job.bytes_in
+            copy.bytes_out = job.bytes_out
+        return copy
+
+    @staticmethod
+    def estimate_memory(job) -> int:
+        """Estimate the memory needed to convert an image, reading its size from the file header
+
+        Args:
+            job: the ConversionJob, its info attribute is filled with the image metadata
+
+        Returns:
+            the estimated bytes, 0 if the image header can not be read
+        """
+        try:
+            job.info = probe(job.src, count_frames=False)
+        except (ProbeError, OSError):
+            return 0
+        return job.info.width * job.info.height * 4 * MEMORY_FACTOR
+
+    def convert_job(self, job, control=None) -> ConversionJob:
+        """Convert a single image with the encoder backend
+
+        Args:
+            job: the ConversionJob to run
+            control: the BatchControl of the batch running the job, passed to the backend to track its processes
+
+        Returns:
+            the job, with status and error updated
+        """
+        job.status = ConversionJob.RUNNING
+        start = time.monotonic()
+        if job.queued_at is not None:
+            job.wait_time = start - job.queued_at
+        partial = partial_path(job.dst)
+        # source decoded for the full size output, scaled again for the variants
+        pixbuf = None
+        try:
+            self.backend.check_options(job.options)
+            job.bytes_in = os.path.getsize(job.src)
+            key = None
+            if job.to_webp and self.tuner is not None and job.quality is None:
+                job.quality = self.tuner.tune(job, control)
+                job.options = with_quality(job.options, job.quality)
+            if self.cache is not None:
+                key = self.cache.make_key(job, self.backend.name)
+                job.cached = self.cache.fetch(key, partial)
+            if not job.cached:
+                encode_start = time.perf_counter()
+                if job.to_webp and self.variants is not None and hasattr(self.backend, "encode_pixbuf"):
+                    pixbuf = self.variants.decode(job.src)
+                    decoded = time.perf_counter()
+                    self.backend.encode_pixbuf(pixbuf, partial, job.options)
+                    timings = {"decode": decoded - encode_start, "encode": time.perf_counter() - decoded}
+                elif job.to_webp:
+                    timings = self.backend.encode(job.src, partial, job.options, control)
+                else:
+                    timings = self.backend.decode(job.src, partial, job.options, control)
+                if timings:
+                    job.decode_time = timings.get("decode")
+                    job.encode_time = timings.get("encode")
+                else:
+                    job.encode_time = time.perf_counter() - encode_start
+                if key is not None:
+                    self.cache.store(key, partial)
+            job.bytes_out = os.path.getsize(partial)
+            os.replace(partial, job.dst)
+            if job.to_webp and self.variants is not None:
+                job.variants = self.variants.generate(job, control, pixbuf)
+        except (ConversionError, OSError, BatchCancelled) as error:
+            # a process interrupted by the cancel may fail before noticing it
+            if isinstance(error, BatchCancelled) or (control is not None and control.cancelled):
+                job.status = ConversionJob.CANCELLED
+            else:
+                job.status = ConversionJob.FAILED
+                job.error = str(error)
+            try:
+                os.remove(partial)
+            except OSError:
+                pass
+        except Exception as error:
+            # never leave a job RUNNING, an unexpected error fails this image only
+            job.status = ConversionJob.FAILED
+            job.error = "%s: %s" % (type(error).__name__, error)
+            try:
+                os.remove(partial)
+            except OSError:
+                pass
+        else:
+            job.status = ConversionJob.DONE
+        job.elapsed = time.monotonic() - start
+        return job
+
+
+class ConversionQueue:
+    """Feed jobs arriving over time, like the files of a watched directory, to a Converter.
+
+    A daemon thread waits for jobs and runs each batch with every job queued while the previous batch was running,
+    so a single new file is converted at once and bursts of files use all the workers.
+    Callbacks are invoked from the converter threads.
+    """
+
+    def __init__(self, converter, on_job_done=None, on_batch_done=None):
+        """
+        Args:
+            converter: the Converter running the batches
+            on_job_done: callback called with the ConversionJob when it ends
+            on_batch_done: callback called with the list of jobs of each batch when it ends
+        """
+        self.converter = converter
+        self._on_job_done = on_job_done
+        self._on_batch_done = on_batch_done
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="pywebp-queue", daemon=True)
+        self._thread.start()
+
+    def put(self, job):
+        """Queue a job
+
+        Args:
+            job: the ConversionJob to run
+        """
+        job.queued_at = time.monotonic()
+        self._queue.put(job)
+
+    def close(self, wait=False):
+        """Stop the queue once the queued jobs are converted
+
+        Args:
+            wait: True to wait for the queued jobs
+        """
+        self._queue.put(None)
+        if wait:
+            self._thread.join()
+
+    def _run(self):
+        """Run the queued jobs in batches until the queue is closed
+        """
+        closed = False
+        while not closed:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                closed = True
+                batch = [job for job in batch if job is not None]
+            if batch:
+                self.converter.run(batch, self._on_job_done, self._on_batch_done)
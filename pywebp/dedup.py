@@ -0,0 +1,171 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import os
+from collections import defaultdict
+import gi
+
+gi.require_version("GdkPixbuf", "2.0")
+from gi.repository import GLib
+from gi.repository.GdkPixbuf import Pixbuf
+from pywebp.cache import file_digest
+
+# width and height of the grayscale grid compared by dhash, giving a 64 bits hash
+DHASH_SIZE = 8
+# maximum number of differing bits between the dhash of two similar images, lower than the number of bands
+SIMILAR_DISTANCE = 3
+# dhash bands looked up to find candidate similar pairs: images within SIMILAR_DISTANCE share at least one band
+DHASH_BANDS = 4
+
+
+def find_duplicates(paths, digest=file_digest) -> [[str]]:
+    """Group files with identical content
+
+    Only files sharing their size with another file are hashed, so unique files are never read.
+
+    Args:
+        paths: full paths of the files
+        digest: function returning the content hash of a file path
+
+    Returns:
+        a list of groups of two or more paths with the same bytes, each group in the order of paths
+    """
+    by_size = defaultdict(list)
+    for path in paths:
+        try:
+            by_size[os.path.getsize(path)].append(path)
+        except OSError:
+            continue
+    groups = []
+    for same_size in by_size.values():
+        if len(same_size) < 2:
+            continue
+        by_digest = defaultdict(list)
+        for path in same_size:
+            try:
+                by_digest[digest(path)].append(path)
+            except OSError:
+                continue
+        groups.extend(group for group in by_digest.values() if len(group) > 1)
+    order = {path: index for index, path in enumerate(paths)}
+    groups.sort(key=lambda group: order[group[0]])
+    return groups
+
+
+def dhash(path) -> int:
+    """Perceptual difference hash of an image, equal or close for images that look the same
+
+    The image is scaled down to a (DHASH_SIZE + 1) x DHASH_SIZE grayscale grid and each bit tells if a pixel is
+    brighter than its right neighbour, so the hash survives re-encoding, resizing and small color changes.
+
+    Args:
+        path: full path of the image
+
+    Returns:
+        the hash as an integer of DHASH_SIZE * DHASH_SIZE bits
+
+    Raises:
+        GLib.Error: if the image can not be decoded
+    """
+    pixbuf = Pixbuf.new_from_file_at_scale(path, DHASH_SIZE + 1, DHASH_SIZE, False)
+    pixels = pixbuf.get_pixels()
+    channels = pixbuf.get_n_channels()
+    rowstride = pixbuf.get_rowstride()
+    value = 0
+    for y in range(DHASH_SIZE):
+        row = []
+        for x in range(DHASH_SIZE + 1):
+            offset = y * rowstride + x * channels
+            r, g, b = pixels[offset], pixels[offset + 1], pixels[offset + 2]
+            row.append(r * 299 + g * 587 + b * 114)
+        for x in range(DHASH_SIZE):
+            value = (value << 1) | (row[x] > row[x + 1])
+    return value
+
+
+def hamming_distance(a, b) -> int:
+    """Number of differing bits of two hashes
+
+    Args:
+        a: first hash
+        b: second hash
+
+    Returns:
+        the number of bits set in a xor b
+    """
+    return bin(a ^ b).count("1")
+
+
+def find_similar(paths, max_distance=SIMILAR_DISTANCE, hashes=None) -> [[str]]:
+    """Group images that look the same even if their bytes differ
+
+    Hashes are split in DHASH_BANDS bands: two hashes within max_distance bits share at least one band, so only
+    images sharing a band are compared instead of every pair.
+
+    Args:
+        paths: full paths of the images
+        max_distance: maximum number of differing dhash bits, lower than DHASH_BANDS
+        hashes: dict of already known dhash by path, filled with the computed ones
+
+    Returns:
+        a list of groups of two or more similar paths, each group in the order of paths
+    """
+    if hashes is None:
+        hashes = {}
+    for path in paths:
+        if path not in hashes:
+            try:
+                hashes[path] = dhash(path)
+            except GLib.Error:
+                continue
+    hashed = [path for path in paths if path in hashes]
+
+    bits = DHASH_SIZE * DHASH_SIZE // DHASH_BANDS
+    mask = (1 << bits) - 1
+    buckets = defaultdict(list)
+    for index, path in enumerate(hashed):
+        for band in range(DHASH_BANDS):
+            buckets[(band, (hashes[path] >> (band * bits)) & mask)].append(index)
+
+    # union-find of the similar pairs
+    parent = list(range(len(hashed)))
+
+    def _root(index):
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    for bucket in buckets.values():
+        for i, first in enumerate(bucket):
+            for second in bucket[i + 1:]:
+                if _root(first) != _root(second) and \
+                        hamming_distance(hashes[hashed[first]], hashes[hashed[second]]) <= max_distance:
+                    parent[_root(second)] = _root(first)
+
+    groups = defaultdict(list)
+    for index, path in enumerate(hashed):
+        groups[_root(index)].append(path)
+    return [group for group in groups.values() if len(group) > 1]
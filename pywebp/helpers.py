@@ -24,8 +24,9 @@
 #
 
 import os
+import sys
 
-from gi.repository import Gtk
+from gi.repository import Gtk, Gdk
 
 def sizeof_fmt(num) -> str:
     """Print size of a byte number in human-readable format.
@@ -53,7 +54,10 @@ def error_message(message, running_tests=False):
         running_tests: If True running from testsuite. Do not show popup.
     """
     # Always print the error message first
-    print("\033[91mError:\033[0m", message)
+    print("\033[91mError:\033[0m", message, file=sys.stderr)
+    # Headless mode, there is no display to show the popup
+    if Gdk.Display.get_default() is None:
+        return
     # Then display a Gtk Popup
     popup = Gtk.Dialog(title="PyWEbP-GTK - Error", transient_for=Gtk.Window())
     popup.set_default_size(600, 1)
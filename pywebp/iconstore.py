@@ -24,17 +24,93 @@
 #
 
 import os
+import threading
+from contextlib import contextmanager
 import gi
 
 gi.require_version("Gtk", "3.0")
-from gi.repository import Gtk
+from gi.repository import Gtk, GLib, GObject
 from gi.repository.GdkPixbuf import Pixbuf
 from pywebp.helpers import sizeof_fmt
+from pywebp.probe import ProbeError, probe
 from pywebp.settings import settings
+from pywebp.pixbufcache import pixbuf_cache
+from pywebp.thumbnailer import Thumbnailer
+
+# rows inserted by each idle callback of IconStore.add_many
+CHUNK_SIZE = 2000
+# numeric columns, used to sort and filter without parsing the formatted strings
+COLUMN_BYTES = 5
+COLUMN_WIDTH = 6
+COLUMN_HEIGHT = 7
+COLUMN_MTIME = 8
+# visible column of the Gtk.TreeModelFilter shown by the view
+COLUMN_VISIBLE = 9
+# sort keys of IconStore.sort_rows, by name
+SORT_KEYS = {
+    "name": lambda row: (row[3].casefold(), row[2]),
+    "size": lambda row: row[COLUMN_BYTES],
+    "width": lambda row: row[COLUMN_WIDTH],
+    "height": lambda row: row[COLUMN_HEIGHT],
+    "mtime": lambda row: row[COLUMN_MTIME],
+}
+
+
+@contextmanager
+def detached(view, keep_selection=True):
+    """Detach the model from a view while many rows change, keeping selection and scroll position
+
+    The view lays itself out once when the model is attached again, instead of once per changed row.
+
+    The selection is kept by file path, not by position, so the same images stay selected when the rows are
+    reordered or hidden meanwhile. The selection-changed handler of the view, its selection_handler attribute if
+    any, is blocked while the selection is restored one path at a time, and selection-changed is emitted once at
+    the end.
+
+    Args:
+        view: the Gtk.IconView, None to do nothing
+        keep_selection: False to leave the view without selection, when the selected rows are removed
+    """
+    if view is None:
+        yield
+        return
+    _model = view.get_model()
+    _selected = view.get_selected_items()
+    _files = {_model[path][2] for path in _selected} if keep_selection and _selected else set()
+    _adjustment = view.get_vadjustment()
+    _scroll = _adjustment.get_value() if _adjustment is not None else 0
+    _handler = getattr(view, "selection_handler", None)
+    if _handler is not None:
+        view.handler_block(_handler)
+    view.set_model(None)
+    try:
+        yield
+    finally:
+        view.set_model(_model)
+        if _files:
+            for row in _model:
+                if row[2] in _files:
+                    view.select_path(row.path)
+        if _handler is not None:
+            view.handler_unblock(_handler)
+        if _selected:
+            view.emit("selection-changed")
+        if _adjustment is not None:
+            _adjustment.set_value(_scroll)
 
 
 class IconStore(Gtk.ListStore):
     """
+    Rows are added with a placeholder icon, without reading the files when their sizes are known, so folders on
+    slow or network mounts are listed quickly. Thumbnails are decoded only for the rows the view asks for with
+    load_thumbnails, and dropped again with unload_thumbnails, so memory follows the viewport and not the number
+    of rows. Decoded thumbnails are kept in the shared pixbuf_cache, bounded by a memory budget: rows scrolled
+    back into view are shown again without decoding, and rows whose thumbnail is evicted get the placeholder back.
+    Image dimensions are probed with the thumbnail decode and added to the description of the row, along with the
+    duplicate group of the image if any.
+
+    Sizes, dimensions and modification times are kept as numbers, so rows are sorted with keys read once per
+    row and a single reorder, and filtered through the visible column of a Gtk.TreeModelFilter.
 
     model schema:
     [
@@ -42,13 +118,31 @@ class IconStore(Gtk.ListStore):
         Pixbuf: image,
         str: full file path,
         str: file basename,
-        str: file size
+        str: file size,
+        int: file size in bytes,
+        int: image width, 0 if not probed yet,
+        int: image height, 0 if not probed yet,
+        int: file modification time in seconds,
+        bool: row visible with the current filter
     ]
     """
 
     def __init__(self):
         super(IconStore, self).__init__()
-        self.set_column_types([str, Pixbuf, str, str, str])
+        self.set_column_types([str, Pixbuf, str, str, str, GObject.TYPE_INT64, int, int, GObject.TYPE_INT64, bool])
+        self._thumbnailer = Thumbnailer()
+        # pending ThumbnailRequest and Gtk.TreeRowReference of the rows showing a thumbnail, by file path
+        self._requests = {}
+        self._loaded = {}
+        # normalized paths of the files in the model, and normalized path of each file path. Rows are found by
+        # scanning the model when needed, a Gtk.TreeRowReference per row would be updated on every row change
+        self._index = set()
+        self._keys = {}
+        # ImageInfo probed with the thumbnails and duplicate group label, by file path
+        self._infos = {}
+        self._groups = {}
+        # function of (basename, size, width, height) choosing the visible rows, None to show all of them
+        self._filter = None
 
     def get_model(self) -> Gtk.ListStore:
         """Get model associated to the widget
@@ -65,36 +159,419 @@ class IconStore(Gtk.ListStore):
             filepath: full file path of the image
 
         """
-        if not self.is_duplicate(filepath, 2):
-            _basename = os.path.basename(filepath)
-            _filesize = sizeof_fmt(os.path.getsize(filepath))
-            self.append([_basename + "\nSize: " + _filesize,
-                         Pixbuf.new_from_file_at_scale(filepath,
-                                                       settings.get_integer_list("default_thumbsize")[0],
-                                                       settings.get_integer_list("default_thumbsize")[1],
-                                                       True),
-                         filepath,
-                         _basename,
-                         _filesize])
+        _key = self.normalize_path(filepath)
+        if not self._is_indexed(_key):
+            self._append_file(filepath, _key, settings.get_integer_list("default_thumbsize"))
+
+    def add_many(self, paths, view=None, on_done=None, chunk_size=CHUNK_SIZE, stats=None):
+        """Add many images to the model, in chunks inserted from idle callbacks
+
+        While a chunk is inserted the model is detached from the view, so the view lays itself out once per
+        chunk instead of once per row. Selection and scroll position of the view are kept.
+
+        Args:
+            paths: full file paths of the images
+            view: the Gtk.IconView showing the model, None if the model is not shown
+            on_done: callback called with the number of added images when all the chunks are inserted
+            chunk_size: number of rows inserted by each idle callback
+            stats: dict of (size in bytes, modification time) by file path, files missing from it are read from
+                the disk
+        """
+        _thumbsize = settings.get_integer_list("default_thumbsize")
+        _pending = []
+        _keys = set()
+        for filepath in paths:
+            _key = self.normalize_path(filepath)
+            if _key not in _keys and not self._is_indexed(_key):
+                _keys.add(_key)
+                _pending.append((filepath, _key))
+
+        def _insert_chunks():
+            _added = 0
+            for start in range(0, len(_pending), chunk_size):
+                with detached(view):
+                    for filepath, _key in _pending[start:start + chunk_size]:
+                        # the file may have been added or deleted since add_many was called
+                        if self._is_indexed(_key):
+                            continue
+                        try:
+                            self._append_file(filepath, _key, _thumbsize,
+                                              stats.get(filepath) if stats is not None else None)
+                            _added += 1
+                        except OSError as error:
+                            print("Unable to add %s: %s" % (filepath, error))
+                yield True
+            if on_done is not None:
+                on_done(_added)
+            yield False
+
+        _chunks = _insert_chunks()
+        if len(_pending) <= chunk_size:
+            # small batch, insert it now
+            for _ in _chunks:
+                pass
+        else:
+            GLib.idle_add(lambda: next(_chunks, False))
+
+    def _append_file(self, filepath, key, thumbsize, stat=None):
+        """Append a row for an image with a placeholder icon and index it
+
+        Args:
+            filepath: full file path of the image
+            key: normalized file path
+            thumbsize: [width, height] of the thumbnail
+            stat: (size in bytes, modification time) of the file, None to read them from the disk
+        """
+        if stat is None:
+            _stat = os.stat(filepath)
+            stat = (_stat.st_size, int(_stat.st_mtime))
+        _basename = os.path.basename(filepath)
+        _filesize = sizeof_fmt(stat[0])
+        self.append([self._describe(filepath, _basename, _filesize),
+                     self._thumbnailer.placeholder(thumbsize[0], thumbsize[1]),
+                     filepath,
+                     _basename,
+                     _filesize,
+                     stat[0],
+                     0,
+                     0,
+                     stat[1],
+                     self._filter is None or self._filter(_basename, stat[0], 0, 0)])
+        self._index.add(key)
+        self._keys[filepath] = key
+
+    def _describe(self, filepath, basename, filesize) -> str:
+        """Description of a row
+
+        Args:
+            filepath: full file path
+            basename: file basename
+            filesize: formatted file size
+
+        Returns:
+            the description shown under the thumbnail
+        """
+        _description = basename + "\nSize: " + filesize
+        info = self._infos.get(filepath)
+        if info is not None:
+            _description += "\n%dx%d" % (info.width, info.height)
+            if info.animated:
+                _description += " animated"
+        if filepath in self._groups:
+            _description += "\n" + self._groups[filepath]
+        return _description
+
+    def _update_description(self, tree_iter):
+        """Rebuild the description of a row
+
+        Args:
+            tree_iter: Gtk.TreeIter of the row
+        """
+        self.set_value(tree_iter, 0, self._describe(self.get_value(tree_iter, 2), self.get_value(tree_iter, 3),
+                                                    self.get_value(tree_iter, 4)))
+
+    def _set_info(self, tree_iter, filepath, info):
+        """Store the probed metadata of a row
+
+        Args:
+            tree_iter: Gtk.TreeIter of the row
+            filepath: full file path
+            info: ImageInfo of the image
+        """
+        self._infos[filepath] = info
+        self._update_description(tree_iter)
+        self.set(tree_iter, [COLUMN_WIDTH, COLUMN_HEIGHT], [info.width, info.height])
+        if self._filter is not None:
+            self.set_value(tree_iter, COLUMN_VISIBLE,
+                           self._filter(self.get_value(tree_iter, 3), self.get_value(tree_iter, COLUMN_BYTES),
+                                        info.width, info.height))
+
+    def is_filtered(self) -> bool:
+        """Check if some rows may be hidden by a filter
+
+        Returns:
+            True if a filter is set, False otherwise
+        """
+        return self._filter is not None
+
+    def set_filter(self, predicate, view=None):
+        """Update the visible column of every row
+
+        Args:
+            predicate: function of (basename, size, width, height) returning True for the rows to show, None to
+                show all of them
+            view: the Gtk.IconView showing the model, detached while the rows change
+        """
+        self._filter = predicate
+        with detached(view):
+            for row in self:
+                visible = predicate is None or predicate(row[3], row[COLUMN_BYTES], row[COLUMN_WIDTH],
+                                                         row[COLUMN_HEIGHT])
+                if row[COLUMN_VISIBLE] != visible:
+                    row[COLUMN_VISIBLE] = visible
+
+    def sort_rows(self, key="name", reverse=False, view=None):
+        """Sort the rows, computing the sort key once per row and moving them with a single reorder
+
+        Args:
+            key: one of the SORT_KEYS
+            reverse: True to sort in descending order
+            view: the Gtk.IconView showing the model, detached while the rows move
+        """
+        _key = SORT_KEYS[key]
+        _keys = [_key(row) for row in self]
+        _order = sorted(range(len(_keys)), key=_keys.__getitem__, reverse=reverse)
+        if _order != list(range(len(_order))):
+            with detached(view):
+                self.reorder(_order)
+
+    def probe_missing(self, view=None, on_done=None):
+        """Read the dimensions of the rows not probed yet in a background thread
+
+        Args:
+            view: the Gtk.IconView showing the model, detached while the rows are updated
+            on_done: callback called in the main loop when all the rows are updated
+        """
+        _paths = [row[2] for row in self if row[COLUMN_WIDTH] == 0]
+
+        def _probe():
+            _infos = {}
+            for filepath in _paths:
+                try:
+                    _infos[filepath] = probe(filepath, count_frames=False)
+                except (ProbeError, OSError):
+                    pass
+            GLib.idle_add(_update, _infos)
+
+        def _update(_infos):
+            with detached(view):
+                for filepath, _iter in self._find_rows(_infos).items():
+                    self._set_info(_iter, filepath, _infos[filepath])
+            if on_done is not None:
+                on_done()
+            return False
+
+        threading.Thread(target=_probe, name="pywebp-probe", daemon=True).start()
 
-    def remove_selected(self, items) -> bool:
+    def set_duplicate_groups(self, duplicates, similar=()) -> [Gtk.TreePath]:
+        """Show the duplicate groups in the row descriptions, replacing the previous ones
+
+        Args:
+            duplicates: groups of file paths with identical content, the first one is the original
+            similar: groups of file paths of images that look the same
+
+        Returns:
+            the Gtk.TreePath of the rows that are copies of another row
+        """
+        _changed = set(self._groups)
+        self._groups.clear()
+        for group in similar:
+            for filepath in group[1:]:
+                self._groups[filepath] = "Similar to " + os.path.basename(group[0])
+            self._groups[group[0]] = "%d similar" % len(group)
+        _copies = []
+        for group in duplicates:
+            for filepath in group[1:]:
+                self._groups[filepath] = "Copy of " + os.path.basename(group[0])
+            self._groups[group[0]] = "%d copies" % len(group)
+            _copies.extend(group[1:])
+        _changed.update(self._groups)
+
+        _rows = self._find_rows(_changed)
+        for _iter in _rows.values():
+            self._update_description(_iter)
+        return [self.get_path(_rows[filepath]) for filepath in _copies if filepath in _rows]
+
+    def load_thumbnails(self, indices):
+        """Queue the decode of the thumbnails of some rows, skipping the ones loaded or pending
+
+        Args:
+            indices: indices of the rows
+        """
+        _thumbsize = settings.get_integer_list("default_thumbsize")
+        _count = len(self)
+        for index in indices:
+            if not 0 <= index < _count:
+                continue
+            _iter = self.iter_nth_child(None, index)
+            filepath = self.get_value(_iter, 2)
+            if filepath in self._loaded or filepath in self._requests:
+                continue
+            _row_ref = Gtk.TreeRowReference.new(self, Gtk.TreePath.new_from_indices([index]))
+            _pixbuf = pixbuf_cache.get((filepath, _thumbsize[0], _thumbsize[1]))
+            if _pixbuf is not None:
+                self.set_value(_iter, 1, _pixbuf)
+                self._loaded[filepath] = _row_ref
+                continue
+            self._requests[filepath] = self._thumbnailer.request(filepath, _thumbsize[0], _thumbsize[1],
+                                                                 self._set_thumbnail, _row_ref)
+
+    def unload_thumbnails(self, keep):
+        """Put back the placeholder icon and cancel the pending decodes of the rows not to keep
+
+        Args:
+            keep: indices of the rows to keep, a range or a set
+        """
+        for filepath, request in list(self._requests.items()):
+            _row_ref = request.user_data[0]
+            if not _row_ref.valid() or _row_ref.get_path().get_indices()[0] not in keep:
+                request.cancel()
+                del self._requests[filepath]
+        _thumbsize = settings.get_integer_list("default_thumbsize")
+        _placeholder = self._thumbnailer.placeholder(_thumbsize[0], _thumbsize[1])
+        for filepath, _row_ref in list(self._loaded.items()):
+            if not _row_ref.valid():
+                del self._loaded[filepath]
+            elif _row_ref.get_path().get_indices()[0] not in keep:
+                del self._loaded[filepath]
+                self.set_value(self.get_iter(_row_ref.get_path()), 1, _placeholder)
+
+    def _set_thumbnail(self, pixbuf, row_ref):
+        """Swap the decoded thumbnail into its row, called in the main loop by the Thumbnailer
+
+        Args:
+            pixbuf: the thumbnail, None if the image could not be decoded
+            row_ref: Gtk.TreeRowReference of the row
+        """
+        if not row_ref.valid():
+            return
+        _iter = self.get_iter(row_ref.get_path())
+        filepath = self.get_value(_iter, 2)
+        request = self._requests.pop(filepath, None)
+        self._loaded[filepath] = row_ref
+        if request is not None and request.info is not None:
+            self._set_info(_iter, filepath, request.info)
+        if pixbuf is not None:
+            self.set_value(_iter, 1, pixbuf)
+            _thumbsize = settings.get_integer_list("default_thumbsize")
+            pixbuf_cache.put((filepath, _thumbsize[0], _thumbsize[1]), pixbuf, self._thumbnail_evicted)
+
+    def _thumbnail_evicted(self, key):
+        """Put back the placeholder icon of a row whose thumbnail was evicted from the pixbuf cache
+
+        Args:
+            key: the pixbuf cache key, starting with the file path
+        """
+        _row_ref = self._loaded.pop(key[0], None)
+        if _row_ref is not None and _row_ref.valid():
+            _thumbsize = settings.get_integer_list("default_thumbsize")
+            self.set_value(self.get_iter(_row_ref.get_path()), 1,
+                           self._thumbnailer.placeholder(_thumbsize[0], _thumbsize[1]))
+
+    def _find_rows(self, filepaths) -> dict:
+        """Find the rows of some files with a single scan of the model
+
+        Args:
+            filepaths: full paths of the images
+
+        Returns:
+            the Gtk.TreeIter of each file path found in the model
+        """
+        _wanted = {filepath for filepath in filepaths if filepath in self._keys}
+        _rows = {}
+        _iter = self.get_iter_first() if _wanted else None
+        while _iter is not None and len(_rows) < len(_wanted):
+            filepath = self.get_value(_iter, 2)
+            if filepath in _wanted:
+                _rows[filepath] = _iter
+            _iter = self.iter_next(_iter)
+        return _rows
+
+    def _forget(self, filepath):
+        """Drop a file from the index and cancel its pending thumbnail decode
+
+        Args:
+            filepath: full path of the image
+        """
+        request = self._requests.pop(filepath, None)
+        if request is not None:
+            request.cancel()
+        self._loaded.pop(filepath, None)
+        self._infos.pop(filepath, None)
+        self._groups.pop(filepath, None)
+        _thumbsize = settings.get_integer_list("default_thumbsize")
+        pixbuf_cache.discard((filepath, _thumbsize[0], _thumbsize[1]))
+        _key = self._keys.pop(filepath, None)
+        if _key is not None:
+            self._index.discard(_key)
+
+    def remove_selected(self, items, view=None) -> bool:
         """Remove selected items from the thumbs panel
 
+        Removing every row is a single clear. Otherwise rows are removed from the last to the first, so the
+        Gtk.TreePath of the rows still to remove are not shifted by the earlier removals. The view is detached
+        meanwhile, so it neither relayouts nor updates its selection once per removed row.
+
         Args:
-            items:
+            items: list of Gtk.TreePath of the rows to remove
+            view: the Gtk.IconView showing the model, detached while the rows are removed
 
         Returns:
             True if all selected items are removed, False otherwise
         """
+        _indices = sorted({item.get_indices()[0] for item in items}, reverse=True)
+        if len(_indices) == len(self) and len(_indices) > 0:
+            self.clear(view)
+            return True
+
         removed = True
-        for item in items:
-            if not self.remove(self.get_iter(item)):
-                removed = False
+        with detached(view, keep_selection=False):
+            for index in _indices:
+                try:
+                    _iter = self.get_iter(Gtk.TreePath.new_from_indices([index]))
+                except ValueError:
+                    removed = False
+                    continue
+                self._forget(self.get_value(_iter, 2))
+                self.remove(_iter)
 
         return removed
 
-    def is_duplicate(self, value, column=2) -> bool:
+    def clear(self, view=None):
+        """Remove all the rows and cancel the pending thumbnail decodes
+
+        Args:
+            view: the Gtk.IconView showing the model, detached while the rows are removed
+        """
+        for request in self._requests.values():
+            request.cancel()
+        self._requests.clear()
+        self._loaded.clear()
+        _thumbsize = settings.get_integer_list("default_thumbsize")
+        for filepath in self._keys:
+            pixbuf_cache.discard((filepath, _thumbsize[0], _thumbsize[1]))
+        self._index.clear()
+        self._keys.clear()
+        self._infos.clear()
+        self._groups.clear()
+        with detached(view, keep_selection=False):
+            super(IconStore, self).clear()
+
+    @staticmethod
+    def normalize_path(filepath) -> str:
+        """Canonical form of a file path, the same for every path reaching the file through symlinks or '..'
+
+        Args:
+            filepath: file path to normalize
+
+        Returns:
+            the normalized absolute path
         """
+        return os.path.normcase(os.path.realpath(filepath))
+
+    def _is_indexed(self, key) -> bool:
+        """Check if a normalized path is in the model
+
+        Args:
+            key: normalized file path
+
+        Returns:
+            True if the file is in the model, False otherwise
+        """
+        return key in self._index
+
+    def is_duplicate(self, value, column=2) -> bool:
+        """Check if a value is already in the model. File paths are looked up in the index, other columns are scanned
 
         Args:
             value: value to be verified in assigned column
@@ -103,6 +580,8 @@ class IconStore(Gtk.ListStore):
         Returns:
             True if value is present in model, False otherwise
         """
+        if column == 2:
+            return self._is_indexed(self.normalize_path(value))
         _is_duplicate = False
         for row in self:
             if row[column] == value:
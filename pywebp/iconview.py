@@ -27,10 +27,17 @@ import os
 import gi
 
 gi.require_version("Gtk", "3.0")
-from gi.repository import Gtk
-from pywebp.iconstore import IconStore
+from gi.repository import Gtk, Gdk, Gio, GLib
+from pywebp.iconstore import COLUMN_VISIBLE, IconStore
+from pywebp.importer import DirectoryImporter
+from pywebp.rowfilter import parse_filter, uses_dimensions
 from pywebp.settings import settings
 
+# thumbnails decoded ahead of the visible rows in the scroll direction, in screens
+PREFETCH_SCREENS = 2
+# thumbnails farther than this from the visible rows are dropped, in screens
+KEEP_SCREENS = 4
+
 
 class IconView(Gtk.IconView):
 
@@ -42,6 +49,9 @@ class IconView(Gtk.IconView):
 
     def _init_gui(self):
         self._model = IconStore()
+        # the view shows the rows of the store chosen by the filter, its paths are converted to store paths
+        self._filter = self._model.filter_new()
+        self._filter.set_visible_column(COLUMN_VISIBLE)
         self.set_selection_mode(Gtk.SelectionMode.MULTIPLE)
         self.set_vexpand(True)
         self.set_text_column(0)
@@ -51,8 +61,218 @@ class IconView(Gtk.IconView):
         self.set_item_padding(3)
         self.set_margin(3)
         self.set_column_spacing(3)
-        self.set_model(self._model)
-        self.connect("selection-changed", self._selection_changed)
+        self.set_model(self._filter)
+        # blocked by iconstore.detached while the selection is restored
+        self.selection_handler = self.connect("selection-changed", self._selection_changed)
+        settings.connect("changed", self._on_setting_changed)
+        self._visible_update_pending = False
+        self._last_scroll = 0
+        self.connect("notify::vadjustment", self._on_vadjustment)
+        self.connect("size-allocate", self._queue_visible_update)
+        self._importers = set()
+        self._sort = None
+        self.drag_dest_set(Gtk.DestDefaults.ALL, [], Gdk.DragAction.COPY)
+        self.drag_dest_add_uri_targets()
+        self.connect("drag-data-received", self._on_drag_data_received)
+
+    def _on_vadjustment(self, view, pspec):
+        """Follow the scrolling of the new vertical adjustment
+
+        Args:
+            view: this IconView
+            pspec: the vadjustment property
+        """
+        adjustment = self.get_vadjustment()
+        if adjustment is not None:
+            adjustment.connect("value-changed", self._queue_visible_update)
+            adjustment.connect("changed", self._queue_visible_update)
+
+    def _queue_visible_update(self, *args):
+        """Update the loaded thumbnails once the main loop is idle, coalescing scroll and layout events
+
+        Args:
+            args: signal arguments, not used
+        """
+        if not self._visible_update_pending:
+            self._visible_update_pending = True
+            GLib.idle_add(self._update_visible_thumbnails)
+
+    def _update_visible_thumbnails(self):
+        """Decode the thumbnails of the visible rows, prefetch in the scroll direction and drop the far ones
+
+        Returns:
+            False to remove the idle callback
+        """
+        self._visible_update_pending = False
+        if self.get_model() is None:
+            return False
+        visible = self.get_visible_range()
+        if visible is None:
+            return False
+        first = visible[0].get_indices()[0]
+        last = visible[1].get_indices()[0]
+        screen = last - first + 1
+
+        adjustment = self.get_vadjustment()
+        scroll = adjustment.get_value() if adjustment is not None else 0
+        scrolling_down = scroll >= self._last_scroll
+        self._last_scroll = scroll
+
+        self._model.load_thumbnails(self._store_indices(first, last))
+        if scrolling_down:
+            self._model.load_thumbnails(self._store_indices(last + 1, last + PREFETCH_SCREENS * screen))
+            self._model.load_thumbnails(self._store_indices(first - screen // 2, first - 1))
+        else:
+            self._model.load_thumbnails(self._store_indices(first - PREFETCH_SCREENS * screen, first - 1))
+            self._model.load_thumbnails(self._store_indices(last + 1, last + screen // 2))
+        keep = self._store_indices(first - KEEP_SCREENS * screen, last + KEEP_SCREENS * screen)
+        self._model.unload_thumbnails(keep if isinstance(keep, range) else set(keep))
+        return False
+
+    def _store_indices(self, first, last):
+        """Indices in the store of a range of rows of the view
+
+        Args:
+            first: index of the first row of the view
+            last: index of the last row of the view, included
+
+        Returns:
+            a range if no filter is set, a list of store indices otherwise
+        """
+        if not self._model.is_filtered():
+            return range(first, last + 1)
+        count = self._filter.iter_n_children(None)
+        return [self._filter.convert_path_to_child_path(Gtk.TreePath.new_from_indices([index])).get_indices()[0]
+                for index in range(max(0, first), min(last, count - 1) + 1)]
+
+    def to_store_paths(self, paths) -> [Gtk.TreePath]:
+        """Convert paths of the view, like the selected items, to paths of the store
+
+        Args:
+            paths: list of Gtk.TreePath of the view
+
+        Returns:
+            the list of Gtk.TreePath of the same rows in the store
+        """
+        return [self._filter.convert_path_to_child_path(path) for path in paths]
+
+    def set_filter(self, expression) -> int:
+        """Show only the rows matching a filter expression, see pywebp.rowfilter.parse_filter
+
+        Dimensions of the images not probed yet are read in background when the expression compares them.
+
+        Args:
+            expression: the filter expression, empty to show all the rows
+
+        Returns:
+            the number of visible rows
+
+        Raises:
+            ValueError: if the expression is invalid
+        """
+        predicate = parse_filter(expression)
+        self._model.set_filter(predicate, self)
+        if predicate is not None and uses_dimensions(expression):
+            self._model.probe_missing(self, self._queue_visible_update)
+        self._queue_visible_update()
+        return self._filter.iter_n_children(None)
+
+    def sort_rows(self, key, reverse=False):
+        """Sort the rows by one of the iconstore.SORT_KEYS
+
+        Dimensions of the images not probed yet are read in background, then the rows are sorted again.
+
+        Args:
+            key: name of the sort key
+            reverse: True to sort in descending order
+        """
+        self._sort = (key, reverse)
+        self._model.sort_rows(key, reverse, self)
+        if key in ("width", "height"):
+            # sort again by the last chosen key once the dimensions are known
+            self._model.probe_missing(self, lambda: self._model.sort_rows(self._sort[0], self._sort[1], self))
+        self._queue_visible_update()
+
+    def _on_setting_changed(self, storage, key):
+        """Follow the thumbnail size setting
+
+        Args:
+            storage: the SettingStorage emitting the signal
+            key: name of the changed setting
+        """
+        if key == "default_thumbsize":
+            self.set_item_width(storage.get_integer_list(key)[0])
+
+    def add_many(self, paths, on_done=None):
+        """Add many images to the model, detaching it from the view while each chunk is inserted
+
+        Args:
+            paths: full file paths of the images
+            on_done: callback called with the number of added images when all the images are inserted
+        """
+        self._model.add_many(paths, self, on_done)
+
+    def show_duplicates(self, duplicates, similar=()):
+        """Show the duplicate groups under the thumbnails and select the copies, ready to be removed
+
+        Args:
+            duplicates: groups of file paths with identical content, the first one is the original
+            similar: groups of file paths of images that look the same
+        """
+        copies = [self._filter.convert_child_path_to_path(path)
+                  for path in self._model.set_duplicate_groups(duplicates, similar)]
+        copies = [path for path in copies if path is not None]
+        if copies:
+            self.unselect_all()
+            for path in copies:
+                self.select_path(path)
+            self.scroll_to_path(copies[0], False, 0, 0)
+
+    def import_paths(self, paths, on_done=None) -> DirectoryImporter:
+        """Add files and the images found walking directories, streaming them into the model while walking
+
+        Args:
+            paths: full paths or Gio.File of files and directories
+            on_done: callback called with the number of files found when the walk ends
+
+        Returns:
+            the running DirectoryImporter
+        """
+        def _on_files(files):
+            self._model.add_many([file[0] for file in files], self,
+                                 stats={path: (size, mtime) for path, size, mtime in files})
+
+        def _on_done(found):
+            self._importers.discard(importer)
+            if on_done is not None:
+                on_done(found)
+
+        importer = DirectoryImporter(settings.get_boolean("to_webp"), _on_files, _on_done)
+        self._importers.add(importer)
+        importer.start(paths)
+        return importer
+
+    def cancel_imports(self):
+        """Stop walking the directories being imported
+        """
+        for importer in list(self._importers):
+            importer.cancel()
+
+    def _on_drag_data_received(self, widget, context, x, y, data, info, time):
+        """Import the files and directories dropped on the view
+
+        Args:
+            widget: this IconView
+            context: the Gdk.DragContext
+            x: drop position, not used
+            y: drop position, not used
+            data: the Gtk.SelectionData with the dropped uris
+            info: target info, not used
+            time: timestamp of the drop, not used
+        """
+        uris = data.get_uris()
+        if uris:
+            self._app.toolbar.import_files([Gio.File.new_for_uri(uri) for uri in uris])
 
     def _selection_changed(self, action):
         """
@@ -64,7 +284,7 @@ class IconView(Gtk.IconView):
 
         """
         selected = self.get_selected_items()
-        if len(selected) == len(self._model):
+        if len(selected) == self._filter.iter_n_children(None):
             self._app.toolbar.set_select_all(True)
         else:
             self._app.toolbar.set_select_all(False)
@@ -0,0 +1,199 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import gi
+
+gi.require_version("Gtk", "3.0")
+from gi.repository import Gio, GLib
+from pywebp.converter import is_input_file
+
+# files asked to the enumerator at each next_files_async call
+BATCH_SIZE = 256
+# directories enumerated at the same time, to hide the latency of network mounts
+MAX_OPEN_DIRS = 4
+# milliseconds between two deliveries of found files to the model
+FLUSH_INTERVAL = 250
+FILE_ATTRIBUTES = ",".join([Gio.FILE_ATTRIBUTE_STANDARD_NAME, Gio.FILE_ATTRIBUTE_STANDARD_TYPE,
+                            Gio.FILE_ATTRIBUTE_STANDARD_SIZE, Gio.FILE_ATTRIBUTE_TIME_MODIFIED])
+
+
+class DirectoryImporter:
+    """Walk files and directory trees with asynchronous Gio enumeration, streaming the images found.
+
+    Nothing blocks the main loop: directories are enumerated in batches with next_files_async, several at the same
+    time, and files matching the input patterns of the conversion direction are delivered to on_files every
+    FLUSH_INTERVAL milliseconds, the first ones as soon as they are found.
+
+    Attributes:
+        to_webp: True if the images are converted to webp, used to filter the files
+        found: number of files delivered so far
+    """
+
+    def __init__(self, to_webp, on_files, on_done=None):
+        """
+        Args:
+            to_webp: True if the images are converted to webp, False otherwise
+            on_files: callback called with a list of (full path, size in bytes, modification time) of the files
+                found
+            on_done: callback called with the number of files found when the walk ends or is cancelled
+        """
+        self.to_webp = to_webp
+        self.found = 0
+        self._on_files = on_files
+        self._on_done = on_done
+        self._cancellable = Gio.Cancellable()
+        self._dirs = []
+        self._open = 0
+        self._buffer = []
+        self._flush_id = None
+        self._first_flush = True
+        self._finished = False
+
+    def start(self, paths):
+        """Start walking files and directories
+
+        Args:
+            paths: full paths or Gio.File of files and directories
+        """
+        for path in paths:
+            gfile = path if isinstance(path, Gio.File) else Gio.File.new_for_path(path)
+            self._open += 1
+            gfile.query_info_async(FILE_ATTRIBUTES, Gio.FileQueryInfoFlags.NONE, GLib.PRIORITY_DEFAULT,
+                                   self._cancellable, self._on_root_info, gfile)
+        self._check_done()
+
+    def cancel(self):
+        """Stop the walk, files already delivered stay in the model
+        """
+        self._cancellable.cancel()
+
+    def _on_root_info(self, gfile, result, user_data):
+        """A file or directory given to start is identified"""
+        self._open -= 1
+        try:
+            info = gfile.query_info_finish(result)
+        except GLib.Error as error:
+            if not error.matches(Gio.io_error_quark(), Gio.IOErrorEnum.CANCELLED):
+                print("Unable to read %s: %s" % (gfile.get_parse_name(), error.message))
+        else:
+            self._add_info(gfile, info)
+        self._open_dirs()
+        self._check_done()
+
+    def _add_info(self, gfile, info):
+        """Queue a directory or buffer a file matching the patterns
+
+        Args:
+            gfile: the Gio.File
+            info: its Gio.FileInfo
+        """
+        file_type = info.get_file_type()
+        if file_type == Gio.FileType.DIRECTORY:
+            self._dirs.append(gfile)
+        elif file_type == Gio.FileType.REGULAR:
+            path = gfile.get_path()
+            if path is not None and is_input_file(path, self.to_webp):
+                self._buffer.append((path, info.get_size(),
+                                     info.get_attribute_uint64(Gio.FILE_ATTRIBUTE_TIME_MODIFIED)))
+                self._schedule_flush()
+
+    def _open_dirs(self):
+        """Start enumerating queued directories, up to MAX_OPEN_DIRS at the same time
+        """
+        while self._dirs and self._open < MAX_OPEN_DIRS and not self._cancellable.is_cancelled():
+            folder = self._dirs.pop()
+            self._open += 1
+            folder.enumerate_children_async(FILE_ATTRIBUTES, Gio.FileQueryInfoFlags.NONE, GLib.PRIORITY_DEFAULT,
+                                            self._cancellable, self._on_enumerator, folder)
+
+    def _on_enumerator(self, folder, result, user_data):
+        """The enumerator of a directory is ready, ask its first batch of files"""
+        try:
+            enumerator = folder.enumerate_children_finish(result)
+        except GLib.Error as error:
+            if not error.matches(Gio.io_error_quark(), Gio.IOErrorEnum.CANCELLED):
+                print("Unable to read %s: %s" % (folder.get_parse_name(), error.message))
+            self._close_dir()
+            return
+        enumerator.next_files_async(BATCH_SIZE, GLib.PRIORITY_DEFAULT, self._cancellable, self._on_next_files, folder)
+
+    def _on_next_files(self, enumerator, result, folder):
+        """A batch of files of a directory is ready"""
+        try:
+            infos = enumerator.next_files_finish(result)
+        except GLib.Error as error:
+            if not error.matches(Gio.io_error_quark(), Gio.IOErrorEnum.CANCELLED):
+                print("Unable to read %s: %s" % (folder.get_parse_name(), error.message))
+            infos = []
+        if infos:
+            for info in infos:
+                self._add_info(folder.get_child(info.get_name()), info)
+            self._open_dirs()
+            enumerator.next_files_async(BATCH_SIZE, GLib.PRIORITY_DEFAULT, self._cancellable,
+                                        self._on_next_files, folder)
+        else:
+            enumerator.close_async(GLib.PRIORITY_DEFAULT, None, None, None)
+            self._close_dir()
+
+    def _close_dir(self):
+        """A directory is completely enumerated, open the next ones
+        """
+        self._open -= 1
+        self._open_dirs()
+        self._check_done()
+
+    def _schedule_flush(self):
+        """Deliver the buffered files now if they are the first ones, otherwise within FLUSH_INTERVAL
+        """
+        if self._first_flush:
+            self._first_flush = False
+            self._flush()
+        elif self._flush_id is None:
+            self._flush_id = GLib.timeout_add(FLUSH_INTERVAL, self._flush)
+
+    def _flush(self):
+        """Deliver the buffered files
+
+        Returns:
+            False to remove the timeout
+        """
+        self._flush_id = None
+        if self._buffer:
+            files, self._buffer = self._buffer, []
+            self.found += len(files)
+            self._on_files(files)
+        return False
+
+    def _check_done(self):
+        """Deliver the last files and call on_done once nothing is left to walk
+        """
+        if self._finished or self._open > 0 or (self._dirs and not self._cancellable.is_cancelled()):
+            return
+        self._finished = True
+        if self._flush_id is not None:
+            GLib.source_remove(self._flush_id)
+        self._flush()
+        if self._on_done is not None:
+            self._on_done(self.found)
@@ -0,0 +1,394 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import atexit
+import cProfile
+import functools
+import importlib
+import os
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+import gi
+
+gi.require_version("Gtk", "3.0")
+from gi.repository import GLib, GObject
+from pywebp.settings import DATA_DIR
+
+# environment variables enabling the instrumentation, the same as the --instrument, --stall-ms and --profile options
+ENV_INSTRUMENT = "PYWEBP_INSTRUMENT"
+ENV_STALL_MS = "PYWEBP_STALL_MS"
+ENV_PROFILE = "PYWEBP_PROFILE"
+ENV_PROFILE_DIR = "PYWEBP_PROFILE_DIR"
+# milliseconds between two heartbeats of the main loop
+HEARTBEAT_INTERVAL = 20
+# milliseconds the main loop can be busy before the stall is logged
+STALL_THRESHOLD = 100
+PROFILE_DIR = os.path.join(DATA_DIR, "profiles")
+# functions called in the main loop timed even when not used as signal handler or idle callback
+HOT_PATHS = [
+    ("pywebp.iconstore", "IconStore", "add_to_model"),
+    ("pywebp.iconview", "IconView", "_selection_changed"),
+    ("pywebp.toolbar", "Toolbar", "update_preview"),
+    ("pywebp.settings", "SettingStorage", "get_boolean"),
+    ("pywebp.settings", "SettingStorage", "get_integer"),
+    ("pywebp.settings", "SettingStorage", "get_integer_list"),
+    ("pywebp.settings", "SettingStorage", "get_string"),
+]
+# handlers listed in the summary printed at exit
+SUMMARY_SIZE = 20
+
+
+def _callable_name(func) -> str:
+    """Readable name of a callback
+
+    Args:
+        func: function, bound method or other callable
+
+    Returns:
+        the qualified name of the callable
+    """
+    return getattr(func, "__qualname__", None) or getattr(type(func), "__qualname__", repr(func))
+
+
+class MainLoopMonitor:
+    """Find what blocks the GLib main loop, for debugging UI hitches.
+
+    A heartbeat timeout measures the main loop latency, and a watchdog thread samples the stack of the main thread
+    when the heartbeat is late by more than the threshold, naming the handler running. Signal handlers connected
+    with GObject.Object.connect, idle and timeout callbacks added with GLib or GObject, and the HOT_PATHS functions
+    are timed; handlers slower than the threshold are logged and a summary of the slowest is printed at exit.
+    Startup and the handlers named in profile are run under cProfile, and their stats dumped in profile_dir to be
+    read with pstats or snakeviz.
+    Everything is logged on stderr. The monitor must be installed before the application widgets are created.
+
+    Attributes:
+        threshold: milliseconds after which a busy main loop is logged
+        profile: names of the handlers to profile, "startup" to profile up to the first idle of the main loop
+        profile_dir: folder of the profile dumps
+    """
+
+    def __init__(self, threshold=STALL_THRESHOLD, profile=(), profile_dir=PROFILE_DIR):
+        self.threshold = threshold
+        self.profile = set(profile)
+        self.profile_dir = profile_dir
+        self._main_ident = threading.main_thread().ident
+        self._stats = {}
+        # stack of the handlers running in the main thread, nested by emissions from handlers
+        self._running = []
+        self._last_beat = None
+        self._max_latency = 0
+        self._stall_start = None
+        self._profiler = None
+        self._dumps = 0
+        self._stop = threading.Event()
+        self._originals = {}
+
+    def install(self):
+        """Wrap the callbacks, start the heartbeat and the watchdog
+        """
+        self._patch(GObject.Object, "connect", self._wrap_connect)
+        self._patch(GObject.Object, "connect_after", self._wrap_connect)
+        for module in (GLib, GObject):
+            self._patch(module, "idle_add", self._wrap_source("idle"))
+            self._patch(module, "timeout_add", self._wrap_source("timeout"))
+            self._patch(module, "timeout_add_seconds", self._wrap_source("timeout"))
+        for module_name, class_name, name in HOT_PATHS:
+            cls = getattr(importlib.import_module(module_name), class_name)
+            func = getattr(cls, name)
+            setattr(cls, name, self.wrap("%s.%s" % (class_name, name), func))
+
+        if "startup" in self.profile and self._start_profiler("startup"):
+            self._originals["idle_add"](self._startup_done)
+        self._last_beat = time.monotonic()
+        self._originals["timeout_add"](HEARTBEAT_INTERVAL, self._beat)
+        threading.Thread(target=self._watch, name="pywebp-watchdog", daemon=True).start()
+        atexit.register(self.report)
+        self._log("main loop instrumentation enabled, stall threshold %d ms" % self.threshold)
+
+    def _patch(self, owner, name, wrapper):
+        """Replace a function of a module or class by a wrapper of it
+
+        Args:
+            owner: the module or class
+            name: name of the function
+            wrapper: function returning the replacement of the original function
+        """
+        original = getattr(owner, name, None)
+        if original is None:
+            return
+        self._originals.setdefault(name, original)
+        setattr(owner, name, wrapper(original))
+
+    def _wrap_connect(self, connect):
+        """Wrap GObject.Object.connect so that the handlers are timed
+
+        Args:
+            connect: the original connect or connect_after method
+
+        Returns:
+            the replacement method
+        """
+        monitor = self
+
+        @functools.wraps(connect)
+        def _connect(obj, detailed_signal, handler, *args):
+            name = "%s::%s %s" % (type(obj).__name__, detailed_signal, _callable_name(handler))
+            return connect(obj, detailed_signal, monitor.wrap(name, handler), *args)
+
+        return _connect
+
+    def _wrap_source(self, kind):
+        """Build the wrapper of a function adding a main loop source
+
+        Args:
+            kind: "idle" or "timeout", used in the handler names
+
+        Returns:
+            function returning the replacement of GLib.idle_add, GLib.timeout_add or their variants
+        """
+        def _wrapper(add_source):
+            @functools.wraps(add_source)
+            def _add_source(*args, **kwargs):
+                # the callback is the first callable argument, after the priority or interval
+                args = list(args)
+                for index, arg in enumerate(args):
+                    if callable(arg):
+                        args[index] = self.wrap("%s %s" % (kind, _callable_name(arg)), arg)
+                        break
+                return add_source(*args, **kwargs)
+            return _add_source
+        return _wrapper
+
+    def wrap(self, name, func):
+        """Time a function when called in the main thread
+
+        Args:
+            name: name of the handler in the logs
+            func: the function
+
+        Returns:
+            the timed function
+        """
+        if getattr(func, "_pywebp_timed", False):
+            return func
+        monitor = self
+
+        @functools.wraps(func)
+        def _timed(*args, **kwargs):
+            if threading.get_ident() != monitor._main_ident:
+                return func(*args, **kwargs)
+            operation = getattr(func, "__name__", None)
+            profiled = operation in monitor.profile and monitor._profiler is None
+            monitor._running.append(name)
+            start = time.perf_counter()
+            try:
+                if profiled:
+                    with monitor.profiling(operation):
+                        return func(*args, **kwargs)
+                return func(*args, **kwargs)
+            finally:
+                elapsed = (time.perf_counter() - start) * 1000
+                monitor._running.pop()
+                monitor._record(name, elapsed)
+
+        _timed._pywebp_timed = True
+        return _timed
+
+    @contextmanager
+    def profiling(self, name):
+        """Run a block of code under cProfile and dump the stats in profile_dir
+
+        Args:
+            name: name of the operation, used in the file name of the dump
+        """
+        if self._profiler is not None:
+            # cProfile does not nest, the running profile includes this block
+            yield
+            return
+        if not self._start_profiler(name):
+            yield
+            return
+        try:
+            yield
+        finally:
+            self._dump(name)
+
+    def _start_profiler(self, name) -> bool:
+        """Start a profile
+
+        Args:
+            name: name of the profiled operation
+
+        Returns:
+            True if started, False if another profiler, like a debugger or coverage tool, is active
+        """
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as error:
+            self._log("unable to profile %s: %s" % (name, error))
+            return False
+        self._profiler = profiler
+        return True
+
+    def _dump(self, name):
+        """Stop the running profile and write its stats
+
+        Args:
+            name: name of the profiled operation
+        """
+        profiler, self._profiler = self._profiler, None
+        profiler.disable()
+        self._dumps += 1
+        path = os.path.join(self.profile_dir, "%s-%d-%d.prof" % (name, os.getpid(), self._dumps))
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            profiler.dump_stats(path)
+        except OSError as error:
+            self._log("unable to write the profile of %s: %s" % (name, error))
+            return
+        self._log("profile of %s written to %s" % (name, path))
+
+    def _startup_done(self) -> bool:
+        """Dump the startup profile at the first idle of the main loop
+
+        Returns:
+            False to remove the idle callback
+        """
+        if self._profiler is not None:
+            self._dump("startup")
+        return False
+
+    def _record(self, name, elapsed):
+        """Add the duration of a handler to its stats, logging it if slow
+
+        Args:
+            name: name of the handler
+            elapsed: milliseconds spent in the handler
+        """
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = [0, 0.0, 0.0]
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] = max(stats[2], elapsed)
+        if elapsed > self.threshold:
+            self._log("slow handler %s: %.1f ms" % (name, elapsed))
+
+    def _beat(self) -> bool:
+        """Heartbeat of the main loop, measuring its latency
+
+        Returns:
+            True to keep the timeout
+        """
+        now = time.monotonic()
+        latency = (now - self._last_beat) * 1000 - HEARTBEAT_INTERVAL
+        self._max_latency = max(self._max_latency, latency)
+        self._last_beat = now
+        if self._stall_start is not None:
+            self._log("main loop stall ended after %.0f ms" % ((now - self._stall_start) * 1000))
+            self._stall_start = None
+        return not self._stop.is_set()
+
+    def _watch(self):
+        """Watchdog thread, sampling the stack of the main thread when the heartbeat is late
+        """
+        period = max(self.threshold, HEARTBEAT_INTERVAL) / 2000
+        while not self._stop.wait(period):
+            last_beat = self._last_beat
+            late = (time.monotonic() - last_beat) * 1000 - HEARTBEAT_INTERVAL
+            if late <= self.threshold or self._stall_start is not None:
+                continue
+            self._stall_start = last_beat
+            frame = sys._current_frames().get(self._main_ident)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+            running = list(self._running)
+            handler = running[-1] if running else "no timed handler"
+            self._log("main loop stalled for %.0f ms in %s:\n%s" % (late, handler, stack))
+
+    def report(self):
+        """Print the slowest handlers by total time, called at exit
+        """
+        self._stop.set()
+        if not self._stats:
+            return
+        lines = ["main loop handlers, max heartbeat latency %.1f ms" % self._max_latency,
+                 "%8s %10s %10s  %s" % ("calls", "total ms", "max ms", "handler")]
+        ranked = sorted(self._stats.items(), key=lambda item: item[1][1], reverse=True)
+        for name, (count, total, longest) in ranked[:SUMMARY_SIZE]:
+            lines.append("%8d %10.1f %10.1f  %s" % (count, total, longest, name))
+        self._log("\n".join(lines))
+
+    @staticmethod
+    def _log(message):
+        """Print a message of the instrumentation on stderr
+
+        Args:
+            message: text of the message
+        """
+        print("[pywebp] %s" % message, file=sys.stderr)
+
+
+def configure(args, install=True) -> [str]:
+    """Install a MainLoopMonitor if asked by the environment or the command line
+
+    The --instrument option or the PYWEBP_INSTRUMENT variable enable it, --stall-ms=MS or PYWEBP_STALL_MS set
+    the threshold, --profile=NAMES or PYWEBP_PROFILE the comma separated names of the handlers to profile
+    ("startup" for the startup), PYWEBP_PROFILE_DIR the folder of the profiles. Setting a threshold or
+    a profile enables the instrumentation too.
+
+    Args:
+        args: command line arguments, without the program name
+        install: False to only remove the instrumentation options, for the headless commands without main loop
+
+    Returns:
+        the arguments without the instrumentation options
+    """
+    enabled = os.environ.get(ENV_INSTRUMENT, "") not in ("", "0")
+    threshold = os.environ.get(ENV_STALL_MS)
+    profile = os.environ.get(ENV_PROFILE)
+    remaining = []
+    for arg in args:
+        if arg == "--instrument":
+            enabled = True
+        elif arg.startswith("--stall-ms="):
+            threshold = arg.split("=", 1)[1]
+        elif arg.startswith("--profile="):
+            profile = arg.split("=", 1)[1]
+        else:
+            remaining.append(arg)
+    if not install or (not enabled and threshold is None and profile is None):
+        return remaining
+    try:
+        threshold = int(threshold) if threshold is not None else STALL_THRESHOLD
+    except ValueError:
+        print("Invalid stall threshold %r, using %d ms" % (threshold, STALL_THRESHOLD), file=sys.stderr)
+        threshold = STALL_THRESHOLD
+    profile = [name.strip() for name in (profile or "").split(",") if name.strip()]
+    MainLoopMonitor(threshold, profile, os.environ.get(ENV_PROFILE_DIR, PROFILE_DIR)).install()
+    return remaining
@@ -0,0 +1,193 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import json
+import os
+import threading
+import time
+
+from pywebp.settings import DATA_DIR
+
+JOURNAL_FILE = os.path.join(DATA_DIR, 'journal.jsonl')
+# seconds between two fsync of the journal, records are flushed to the system at once
+FSYNC_INTERVAL = 1.0
+
+
+class BatchJournal:
+    """Append-only journal of the conversion batch in progress, stored under DATA_DIR.
+
+    The jobs of a batch are written when it begins, then one record per finished job, and the journal is removed
+    when the batch ends. If the application is closed or crashes meanwhile, the journal lists the jobs still to
+    convert. A job is finished only if its output still has the size and mtime recorded when it was written, and
+    outputs are written to a partial file renamed when complete, so a half written output is never taken for a
+    finished one. A record torn by a crash is ignored when the journal is read.
+
+    Attributes:
+        path: full path of the journal file
+    """
+
+    def __init__(self, path=JOURNAL_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+        self._last_sync = 0
+
+    def begin(self, jobs):
+        """Start the journal of a new batch, replacing the previous one
+
+        Args:
+            jobs: list of ConversionJob of the batch
+        """
+        with self._lock:
+            self._close()
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._file = open(self.path, "w")
+            self._write({"op": "batch", "time": time.time(),
+                         "jobs": [[job.src, job.dst, job.to_webp, job.options] for job in jobs]}, True)
+
+    def job_done(self, job):
+        """Record a finished job
+
+        Args:
+            job: the ConversionJob, DONE or FAILED
+        """
+        record = {"op": job.status, "src": job.src, "dst": job.dst}
+        if job.status == "done":
+            try:
+                stat = os.stat(job.dst)
+            except OSError:
+                return
+            record.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        else:
+            record["error"] = job.error
+        with self._lock:
+            if self._file is not None:
+                self._write(record)
+
+    def end(self):
+        """Remove the journal of a completed batch
+        """
+        with self._lock:
+            self._close()
+            self._remove()
+
+    def close(self):
+        """Sync the journal of an interrupted batch to the disk, to be resumed at the next launch
+        """
+        with self._lock:
+            self._close()
+
+    def discard(self):
+        """Forget the interrupted batch
+        """
+        with self._lock:
+            self._close()
+            self._remove()
+
+    def unfinished(self):
+        """Read the jobs of an interrupted batch that are not finished
+
+        Jobs done are finished if their output did not change since, failed jobs are tried again.
+
+        Returns:
+            a tuple (number of jobs of the batch, list of (src, dst, to_webp, options) of the unfinished jobs),
+            None if no batch was interrupted
+        """
+        with self._lock:
+            if self._file is not None:
+                return None
+            try:
+                with open(self.path) as journal_file:
+                    lines = journal_file.readlines()
+            except OSError:
+                return None
+        jobs = None
+        finished = set()
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("op") == "batch":
+                jobs = record["jobs"]
+                finished.clear()
+            elif record.get("op") == "done" and self._verified(record):
+                finished.add(record["dst"])
+        if jobs is None:
+            return None
+        return len(jobs), [tuple(job) for job in jobs if job[1] not in finished]
+
+    @staticmethod
+    def _verified(record) -> bool:
+        """Check that the output of a done job is still the one written
+
+        Args:
+            record: the journal record of the job
+
+        Returns:
+            True if the output has the recorded size and mtime, False otherwise
+        """
+        try:
+            stat = os.stat(record["dst"])
+        except OSError:
+            return False
+        return stat.st_size == record.get("size") and stat.st_mtime_ns == record.get("mtime_ns")
+
+    def _write(self, record, sync=False):
+        """Append a record, syncing it to the disk at most every FSYNC_INTERVAL seconds
+
+        Args:
+            record: dict of the record
+            sync: True to sync it at once
+        """
+        try:
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+            now = time.monotonic()
+            if sync or now - self._last_sync >= FSYNC_INTERVAL:
+                os.fsync(self._file.fileno())
+                self._last_sync = now
+        except OSError as error:
+            print("Unable to write the conversion journal: %s" % error)
+
+    def _close(self):
+        """Sync and close the journal file, if open
+        """
+        if self._file is not None:
+            try:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except OSError:
+                pass
+            self._file.close()
+            self._file = None
+
+    def _remove(self):
+        """Delete the journal file
+        """
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
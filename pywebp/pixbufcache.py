@@ -0,0 +1,177 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import threading
+from collections import OrderedDict
+
+from pywebp.settings import settings
+
+
+def pixbuf_size(pixbuf) -> int:
+    """Memory used by the pixels of a pixbuf
+
+    Args:
+        pixbuf: the GdkPixbuf.Pixbuf
+
+    Returns:
+        the size in bytes
+    """
+    return pixbuf.get_rowstride() * pixbuf.get_height()
+
+
+class PixbufCache:
+    """Least recently used cache of thumbnails, bounded by a memory budget in bytes.
+
+    When the budget is exceeded the least recently used entries are dropped, and the callback given when each
+    entry was added is called with its key, so the owner can drop its own reference and decode it again on demand.
+
+    Attributes:
+        budget: maximum size of the cached pixels in bytes
+        hits: number of lookups finding their entry
+        misses: number of lookups not finding their entry
+        evictions: number of entries dropped to stay within the budget
+    """
+
+    def __init__(self, budget=None):
+        if budget is None:
+            budget = settings.get_integer("thumbnail_cache_mb") * 1024 * 1024
+        self.budget = budget
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size = 0
+        # key -> (pixbuf, size, on_evict)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Look up a thumbnail, marking it as the most recently used
+
+        Args:
+            key: the entry key
+
+        Returns:
+            the cached Pixbuf, or None on miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, pixbuf, on_evict=None):
+        """Add a thumbnail, evicting the least recently used ones if the budget is exceeded
+
+        Args:
+            key: the entry key
+            pixbuf: the thumbnail
+            on_evict: callback called with the key when the entry is evicted
+        """
+        evicted = []
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old[1]
+            size = pixbuf_size(pixbuf)
+            self._entries[key] = (pixbuf, size, on_evict)
+            self._size += size
+            evicted = self._evict()
+        self._notify(evicted)
+
+    def discard(self, key):
+        """Remove an entry without calling its eviction callback
+
+        Args:
+            key: the entry key
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._size -= entry[1]
+
+    def set_budget(self, budget):
+        """Change the memory budget, evicting entries if it shrinks
+
+        Args:
+            budget: maximum size of the cached pixels in bytes
+        """
+        with self._lock:
+            self.budget = budget
+            evicted = self._evict()
+        self._notify(evicted)
+
+    def _evict(self) -> list:
+        """Drop the least recently used entries until the cache fits the budget. Must hold the lock.
+
+        Returns:
+            list of (key, on_evict) of the evicted entries
+        """
+        evicted = []
+        while self._size > self.budget and self._entries:
+            key, (pixbuf, size, on_evict) = self._entries.popitem(last=False)
+            self._size -= size
+            self.evictions += 1
+            evicted.append((key, on_evict))
+        return evicted
+
+    @staticmethod
+    def _notify(evicted):
+        """Call the eviction callbacks, outside the lock
+
+        Args:
+            evicted: list of (key, on_evict)
+        """
+        for key, on_evict in evicted:
+            if on_evict is not None:
+                on_evict(key)
+
+    def stats(self) -> dict:
+        """Counters to size the budget
+
+        Returns:
+            a dict with hits, misses, evictions, entries, size and budget in bytes
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": len(self._entries), "size": self._size, "budget": self.budget}
+
+
+def _on_setting_changed(storage, key):
+    """Follow the budget setting
+
+    Args:
+        storage: the SettingStorage emitting the signal
+        key: name of the changed setting
+    """
+    if key == "thumbnail_cache_mb":
+        pixbuf_cache.set_budget(storage.get_integer(key) * 1024 * 1024)
+
+
+# Thumbnail cache shared by all the IconStore
+pixbuf_cache = PixbufCache()
+settings.connect("changed", _on_setting_changed)
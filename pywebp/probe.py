@@ -0,0 +1,274 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import struct
+from collections import namedtuple
+
+# bytes read to identify the format and parse the main header
+HEADER_SIZE = 4096
+
+ImageInfo = namedtuple("ImageInfo", ["format", "width", "height", "alpha", "animated", "frames"])
+ImageInfo.__doc__ = """Image metadata read from the file headers, without decoding the pixels.
+
+Attributes:
+    format: "webp", "png", "jpeg", "gif" or "tiff"
+    width: image width in pixels (canvas width for animations)
+    height: image height in pixels (canvas height for animations)
+    alpha: True if the image has an alpha channel or a transparent color
+    animated: True if the image has more than one frame to play
+    frames: number of frames (pages for tiff)
+"""
+
+
+class ProbeError(ValueError):
+    """Raised when a file is not a supported image or its header is truncated."""
+
+
+def probe(path, count_frames=True) -> ImageInfo:
+    """Read size, alpha and animation of an image from its header
+
+    Only the first HEADER_SIZE bytes are read for still images. To count the frames of animations the file is
+    walked chunk by chunk, seeking over the compressed data.
+
+    Args:
+        path: full path of the image
+        count_frames: if False, stop as soon as an animation is detected and report 2 frames
+
+    Returns:
+        an ImageInfo
+
+    Raises:
+        ProbeError: if the format is not supported or the header is invalid
+        OSError: if the file can not be read
+    """
+    with open(path, "rb") as image_file:
+        head = image_file.read(HEADER_SIZE)
+        try:
+            if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+                return _probe_webp(image_file, head, count_frames)
+            if head[:8] == b"\x89PNG\r\n\x1a\n":
+                return _probe_png(image_file, head)
+            if head[:2] == b"\xff\xd8":
+                return _probe_jpeg(image_file)
+            if head[:6] in (b"GIF87a", b"GIF89a"):
+                return _probe_gif(image_file, head, count_frames)
+            if head[:4] in (b"II*\x00", b"MM\x00*"):
+                return _probe_tiff(image_file, head)
+        except struct.error:
+            raise ProbeError("%s: truncated header" % path)
+    raise ProbeError("%s: unsupported image format" % path)
+
+
+def _read_exact(image_file, size) -> bytes:
+    """Read a number of bytes
+
+    Args:
+        image_file: the open file
+        size: number of bytes
+
+    Returns:
+        the bytes read
+
+    Raises:
+        ProbeError: if the file ends before
+    """
+    data = image_file.read(size)
+    if len(data) < size:
+        raise ProbeError("unexpected end of file")
+    return data
+
+
+def _probe_webp(image_file, head, count_frames) -> ImageInfo:
+    """Parse the VP8, VP8L or VP8X chunk of a webp file, counting ANMF chunks of animations"""
+    fourcc = head[12:16]
+    data = head[20:]
+    # bytes of the chunk read below: frame tag and size, signature and size, flags and canvas size
+    needed = {b"VP8 ": 10, b"VP8L": 5, b"VP8X": 10}.get(fourcc, 0)
+    if len(data) < needed:
+        raise ProbeError("truncated %s chunk" % fourcc.decode("ascii").strip())
+    if fourcc == b"VP8 ":
+        if data[3:6] != b"\x9d\x01\x2a":
+            raise ProbeError("invalid VP8 frame header")
+        width, height = struct.unpack("<HH", data[6:10])
+        return ImageInfo("webp", width & 0x3fff, height & 0x3fff, False, False, 1)
+    if fourcc == b"VP8L":
+        if data[0] != 0x2f:
+            raise ProbeError("invalid VP8L signature")
+        bits = struct.unpack("<I", data[1:5])[0]
+        return ImageInfo("webp", (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1, bool((bits >> 28) & 1), False, 1)
+    if fourcc == b"VP8X":
+        flags = data[0]
+        width = int.from_bytes(data[4:7], "little") + 1
+        height = int.from_bytes(data[7:10], "little") + 1
+        alpha = bool(flags & 0x10)
+        animated = bool(flags & 0x02)
+        frames = 1
+        if animated:
+            frames = 0
+            offset = 12
+            image_file.seek(offset)
+            while True:
+                chunk = image_file.read(8)
+                if len(chunk) < 8:
+                    break
+                chunk_fourcc, chunk_size = struct.unpack("<4sI", chunk)
+                if chunk_fourcc == b"ANMF":
+                    frames += 1
+                    if not count_frames and frames > 1:
+                        break
+                # chunks are padded to an even size
+                image_file.seek(chunk_size + (chunk_size & 1), 1)
+        return ImageInfo("webp", width, height, alpha, animated and frames != 1, max(frames, 1))
+    raise ProbeError("unknown webp chunk %r" % fourcc)
+
+
+def _probe_png(image_file, head) -> ImageInfo:
+    """Parse IHDR of a png file, and look for tRNS and the acTL chunk of animated png before IDAT"""
+    if head[12:16] != b"IHDR":
+        raise ProbeError("missing IHDR chunk")
+    width, height, bit_depth, color_type = struct.unpack(">IIBB", head[16:26])
+    alpha = color_type in (4, 6)
+    frames = 1
+    animated = False
+    offset = 8
+    image_file.seek(offset)
+    while True:
+        chunk = image_file.read(8)
+        if len(chunk) < 8:
+            break
+        chunk_size, chunk_type = struct.unpack(">I4s", chunk)
+        if chunk_type == b"IDAT" or chunk_type == b"IEND":
+            break
+        if chunk_type == b"tRNS":
+            alpha = True
+        elif chunk_type == b"acTL":
+            frames = struct.unpack(">I", _read_exact(image_file, 4))[0]
+            animated = frames > 1
+            chunk_size -= 4
+        # skip data and crc
+        image_file.seek(chunk_size + 4, 1)
+    return ImageInfo("png", width, height, alpha, animated, frames)
+
+
+def _probe_jpeg(image_file) -> ImageInfo:
+    """Walk the jpeg markers up to the first start of frame"""
+    image_file.seek(2)
+    while True:
+        byte = _read_exact(image_file, 1)
+        if byte != b"\xff":
+            raise ProbeError("invalid jpeg marker")
+        marker = _read_exact(image_file, 1)[0]
+        # fill bytes
+        while marker == 0xff:
+            marker = _read_exact(image_file, 1)[0]
+        if marker in (0xd8, 0x01) or 0xd0 <= marker <= 0xd7:
+            continue
+        if marker == 0xd9 or marker == 0xda:
+            raise ProbeError("jpeg start of frame not found")
+        length = struct.unpack(">H", _read_exact(image_file, 2))[0]
+        if 0xc0 <= marker <= 0xcf and marker not in (0xc4, 0xc8, 0xcc):
+            precision, height, width, components = struct.unpack(">BHHB", _read_exact(image_file, 6))
+            return ImageInfo("jpeg", width, height, False, False, 1)
+        image_file.seek(length - 2, 1)
+
+
+def _skip_gif_sub_blocks(image_file):
+    """Seek over a sequence of gif data sub-blocks"""
+    while True:
+        size = _read_exact(image_file, 1)[0]
+        if size == 0:
+            return
+        image_file.seek(size, 1)
+
+
+def _probe_gif(image_file, head, count_frames) -> ImageInfo:
+    """Read the logical screen of a gif file and count its image descriptors"""
+    width, height, packed = struct.unpack("<HHB", head[6:11])
+    offset = 13
+    if packed & 0x80:
+        offset += 3 * (2 << (packed & 0x07))
+    image_file.seek(offset)
+    frames = 0
+    alpha = False
+    while True:
+        block = image_file.read(1)
+        if block in (b"", b"\x3b"):
+            break
+        if block == b"\x2c":
+            frames += 1
+            if not count_frames and frames > 1:
+                break
+            descriptor = _read_exact(image_file, 9)
+            if descriptor[8] & 0x80:
+                image_file.seek(3 * (2 << (descriptor[8] & 0x07)), 1)
+            # LZW minimum code size, then the image data
+            image_file.seek(1, 1)
+            _skip_gif_sub_blocks(image_file)
+        elif block == b"\x21":
+            label = _read_exact(image_file, 1)[0]
+            if label == 0xf9:
+                graphic_control = _read_exact(image_file, 6)
+                if graphic_control[1] & 0x01:
+                    alpha = True
+                if graphic_control[5] != 0:
+                    _skip_gif_sub_blocks(image_file)
+            else:
+                _skip_gif_sub_blocks(image_file)
+        else:
+            raise ProbeError("invalid gif block %r" % block)
+    return ImageInfo("gif", width, height, alpha, frames > 1, max(frames, 1))
+
+
+def _probe_tiff(image_file, head) -> ImageInfo:
+    """Read width, height and extra samples of the first IFD of a tiff file, and count the IFDs as pages"""
+    endian = "<" if head[:2] == b"II" else ">"
+    offset = struct.unpack(endian + "I", head[4:8])[0]
+    width = height = None
+    alpha = False
+    pages = 0
+    seen = set()
+    while offset != 0 and offset not in seen:
+        seen.add(offset)
+        image_file.seek(offset)
+        count = struct.unpack(endian + "H", _read_exact(image_file, 2))[0]
+        entries = _read_exact(image_file, count * 12)
+        if pages == 0:
+            for index in range(count):
+                tag, field_type, values, value = struct.unpack(endian + "HHI4s", entries[index * 12:index * 12 + 12])
+                if field_type == 3:
+                    number = struct.unpack(endian + "H", value[:2])[0]
+                else:
+                    number = struct.unpack(endian + "I", value)[0]
+                if tag == 256:
+                    width = number
+                elif tag == 257:
+                    height = number
+                elif tag == 338:
+                    alpha = True
+        pages += 1
+        offset = struct.unpack(endian + "I", _read_exact(image_file, 4))[0]
+    if width is None or height is None:
+        raise ProbeError("tiff image size not found")
+    return ImageInfo("tiff", width, height, alpha, False, pages)
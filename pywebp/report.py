@@ -0,0 +1,193 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import csv
+import json
+import os
+import threading
+import time
+
+from pywebp.helpers import sizeof_fmt
+
+# columns of the per-job records, in CSV order
+JOB_FIELDS = ["src", "dst", "status", "error", "cached", "duplicate_of", "options", "quality", "wait_time",
+              "decode_time", "encode_time", "elapsed", "bytes_in", "bytes_out", "ratio"]
+
+
+def job_metrics(job) -> dict:
+    """Read the metrics of a finished job
+
+    Args:
+        job: the ConversionJob
+
+    Returns:
+        a dict with the JOB_FIELDS, ratio is the output size divided by the input size
+    """
+    record = {field: getattr(job, field, None) for field in JOB_FIELDS}
+    if job.bytes_in and job.bytes_out is not None:
+        record["ratio"] = round(job.bytes_out / job.bytes_in, 4)
+    for field in ("wait_time", "decode_time", "encode_time", "elapsed"):
+        if record[field] is not None:
+            record[field] = round(record[field], 4)
+    return record
+
+
+class BatchReport:
+    """Metrics of the jobs of a batch and their totals, for capacity planning.
+
+    Jobs are added from the converter threads as they end and the totals are kept up to date, so the summary of
+    the live totals and throughput is cheap to read at any time. The report can be exported as CSV, one row per
+    job, or JSON with the summary and the jobs.
+
+    Attributes:
+        total: number of jobs of the batch
+    """
+
+    def __init__(self, total=0):
+        self.total = total
+        self._lock = threading.Lock()
+        self._records = []
+        self._totals = dict.fromkeys(("done", "failed", "cancelled", "cached", "duplicates", "bytes_in", "bytes_out",
+                                      "wait_time", "decode_time", "encode_time", "elapsed"), 0)
+        self._started = time.monotonic()
+        self._ended = None
+
+    def add(self, job) -> dict:
+        """Record a finished job
+
+        Args:
+            job: the ConversionJob
+
+        Returns:
+            the metrics of the job
+        """
+        record = job_metrics(job)
+        with self._lock:
+            self._records.append(record)
+            totals = self._totals
+            if record["status"] in ("done", "failed", "cancelled"):
+                totals[record["status"]] += 1
+            totals["cached"] += int(bool(record["cached"]))
+            totals["duplicates"] += int(record["duplicate_of"] is not None)
+            if record["bytes_out"] is not None:
+                totals["bytes_in"] += record["bytes_in"]
+                totals["bytes_out"] += record["bytes_out"]
+            for field in ("wait_time", "decode_time", "encode_time", "elapsed"):
+                totals[field] += record[field] or 0
+        return record
+
+    def finish(self):
+        """Stop the clock of the batch
+        """
+        self._ended = time.monotonic()
+
+    def records(self) -> [dict]:
+        """Metrics of the jobs recorded so far
+
+        Returns:
+            a list of dict with the JOB_FIELDS
+        """
+        with self._lock:
+            return list(self._records)
+
+    def summary(self) -> dict:
+        """Aggregate the jobs recorded so far
+
+        Returns:
+            a dict with the counts by status, the total bytes and seconds, the overall ratio and the throughput
+            in files and input bytes per second of wall time
+        """
+        with self._lock:
+            totals = dict(self._totals)
+            finished = len(self._records)
+        elapsed = (self._ended if self._ended is not None else time.monotonic()) - self._started
+        bytes_in = totals["bytes_in"]
+        bytes_out = totals["bytes_out"]
+        summary = {"total": self.total, "finished": finished, "elapsed": round(elapsed, 3)}
+        for field in ("done", "failed", "cancelled", "cached", "duplicates"):
+            summary[field] = totals[field]
+        for field in ("wait_time", "decode_time", "encode_time", "elapsed"):
+            summary["total_" + field] = round(totals[field], 3)
+        summary.update(bytes_in=bytes_in, bytes_out=bytes_out, saved=bytes_in - bytes_out,
+                       ratio=round(bytes_out / bytes_in, 4) if bytes_in > 0 else None,
+                       files_per_second=round(finished / elapsed, 3) if elapsed > 0 else None,
+                       bytes_per_second=round(bytes_in / elapsed) if elapsed > 0 else None)
+        return summary
+
+    def describe(self) -> str:
+        """Describe the live totals in a line of the status bar
+
+        Returns:
+            the input and output sizes with the change, and the throughput
+        """
+        summary = self.summary()
+        parts = []
+        if summary["bytes_in"] > 0:
+            parts.append("%s to %s (%+.0f%%)" % (sizeof_fmt(summary["bytes_in"]), sizeof_fmt(summary["bytes_out"]),
+                                                (summary["ratio"] - 1) * 100))
+        if summary["files_per_second"]:
+            parts.append("%.1f files/s, %s/s" % (summary["files_per_second"], sizeof_fmt(summary["bytes_per_second"])))
+        return ", ".join(parts)
+
+    def write(self, path):
+        """Export the report, as JSON if path ends with .json, as CSV otherwise
+
+        Args:
+            path: full path of the report file
+
+        Raises:
+            OSError: if the file can not be written
+        """
+        if os.path.splitext(path)[1].lower() == ".json":
+            self.write_json(path)
+        else:
+            self.write_csv(path)
+
+    def write_csv(self, path):
+        """Export the metrics of the jobs as CSV, one row per job
+
+        Args:
+            path: full path of the CSV file
+
+        Raises:
+            OSError: if the file can not be written
+        """
+        with open(path, "w", newline="") as report_file:
+            writer = csv.DictWriter(report_file, JOB_FIELDS)
+            writer.writeheader()
+            writer.writerows(self.records())
+
+    def write_json(self, path):
+        """Export the summary and the metrics of the jobs as JSON
+
+        Args:
+            path: full path of the JSON file
+
+        Raises:
+            OSError: if the file can not be written
+        """
+        with open(path, "w") as report_file:
+            json.dump({"summary": self.summary(), "jobs": self.records()}, report_file, indent=4)
+            report_file.write("\n")
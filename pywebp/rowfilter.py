@@ -0,0 +1,138 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import operator
+import re
+
+OPERATORS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "=": operator.eq,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+# size units, 1024 based like helpers.sizeof_fmt
+UNITS = {"": 1, "b": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+FIELDS = ("size", "width", "height")
+
+_CONDITION = re.compile(r"^(?P<field>[a-z]+)?\s*(?P<op><=|>=|==|!=|<|>|=)\s*(?P<value>.+)$")
+_SIZE = re.compile(r"^(?P<number>\d+(?:\.\d+)?)\s*(?P<unit>[bkmg]?)(?:i?b)?$")
+_DIMENSIONS = re.compile(r"^(?P<width>\d+)\s*x\s*(?P<height>\d+)$")
+
+
+def parse_size(text) -> int:
+    """Parse a file size like "5 MB", "300K" or "1024"
+
+    Args:
+        text: the size, with an optional unit
+
+    Returns:
+        the size in bytes
+
+    Raises:
+        ValueError: if the text is not a size
+    """
+    match = _SIZE.match(text.strip().lower())
+    if match is None:
+        raise ValueError("invalid size '%s'" % text)
+    return int(float(match.group("number")) * UNITS[match.group("unit")])
+
+
+def _parse_condition(text):
+    """Parse a single condition of a filter expression
+
+    Args:
+        text: the condition, like "> 5 MB", "width >= 1920", ">= 1920x1080" or "holiday"
+
+    Returns:
+        a function of (basename, size, width, height) returning True if the row matches
+    """
+    match = _CONDITION.match(text)
+    if match is None:
+        needle = text.casefold()
+        return lambda basename, size, width, height: needle in basename.casefold()
+
+    compare = OPERATORS[match.group("op")]
+    field = match.group("field")
+    value = match.group("value").strip().lower()
+    dimensions = _DIMENSIONS.match(value)
+    if dimensions is not None:
+        if field is not None:
+            raise ValueError("'%s' can not be compared with dimensions" % field)
+        min_width, min_height = int(dimensions.group("width")), int(dimensions.group("height"))
+        # unknown dimensions (not probed yet) never match
+        return lambda basename, size, width, height: width > 0 and compare(width, min_width) and \
+            compare(height, min_height)
+    if field is None or field == "size":
+        limit = parse_size(value)
+        return lambda basename, size, width, height: compare(size, limit)
+    if field not in FIELDS:
+        raise ValueError("unknown field '%s', use one of %s" % (field, ", ".join(FIELDS)))
+    if not value.isdigit():
+        raise ValueError("invalid %s '%s'" % (field, value))
+    limit = int(value)
+    if field == "width":
+        return lambda basename, size, width, height: width > 0 and compare(width, limit)
+    return lambda basename, size, width, height: height > 0 and compare(height, limit)
+
+
+def parse_filter(expression):
+    """Parse a filter expression of the thumbs panel
+
+    Conditions are separated by commas or "and", and must all match. Each condition is a comparison of the file
+    size ("> 5 MB", "size <= 300K"), of the image dimensions ("width >= 1920", ">= 1920x1080"), or else a text
+    searched in the file name, ignoring case.
+
+    Args:
+        expression: the filter expression
+
+    Returns:
+        a function of (basename, size, width, height) returning True if the row matches, None if the
+        expression is empty
+
+    Raises:
+        ValueError: if a comparison is invalid
+    """
+    conditions = [_parse_condition(part.strip().lower())
+                  for part in re.split(r",|\band\b", expression.strip(), flags=re.IGNORECASE) if part.strip()]
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return lambda *row: all(condition(*row) for condition in conditions)
+
+
+def uses_dimensions(expression) -> bool:
+    """Check if a filter expression compares image dimensions
+
+    Args:
+        expression: the filter expression
+
+    Returns:
+        True if the expression needs the width and height of the images
+    """
+    return re.search(r"\b(width|height)\b|\d\s*x\s*\d", expression, re.IGNORECASE) is not None
@@ -24,6 +24,9 @@
 #
 
 import os
+import sys
+import atexit
+import threading
 
 from gi.repository import GObject, GLib
 from pywebp.helpers import error_message
@@ -31,6 +34,37 @@ from pywebp.helpers import error_message
 DATA_DIR = os.path.join(GLib.get_user_data_dir(), 'pywebp_gtk')
 CONFIG_FILE = os.path.join(DATA_DIR, 'pywebp_gtk.ini')
 SETTINGS_GROUP_NAME = "Settings"
+# seconds waited after the last change before saving CONFIG_FILE
+SAVE_DELAY = 0.5
+# default value of every setting, used to fill missing keys of the CONFIG_FILE
+DEFAULTS = {
+    "darkmode": True,
+    "default_thumbsize": [128, 128],
+    "geometry": [980, 400],
+    "to_webp": False,
+    # number of parallel conversions, 0 means one worker per cpu core
+    "workers": 0,
+    # estimated memory of the images converted at the same time
+    "convert_memory_mb": 2048,
+    # encoder backend: "webptools" (one cwebp/dwebp process per image) or "libwebp" (in-process)
+    "backend": "webptools",
+    # cache of converted images under DATA_DIR, see pywebp.cache
+    "cache_enabled": True,
+    "cache_size_mb": 1024,
+    # memory budget of the thumbnails kept by the icon view, see pywebp.pixbufcache
+    "thumbnail_cache_mb": 256,
+    # also group images that look the same when finding duplicates, see pywebp.dedup
+    "find_similar": False,
+    # search the cwebp quality of each image for a maximum output size, or else a minimum SSIM in thousandths,
+    # 0 to use the quality of cwebp_options, see pywebp.tuning
+    "target_size_kb": 0,
+    "min_ssim_permille": 0,
+    # also write each image converted to webp at these widths with a manifest for srcset, see pywebp.variants
+    "variants_enabled": False,
+    "variant_widths": [320, 640, 1280, 2560],
+    "cwebp_options": "-q 80",
+    "dwebp_options": "",
+}
 COPYRIGHT = """
 
 MIT License
@@ -64,61 +98,187 @@ class SettingStorage(GObject.Object):
     Settings can be accessed via SettingStorage.get_type("key") and changed by
     calling SettingStorage.set_type("key", value), where type is the type of data(boolean,integer,etc).
 
+    Settings are kept in a single in-memory keyfile, loaded again only when the CONFIG_FILE modification time
+    changes. Changes are written back atomically SAVE_DELAY seconds after the last one, so that bursts of changes
+    are saved once, and at exit.
+
     Signals:
-        changed: Emitted when a setting was changed.
+        changed: Emitted with the key name when a setting was changed.
     """
 
     def __init__(self):
         super(SettingStorage, self).__init__()
+        self._lock = threading.RLock()
+        self._keyfile = None
+        self._mtime = None
+        self._dirty = False
+        self._save_timer = None
         self._init_from_keyfile()
+        atexit.register(self.flush)
 
-    @staticmethod
-    def _init_from_keyfile():
+    def _init_from_keyfile(self):
         """Initialize te key file in DATA_DIR folder with CONFIG_FILE path and create default values for keys
         """
-        _keyfile = GLib.KeyFile()
         # check if DATA_DIR exist and eventually create it
         if not os.path.exists(DATA_DIR):
             try:
                 os.makedirs(DATA_DIR)
             except OSError as error:
-                print(error)
-                print("Creation of the directory %s failed" % DATA_DIR)
+                print(error, file=sys.stderr)
+                print("Creation of the directory %s failed" % DATA_DIR, file=sys.stderr)
             else:
-                print("Successfully created the directory %s " % DATA_DIR)
+                print("Successfully created the directory %s " % DATA_DIR, file=sys.stderr)
 
         # check if CONFIG_FILE exist and eventually create it
         if os.path.exists(CONFIG_FILE):
-            _keyfile.load_from_file(CONFIG_FILE, GLib.KeyFileFlags.KEEP_COMMENTS)
-            print("CONFIG_FILE loaded")
+            self._load()
+            print("CONFIG_FILE loaded", file=sys.stderr)
         else:
-            _keyfile = GLib.KeyFile.new()
-            _keyfile.set_comment(None, None, COPYRIGHT)
-            print("no CONFIG_FILE, new keyfile created")
+            self._keyfile = GLib.KeyFile.new()
+            self._keyfile.set_comment(None, None, COPYRIGHT)
+            self._add_defaults(self._keyfile)
+            print("no CONFIG_FILE, new keyfile created", file=sys.stderr)
 
-        # check if SETTINGS_GROUP_NAME settings group exist and eventually create and initialize it
-        if not _keyfile.has_group(SETTINGS_GROUP_NAME):
-            _keyfile.set_boolean(SETTINGS_GROUP_NAME, "darkmode", True)
-            _keyfile.set_integer_list(SETTINGS_GROUP_NAME, "default_thumbsize", [128, 128])
-            _keyfile.set_integer_list(SETTINGS_GROUP_NAME, "geometry", [980, 400])
-            _keyfile.set_boolean(SETTINGS_GROUP_NAME, "to_webp", False)
+        self.flush(force=True)
 
-        _keyfile.save_to_file(CONFIG_FILE)
+    @staticmethod
+    def _add_defaults(keyfile):
+        """Check if every default setting exist and eventually create and initialize it
+
+        Args:
+            keyfile: the GLib.KeyFile to complete
+        """
+        # GLib.KeyFile.has_key is not introspectable, the existing keys are listed once
+        _keys = set(keyfile.get_keys(SETTINGS_GROUP_NAME)[0]) if keyfile.has_group(SETTINGS_GROUP_NAME) else set()
+        for key, value in DEFAULTS.items():
+            if key not in _keys:
+                if isinstance(value, bool):
+                    keyfile.set_boolean(SETTINGS_GROUP_NAME, key, value)
+                elif isinstance(value, int):
+                    keyfile.set_integer(SETTINGS_GROUP_NAME, key, value)
+                elif isinstance(value, list):
+                    keyfile.set_integer_list(SETTINGS_GROUP_NAME, key, value)
+                else:
+                    keyfile.set_string(SETTINGS_GROUP_NAME, key, value)
 
     @staticmethod
-    def _get_keyfile():
-        """Load keyfile from CONFIG_FILE
+    def _file_mtime():
+        """Modification time of CONFIG_FILE
 
         Returns:
-            keyfile containing settings
+            the mtime in nanoseconds, or None if the file does not exist
+        """
+        try:
+            return os.stat(CONFIG_FILE).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load(self):
+        """Load the in-memory keyfile from CONFIG_FILE
         """
         _keyfile = GLib.KeyFile()
+        mtime = self._file_mtime()
         try:
             _keyfile.load_from_file(CONFIG_FILE, GLib.KeyFileFlags.KEEP_COMMENTS)
         except GLib.Error as error:
-            error_message(error)
-        finally:
-            return _keyfile
+            error_message(error.message)
+        self._add_defaults(_keyfile)
+        self._keyfile = _keyfile
+        self._mtime = mtime
+
+    def _get_keyfile(self):
+        """In-memory keyfile, loaded again if CONFIG_FILE was changed by someone else
+
+        Returns:
+            keyfile containing settings
+        """
+        with self._lock:
+            if not self._dirty and self._file_mtime() != self._mtime:
+                self._load()
+            return self._keyfile
+
+    def _schedule_save(self):
+        """Save the settings SAVE_DELAY seconds after the last change
+        """
+        with self._lock:
+            self._dirty = True
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+            self._save_timer = threading.Timer(SAVE_DELAY, self.flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def flush(self, force=False):
+        """Write pending changes to CONFIG_FILE. The file is replaced atomically, it is never left half written.
+
+        Args:
+            force: if True save even if nothing changed
+        """
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+            if not self._dirty and not force:
+                return
+            try:
+                # save_to_file writes a temporary file and renames it over CONFIG_FILE
+                self._keyfile.save_to_file(CONFIG_FILE)
+            except GLib.Error as error:
+                print("Unable to save settings: %s" % error.message, file=sys.stderr)
+                return
+            self._dirty = False
+            self._mtime = self._file_mtime()
+
+    def _changed(self, key):
+        """Emit the changed signal in the main thread
+
+        Args:
+            key: name of the changed setting
+        """
+        if threading.current_thread() is threading.main_thread():
+            self.emit("changed", key)
+        else:
+            GLib.idle_add(self.emit, "changed", key)
+
+    def _get(self, key, getter, default):
+        """Read a value of the settings group
+
+        Args:
+            key: the name of the setting
+            getter: name of the GLib.KeyFile method reading the value
+            default: value returned if the key was not found or could not be parsed
+
+        Returns:
+            the value associated with the key
+        """
+        with self._lock:
+            keyfile = self._get_keyfile()
+            try:
+                return getattr(keyfile, getter)(SETTINGS_GROUP_NAME, key)
+            except GLib.Error as error:
+                error_message(error.message)
+                return default
+
+    def _set(self, key, value, getter, setter):
+        """Write a value of the settings group, schedule the save and emit changed if the value is different
+
+        Args:
+            key: the name of the setting
+            value: the new value
+            getter: name of the GLib.KeyFile method reading the value
+            setter: name of the GLib.KeyFile method writing the value
+        """
+        with self._lock:
+            keyfile = self._get_keyfile()
+            try:
+                changed = getattr(keyfile, getter)(SETTINGS_GROUP_NAME, key) != value
+            except GLib.Error:
+                changed = True
+            if changed:
+                getattr(keyfile, setter)(SETTINGS_GROUP_NAME, key, value)
+                self._schedule_save()
+        if changed:
+            self._changed(key)
 
     def get_boolean(self, key) -> bool:
         """Return boolean value of the key setting
@@ -129,14 +289,7 @@ class SettingStorage(GObject.Object):
         Returns:
             the value associated with the key as a boolean, or False if the key was not found or could not be parsed.
         """
-        keyfile = self._get_keyfile()
-        try:
-            result = keyfile.get_boolean(SETTINGS_GROUP_NAME, key)
-        except GLib.Error as error:
-            error_message(error.message)
-            result = False
-
-        return result
+        return self._get(key, "get_boolean", False)
 
     def set_boolean(self, key, value):
         """ Associates a new boolean value with key. If key cannot be found then it is created.
@@ -148,18 +301,10 @@ class SettingStorage(GObject.Object):
         Return:
             True if value is set, False otherwise
         """
-        keyfile = self._get_keyfile()
-        result = False
-        if isinstance(value, bool):
-            try:
-                keyfile.set_boolean(SETTINGS_GROUP_NAME, key, value)
-                keyfile.save_to_file(CONFIG_FILE)
-            except GLib.Error as error:
-                error_message(error.message)
-            finally:
-                result = True
-
-        return result
+        if not isinstance(value, bool):
+            return False
+        self._set(key, value, "get_boolean", "set_boolean")
+        return True
 
     def get_integer(self, key) -> int:
         """Return integer value of the key setting
@@ -170,14 +315,7 @@ class SettingStorage(GObject.Object):
         Returns:
             the value associated with the key as an integer, or 0 if the key was not found or could not be parsed.
         """
-        keyfile = self._get_keyfile()
-        try:
-            result = keyfile.get_integer(SETTINGS_GROUP_NAME, key)
-        except GLib.Error as error:
-            error_message(error.message)
-            result = 0
-
-        return result
+        return self._get(key, "get_integer", 0)
 
     def set_integer(self, key, value):
         """ Associates a new integer value with key. If key cannot be found then it is created.
@@ -189,18 +327,36 @@ class SettingStorage(GObject.Object):
         Return:
             True if value is set, False otherwise
         """
-        keyfile = self._get_keyfile()
-        result = False
-        if isinstance(value, int):
-            try:
-                keyfile.set_integer(SETTINGS_GROUP_NAME, key, value)
-                keyfile.save_to_file(CONFIG_FILE)
-            except GLib.Error as error:
-                error_message(error.message)
-            finally:
-                result = True
+        if not isinstance(value, int):
+            return False
+        self._set(key, value, "get_integer", "set_integer")
+        return True
+
+    def get_string(self, key) -> str:
+        """Return string value of the key setting
 
-        return result
+        Args:
+            key: the name of the setting containing the string value to be retrieved
+
+        Returns:
+            the value associated with the key as a string, or an empty string if the key was not found.
+        """
+        return self._get(key, "get_string", "")
+
+    def set_string(self, key, value):
+        """ Associates a new string value with key. If key cannot be found then it is created.
+
+        Args:
+            key: key name
+            value: a string value
+
+        Return:
+            True if value is set, False otherwise
+        """
+        if not isinstance(value, str):
+            return False
+        self._set(key, value, "get_string", "set_string")
+        return True
 
     def get_integer_list(self, key) -> [int]:
         """Return a list of integer values of the key setting
@@ -209,17 +365,10 @@ class SettingStorage(GObject.Object):
             key: the name of the setting containing the list of integer values to be retrieved
 
         Returns:
-            the values associated with the key as a list of integers, or an empty list [] if the key was not found or
-            could not be parsed. The returned list of integers should be freed with GLib.free() when no longer needed.
+            the values associated with the key as a list of integers, or [0] if the key was not found or
+            could not be parsed.
         """
-        keyfile = self._get_keyfile()
-        try:
-            result = keyfile.get_integer_list(SETTINGS_GROUP_NAME, key)
-        except GLib.Error as error:
-            error_message(error.message)
-            result = [0]
-
-        return result
+        return self._get(key, "get_integer_list", [0])
 
     def set_integer_list(self, key, my_list):
         """ Associates a list of integer values with key. If key cannot be found then it is created.
@@ -231,18 +380,10 @@ class SettingStorage(GObject.Object):
         Return:
             True if value is set, False otherwise
         """
-        keyfile = self._get_keyfile()
-        result = False
-        if all(isinstance(item, int) for item in my_list):
-            try:
-                keyfile.set_integer_list(SETTINGS_GROUP_NAME, key, my_list)
-                keyfile.save_to_file(CONFIG_FILE)
-            except GLib.Error as error:
-                error_message(error.message)
-            finally:
-                result = True
-
-        return result
+        if not all(isinstance(item, int) for item in my_list):
+            return False
+        self._set(key, list(my_list), "get_integer_list", "set_integer_list")
+        return True
 
 
 # Initiate signals for the SettingsStorage
@@ -26,6 +26,10 @@
 from gi.repository import Gtk, GObject
 from pywebp.settings import settings
 from pywebp.helpers import error_message
+from pywebp.backends import BACKENDS
+from pywebp.cache import ConversionCache
+from pywebp.helpers import sizeof_fmt
+from pywebp.pixbufcache import pixbuf_cache
 
 COLUMN_SPACING = 30
 ROW_SPACING = 30
@@ -63,17 +67,62 @@ class SettingsPanel(Gtk.Notebook):
         darkmode_btn.connect('state-set', self.toggle_darkmode)
         general_grid.attach(darkmode_btn, 1, 0, 1, 1)
 
-        general_grid.attach(Gtk.Label("Enable"), 0, 1, 1, 1)
-        general_grid.attach(Gtk.Label("Enable"), 1, 1, 1, 1)
-        general_grid.attach(Gtk.Label("Enable"), 0, 2, 1, 1)
-        general_grid.attach(Gtk.Label("Enable"), 1, 2, 1, 1)
+        general_grid.attach(Gtk.Label("Encoder backend"), 0, 1, 1, 1)
+        backend_combo = Gtk.ComboBoxText()
+        for name in BACKENDS:
+            backend_combo.append(name, name)
+        backend_combo.set_active_id(settings.get_string("backend"))
+        backend_combo.connect('changed', self.set_backend)
+        general_grid.attach(backend_combo, 1, 1, 1, 1)
+        general_grid.attach(Gtk.Label("Conversion cache"), 0, 2, 1, 1)
+        clear_cache_btn = Gtk.Button.new_with_label("Clear")
+        clear_cache_btn.connect('clicked', self.clear_cache)
+        general_grid.attach(clear_cache_btn, 1, 2, 1, 1)
 
+        general_grid.attach(Gtk.Label("Thumbnail memory (MB)"), 0, 3, 1, 1)
+        thumb_budget_spin = Gtk.SpinButton.new_with_range(16, 8192, 16)
+        thumb_budget_spin.set_value(settings.get_integer("thumbnail_cache_mb"))
+        thumb_budget_spin.connect('value-changed', self.set_thumbnail_budget)
+        general_grid.attach(thumb_budget_spin, 1, 3, 1, 1)
+        self._thumb_stats_label = Gtk.Label()
+        general_grid.attach(self._thumb_stats_label, 0, 4, 2, 1)
+        # counters are refreshed each time the panel is shown
+        self.connect('map', self.update_thumbnail_stats)
+
+        general_grid.attach(Gtk.Label("Find similar images"), 0, 5, 1, 1)
+        similar_btn = Gtk.Switch()
+        similar_btn.props.halign = Gtk.Align.CENTER
+        similar_btn.set_active(settings.get_boolean("find_similar"))
+        similar_btn.connect('state-set', self.toggle_find_similar)
+        general_grid.attach(similar_btn, 1, 5, 1, 1)
 
         cwebp_grid = Gtk.Grid()
         cwebp_grid.set_border_width(BORDER_WIDTH)
         cwebp_grid.set_column_spacing(COLUMN_SPACING)
         cwebp_grid.set_row_spacing(ROW_SPACING)
-        cwebp_grid.attach(Gtk.Label("Enable dark mode"), 0, 0, 1, 1)
+        cwebp_grid.attach(Gtk.Label("Target size (KB, 0 = off)"), 0, 0, 1, 1)
+        target_size_spin = Gtk.SpinButton.new_with_range(0, 100000, 10)
+        target_size_spin.set_value(settings.get_integer("target_size_kb"))
+        target_size_spin.connect('value-changed', self.set_target_size)
+        cwebp_grid.attach(target_size_spin, 1, 0, 1, 1)
+        cwebp_grid.attach(Gtk.Label("Minimum SSIM (0 = off)"), 0, 1, 1, 1)
+        min_ssim_spin = Gtk.SpinButton.new_with_range(0, 1, 0.005)
+        min_ssim_spin.set_digits(3)
+        min_ssim_spin.set_value(settings.get_integer("min_ssim_permille") / 1000)
+        min_ssim_spin.connect('value-changed', self.set_min_ssim)
+        cwebp_grid.attach(min_ssim_spin, 1, 1, 1, 1)
+        cwebp_grid.attach(Gtk.Label("Responsive variants"), 0, 2, 1, 1)
+        variants_btn = Gtk.Switch()
+        variants_btn.props.halign = Gtk.Align.CENTER
+        variants_btn.set_active(settings.get_boolean("variants_enabled"))
+        variants_btn.connect('state-set', self.toggle_variants)
+        cwebp_grid.attach(variants_btn, 1, 2, 1, 1)
+        cwebp_grid.attach(Gtk.Label("Variant widths"), 0, 3, 1, 1)
+        widths_entry = Gtk.Entry()
+        widths_entry.set_text(",".join(str(width) for width in settings.get_integer_list("variant_widths")))
+        widths_entry.connect('activate', self.set_variant_widths)
+        widths_entry.connect('focus-out-event', lambda entry, event: self.set_variant_widths(entry))
+        cwebp_grid.attach(widths_entry, 1, 3, 1, 1)
 
         dwebp_grid = Gtk.Grid()
         dwebp_grid.set_border_width(BORDER_WIDTH)
@@ -94,9 +143,8 @@ class SettingsPanel(Gtk.Notebook):
             action: object connected to this fallback
             darkmode: True or False if app must use dark mode theme
         """
-        print(action)
-        print(darkmode)
-        self._app.toggle_darkmode(darkmode)
+        # the application follows the changed signal of the setting
+        settings.set_boolean("darkmode", darkmode)
         context_id = self._app.statusbar.get_context_id("message from switch")
         message = "Dark mode enabled"
         if not darkmode:
@@ -104,6 +152,122 @@ class SettingsPanel(Gtk.Notebook):
         self._app.push_status_message(message, context_id, 4)
         # error_message('switch clicked')
 
+    def toggle_find_similar(self, action, find_similar):
+        """Want to group images that look the same when finding duplicates or not
+
+        Args:
+            action: object connected to this fallback
+            find_similar: True or False if similar images are grouped with the duplicates
+        """
+        settings.set_boolean("find_similar", find_similar)
+        context_id = self._app.statusbar.get_context_id("toggle_find_similar")
+        message = "Similar images search enabled"
+        if not find_similar:
+            message = "Similar images search disabled"
+        self._app.push_status_message(message, context_id, 4)
+
+    def set_target_size(self, spin):
+        """Register the output size searched for each image converted to webp
+
+        Args:
+            spin: spin button used to make the choice
+        """
+        target_size = spin.get_value_as_int()
+        settings.set_integer("target_size_kb", target_size)
+        message = "Quality search for %d KB outputs" % target_size if target_size > 0 else "Target size disabled"
+        context_id = self._app.statusbar.get_context_id("set_target_size")
+        self._app.push_status_message(message, context_id, 4)
 
+    def set_min_ssim(self, spin):
+        """Register the minimum SSIM searched for each image converted to webp, used without a target size
+
+        Args:
+            spin: spin button used to make the choice
+        """
+        min_ssim = round(spin.get_value() * 1000)
+        settings.set_integer("min_ssim_permille", min_ssim)
+        message = "Quality search for SSIM %.3f" % (min_ssim / 1000) if min_ssim > 0 else "Minimum SSIM disabled"
+        context_id = self._app.statusbar.get_context_id("set_min_ssim")
+        self._app.push_status_message(message, context_id, 4)
+
+    def toggle_variants(self, action, enabled):
+        """Want to also write each image converted to webp at the variant widths or not
+
+        Args:
+            action: object connected to this fallback
+            enabled: True or False if the variants are written
+        """
+        settings.set_boolean("variants_enabled", enabled)
+        context_id = self._app.statusbar.get_context_id("toggle_variants")
+        message = "Responsive variants enabled"
+        if not enabled:
+            message = "Responsive variants disabled"
+        self._app.push_status_message(message, context_id, 4)
 
+    def set_variant_widths(self, entry):
+        """Register the widths of the responsive variants
 
+        Args:
+            entry: entry with the comma separated widths
+        """
+        try:
+            widths = sorted({int(width) for width in entry.get_text().split(",") if width.strip()})
+        except ValueError:
+            widths = []
+        if len(widths) == 0 or widths[0] < 1:
+            entry.set_text(",".join(str(width) for width in settings.get_integer_list("variant_widths")))
+            message = "Invalid variant widths"
+        elif widths == settings.get_integer_list("variant_widths"):
+            return False
+        else:
+            settings.set_integer_list("variant_widths", widths)
+            message = "Variant widths set to %s" % ", ".join(str(width) for width in widths)
+        context_id = self._app.statusbar.get_context_id("set_variant_widths")
+        self._app.push_status_message(message, context_id, 4)
+        return False
+
+    def set_backend(self, combo):
+        """Register the encoder backend used for conversions
+
+        Args:
+            combo: combo box used to make the choice
+        """
+        name = combo.get_active_id()
+        settings.set_string("backend", name)
+        message = "Encoder backend set to '%s'" % name
+        context_id = self._app.statusbar.get_context_id("set_backend")
+        self._app.push_status_message(message, context_id, 4)
+
+    def clear_cache(self, button):
+        """Remove every cached conversion
+
+        Args:
+            button: button that trigger the action
+        """
+        cache = self._app.converter.cache
+        if cache is None:
+            cache = ConversionCache()
+        freed = cache.info()["size"]
+        cache.clear()
+        context_id = self._app.statusbar.get_context_id("clear_cache")
+        self._app.push_status_message("Conversion cache cleared, %s freed" % sizeof_fmt(freed), context_id, 4)
+
+    def set_thumbnail_budget(self, spin):
+        """Register the memory budget of the thumbnails
+
+        Args:
+            spin: spin button used to make the choice
+        """
+        settings.set_integer("thumbnail_cache_mb", spin.get_value_as_int())
+        self.update_thumbnail_stats()
+
+    def update_thumbnail_stats(self, *args):
+        """Show the counters of the thumbnail cache
+
+        Args:
+            args: signal arguments, not used
+        """
+        stats = pixbuf_cache.stats()
+        self._thumb_stats_label.set_text("%d thumbnails, %s of %s - hits %d, misses %d, evictions %d"
+                                         % (stats["entries"], sizeof_fmt(stats["size"]), sizeof_fmt(stats["budget"]),
+                                            stats["hits"], stats["misses"], stats["evictions"]))
@@ -0,0 +1,232 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import threading
+import time
+import gi
+
+gi.require_version("Gtk", "3.0")
+from gi.repository import GLib
+
+# minimum milliseconds between two updates of the main loop
+UPDATE_INTERVAL = 200
+
+
+class StatusBus:
+    """Coalesce the status updates posted from any thread into a few main loop updates per second.
+
+    Callbacks, status bar messages and the progress of the running task are queued under a lock and delivered by a
+    single main loop source, at most every UPDATE_INTERVAL milliseconds. Only the last message of each status bar
+    context is shown, and the progress bar is redrawn once per update whatever the number of finished items.
+    Widgets are attached by the application, updates posted before are kept until then.
+    """
+
+    def __init__(self, interval=UPDATE_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._calls = []
+        self._messages = {}
+        self._task = None
+        self._task_changed = False
+        self._source = None
+        self._last_update = 0
+        self._statusbar = None
+        self._progressbar = None
+        # expiry time of the message shown for each context
+        self._shown = {}
+        self._expire_source = None
+
+    def attach(self, statusbar, progressbar=None):
+        """Set the widgets updated by the bus, called in the main loop
+
+        Args:
+            statusbar: the Gtk.Statusbar showing the messages
+            progressbar: the Gtk.ProgressBar showing the progress of the running task
+        """
+        self._statusbar = statusbar
+        self._progressbar = progressbar
+        with self._lock:
+            self._schedule()
+
+    def call(self, callback, *args):
+        """Call a function in the main loop with the next update
+
+        Args:
+            callback: the function, its return value is ignored
+            args: arguments of the function
+        """
+        with self._lock:
+            self._calls.append((callback, args))
+            self._schedule()
+
+    def post_message(self, message, context_id, timeout=5):
+        """Show a message in the status bar for some seconds, replacing the previous one of its context
+
+        Args:
+            message: text of the message
+            context_id: context id of the message
+            timeout: seconds the message is shown
+        """
+        with self._lock:
+            self._messages[context_id] = (message, timeout)
+            self._schedule()
+
+    def begin_task(self, total, label="", describe=None):
+        """Show the progress bar for a task of several items
+
+        Args:
+            total: number of items of the task
+            label: description of the task
+            describe: function returning more text shown after the counts, called at each update
+        """
+        with self._lock:
+            self._task = {"label": label, "total": total, "done": 0, "failed": 0, "current": None,
+                          "describe": describe}
+            self._task_changed = True
+            self._schedule()
+
+    def advance(self, current=None, failed=False):
+        """Count an item of the running task
+
+        Args:
+            current: name of the last item, shown with the counts
+            failed: True if the item failed
+        """
+        with self._lock:
+            if self._task is None:
+                return
+            self._task["done"] += 1
+            self._task["failed"] += int(failed)
+            self._task["current"] = current
+            self._task_changed = True
+            self._schedule()
+
+    def end_task(self):
+        """Hide the progress bar
+        """
+        with self._lock:
+            self._task = None
+            self._task_changed = True
+            self._schedule()
+
+    def progress(self):
+        """Read the progress of the running task
+
+        Returns:
+            a tuple (items done, items failed, total items), None if no task runs
+        """
+        with self._lock:
+            if self._task is None:
+                return None
+            return self._task["done"], self._task["failed"], self._task["total"]
+
+    def _schedule(self):
+        """Arm the main loop source delivering the updates, called with the lock held
+        """
+        if self._source is not None or self._statusbar is None:
+            return
+        delay = self.interval - (time.monotonic() - self._last_update) * 1000
+        self._source = GLib.timeout_add(max(0, int(delay)), self._update)
+
+    def _update(self) -> bool:
+        """Deliver the queued updates in the main loop
+
+        Returns:
+            False to remove the timeout
+        """
+        with self._lock:
+            calls, self._calls = self._calls, []
+            messages, self._messages = self._messages, {}
+            task = dict(self._task) if self._task is not None else None
+            task_changed, self._task_changed = self._task_changed, False
+            self._source = None
+            self._last_update = time.monotonic()
+
+        for callback, args in calls:
+            try:
+                callback(*args)
+            except Exception as error:
+                print("Status update %r failed: %s" % (callback, error))
+
+        for context_id, (message, timeout) in messages.items():
+            if context_id in self._shown:
+                self._statusbar.pop(context_id)
+            self._statusbar.push(context_id, '>>  ' + message)
+            self._shown[context_id] = self._last_update + timeout
+        if messages:
+            self._schedule_expiry()
+
+        if task_changed and self._progressbar is not None:
+            self._show_task(task)
+        return False
+
+    def _show_task(self, task):
+        """Redraw the progress bar
+
+        Args:
+            task: dict of the running task, None to hide the bar
+        """
+        if task is None:
+            self._progressbar.hide()
+            return
+        text = "%s %d/%d" % (task["label"], task["done"], task["total"])
+        if task["failed"] > 0:
+            text += ", %d failed" % task["failed"]
+        description = task["describe"]() if task["describe"] is not None else None
+        if description:
+            text += ", %s" % description
+        if task["current"]:
+            text += " - %s" % task["current"]
+        self._progressbar.set_fraction(task["done"] / task["total"] if task["total"] > 0 else 0)
+        self._progressbar.set_text(text.strip())
+        self._progressbar.show()
+
+    def _schedule_expiry(self):
+        """Arm a single timeout removing the next expired message
+        """
+        if self._expire_source is not None:
+            GLib.source_remove(self._expire_source)
+            self._expire_source = None
+        if self._shown:
+            delay = min(self._shown.values()) - time.monotonic()
+            self._expire_source = GLib.timeout_add(max(0, int(delay * 1000)), self._expire)
+
+    def _expire(self) -> bool:
+        """Remove the expired messages
+
+        Returns:
+            False to remove the timeout
+        """
+        self._expire_source = None
+        now = time.monotonic()
+        for context_id, expiry in list(self._shown.items()):
+            if expiry <= now:
+                self._statusbar.pop(context_id)
+                del self._shown[context_id]
+        self._schedule_expiry()
+        return False
+
+
+status_bus = StatusBus()
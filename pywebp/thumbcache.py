@@ -0,0 +1,210 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import os
+import hashlib
+import threading
+import gi
+
+gi.require_version("GdkPixbuf", "2.0")
+from gi.repository import GLib
+from gi.repository.GdkPixbuf import Pixbuf, InterpType
+from pywebp.settings import DATA_DIR
+
+SHARED_THUMBNAILS_DIR = os.path.join(GLib.get_user_cache_dir(), 'thumbnails')
+PRIVATE_THUMBNAILS_DIR = os.path.join(DATA_DIR, 'thumbnails')
+# freedesktop thumbnail sizes, from the smallest to the biggest
+FLAVOURS = [("normal", 128), ("large", 256), ("x-large", 512), ("xx-large", 1024)]
+
+
+def flavour_for(size) -> (str, int):
+    """Choose the smallest freedesktop thumbnail size able to show a thumbnail of the given size
+
+    Args:
+        size: biggest side of the requested thumbnail
+
+    Returns:
+        a (folder name, size) tuple
+    """
+    for flavour in FLAVOURS:
+        if size <= flavour[1]:
+            return flavour
+    return FLAVOURS[-1]
+
+
+class ThumbnailCache:
+    """Persistent thumbnail cache following the freedesktop thumbnail managing standard.
+
+    Thumbnails are stored as png files named after the md5 of the image URI, with the Thumb::URI and
+    Thumb::MTime attributes used to check they are still valid. The shared ~/.cache/thumbnails folder is used,
+    so thumbnails made by the file manager are reused, with a private folder under DATA_DIR as fallback when
+    the shared one can not be written.
+    """
+
+    def __init__(self, shared_dir=SHARED_THUMBNAILS_DIR, private_dir=PRIVATE_THUMBNAILS_DIR):
+        self._dirs = [shared_dir, private_dir]
+        self._write_dir = None
+        self._lock = threading.Lock()
+
+    def _writable_dir(self, flavour) -> str:
+        """Folder where new thumbnails of a size are saved, created with 0700 permissions if missing
+
+        Args:
+            flavour: freedesktop size folder name
+
+        Returns:
+            the full path of the folder, or None if no cache folder can be written
+        """
+        with self._lock:
+            if self._write_dir is None:
+                for base_dir in self._dirs:
+                    try:
+                        os.makedirs(os.path.join(base_dir, flavour), mode=0o700, exist_ok=True)
+                        if os.access(os.path.join(base_dir, flavour), os.W_OK):
+                            self._write_dir = base_dir
+                            break
+                    except OSError:
+                        continue
+                else:
+                    return None
+        path = os.path.join(self._write_dir, flavour)
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        return path
+
+    @staticmethod
+    def _uri_and_mtime(filepath) -> (str, int):
+        """URI and modification time of an image, as written in the thumbnail attributes
+
+        Args:
+            filepath: full path of the image
+
+        Returns:
+            a (uri, mtime) tuple
+        """
+        filepath = os.path.abspath(filepath)
+        return GLib.filename_to_uri(filepath, None), int(os.stat(filepath).st_mtime)
+
+    @staticmethod
+    def _fit(pixbuf, width, height) -> Pixbuf:
+        """Scale down a thumbnail to fit the requested size, keeping its aspect ratio
+
+        Args:
+            pixbuf: the thumbnail
+            width: maximum width
+            height: maximum height
+
+        Returns:
+            the scaled Pixbuf, or the same pixbuf if it already fits
+        """
+        ratio = min(width / pixbuf.get_width(), height / pixbuf.get_height())
+        if ratio >= 1:
+            return pixbuf
+        return pixbuf.scale_simple(max(1, round(pixbuf.get_width() * ratio)),
+                                   max(1, round(pixbuf.get_height() * ratio)), InterpType.BILINEAR)
+
+    def lookup(self, filepath, width, height) -> Pixbuf:
+        """Load a valid cached thumbnail of an image
+
+        Args:
+            filepath: full path of the image
+            width: maximum width of the thumbnail
+            height: maximum height of the thumbnail
+
+        Returns:
+            the thumbnail scaled to the requested size, or None if not cached or out of date
+        """
+        try:
+            uri, mtime = self._uri_and_mtime(filepath)
+        except (OSError, GLib.Error):
+            return None
+        name = hashlib.md5(uri.encode()).hexdigest() + ".png"
+        size = max(width, height)
+        flavours = [flavour for flavour in FLAVOURS if flavour[1] >= size] or FLAVOURS[-1:]
+        for base_dir in self._dirs:
+            for flavour, flavour_size in flavours:
+                path = os.path.join(base_dir, flavour, name)
+                if not os.path.exists(path):
+                    continue
+                try:
+                    pixbuf = Pixbuf.new_from_file(path)
+                except GLib.Error:
+                    continue
+                if pixbuf.get_option("tEXt::Thumb::URI") == uri \
+                        and pixbuf.get_option("tEXt::Thumb::MTime") == str(mtime):
+                    return self._fit(pixbuf, width, height)
+        return None
+
+    def load(self, filepath, width, height) -> Pixbuf:
+        """Load a thumbnail from the cache, or decode the image and save its thumbnail in the cache
+
+        Args:
+            filepath: full path of the image
+            width: maximum width of the thumbnail
+            height: maximum height of the thumbnail
+
+        Returns:
+            the thumbnail scaled to the requested size
+
+        Raises:
+            GLib.Error: if the image can not be decoded
+        """
+        pixbuf = self.lookup(filepath, width, height)
+        if pixbuf is None:
+            flavour, size = flavour_for(max(width, height))
+            # images smaller than the flavour size are never scaled up
+            _format, image_width, image_height = Pixbuf.get_file_info(filepath)
+            if _format is None or image_width <= 0 or image_height <= 0:
+                image_width = image_height = size
+            pixbuf = Pixbuf.new_from_file_at_scale(filepath, min(size, image_width), min(size, image_height), True)
+            self.save(filepath, pixbuf, flavour)
+            pixbuf = self._fit(pixbuf, width, height)
+        return pixbuf
+
+    def save(self, filepath, pixbuf, flavour):
+        """Write a thumbnail in the cache, atomically and readable only by the user
+
+        Args:
+            filepath: full path of the image
+            pixbuf: the thumbnail, scaled to the flavour size
+            flavour: freedesktop size folder name
+        """
+        filepath = os.path.abspath(filepath)
+        # never make thumbnails of thumbnails
+        if any(filepath.startswith(os.path.abspath(base_dir) + os.sep) for base_dir in self._dirs):
+            return
+        try:
+            uri, mtime = self._uri_and_mtime(filepath)
+            folder = self._writable_dir(flavour)
+            if folder is None:
+                return
+            path = os.path.join(folder, hashlib.md5(uri.encode()).hexdigest() + ".png")
+            tmp_path = "%s.pywebp-%d.tmp" % (path, threading.get_ident())
+            pixbuf.savev(tmp_path, "png",
+                         ["tEXt::Thumb::URI", "tEXt::Thumb::MTime", "tEXt::Software"],
+                         [uri, str(mtime), "PyWebP-Gtk"])
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, path)
+        except (OSError, GLib.Error) as error:
+            print("Unable to save thumbnail of %s: %s" % (filepath, error))
@@ -0,0 +1,167 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import gi
+
+gi.require_version("Gtk", "3.0")
+from gi.repository import Gtk, GLib
+from gi.repository.GdkPixbuf import Pixbuf, Colorspace
+from pywebp.probe import ProbeError, probe
+from pywebp.statusbus import status_bus
+from pywebp.thumbcache import ThumbnailCache
+
+# maximum number of thumbnails decoded at the same time
+MAX_WORKERS = min(4, os.cpu_count() or 1)
+
+
+class ThumbnailRequest:
+    """A pending thumbnail decode, returned by Thumbnailer.request to allow its cancellation.
+
+    Attributes:
+        filepath: full path of the image
+        width: maximum width of the thumbnail
+        height: maximum height of the thumbnail
+        user_data: extra arguments passed to the callback
+        info: ImageInfo of the image, probed by the worker along with the decode, None if unknown
+    """
+
+    def __init__(self, filepath, width, height, callback, user_data):
+        self.filepath = filepath
+        self.width = width
+        self.height = height
+        self.user_data = user_data
+        self.info = None
+        self._callback = callback
+        self._cancelled = threading.Event()
+        self._future = None
+
+    def cancel(self):
+        """Stop the request, its callback will not be called
+        """
+        self._cancelled.set()
+        if self._future is not None:
+            self._future.cancel()
+
+    def is_cancelled(self) -> bool:
+        """Check if the request was cancelled
+
+        Returns:
+            True if cancelled, False otherwise
+        """
+        return self._cancelled.is_set()
+
+
+class Thumbnailer:
+    """Decode thumbnails off the GTK main thread.
+
+    Images are scaled by a bounded pool of threads and the results are handed back to the main loop in batches
+    through the StatusBus, so callbacks can update the model safely. Thumbnails are read from and saved to the
+    persistent ThumbnailCache.
+    """
+
+    def __init__(self, workers=MAX_WORKERS, cache=None):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pywebp-thumbnailer")
+        self._cache = cache if cache is not None else ThumbnailCache()
+        self._placeholders = {}
+
+    def placeholder(self, width, height) -> Pixbuf:
+        """Icon shown while the thumbnail is loading or if the image can not be decoded
+
+        Args:
+            width: width of the thumbnails
+            height: height of the thumbnails
+
+        Returns:
+            a shared Pixbuf
+        """
+        size = min(width, height)
+        if size not in self._placeholders:
+            try:
+                pixbuf = Gtk.IconTheme.get_default().load_icon("image-x-generic", size,
+                                                                Gtk.IconLookupFlags.FORCE_SIZE)
+            except (GLib.Error, AttributeError):
+                # no icon theme available, use a transparent square
+                pixbuf = Pixbuf.new(Colorspace.RGB, True, 8, size, size)
+                pixbuf.fill(0x00000000)
+            self._placeholders[size] = pixbuf
+        return self._placeholders[size]
+
+    def request(self, filepath, width, height, callback, *user_data) -> ThumbnailRequest:
+        """Queue the decode of a thumbnail
+
+        Args:
+            filepath: full path of the image
+            width: maximum width of the thumbnail
+            height: maximum height of the thumbnail
+            callback: called in the main loop as callback(pixbuf, *user_data), pixbuf is None if decoding failed
+            user_data: extra arguments passed to the callback
+
+        Returns:
+            the ThumbnailRequest, to be cancelled if the result is not needed anymore
+        """
+        request = ThumbnailRequest(filepath, width, height, callback, user_data)
+        request._future = self._pool.submit(self._decode, request)
+        return request
+
+    def _decode(self, request):
+        """Decode a thumbnail in a worker thread and deliver it to the main loop
+
+        Args:
+            request: the ThumbnailRequest to decode
+        """
+        if request.is_cancelled():
+            return
+        try:
+            request.info = probe(request.filepath, count_frames=False)
+        except (ProbeError, OSError):
+            pass
+        try:
+            pixbuf = self._cache.load(request.filepath, request.width, request.height)
+        except Exception as error:
+            # any failure is delivered as a failed decode, the request must not stay pending forever
+            print("Unable to load thumbnail of %s: %s" % (request.filepath, getattr(error, "message", None) or error))
+            pixbuf = None
+        if not request.is_cancelled():
+            status_bus.call(Thumbnailer._deliver, request, pixbuf)
+
+    @staticmethod
+    def _deliver(request, pixbuf):
+        """Call the request callback in the main loop
+
+        Args:
+            request: the decoded ThumbnailRequest
+            pixbuf: the thumbnail, None if decoding failed
+
+        """
+        if not request.is_cancelled():
+            request._callback(pixbuf, *request.user_data)
+
+    def shutdown(self):
+        """Stop the worker threads once the queued requests are done
+        """
+        self._pool.shutdown(wait=False)
@@ -24,13 +24,23 @@
 #
 
 import os
+import threading
+from functools import partial
 import gi
 
 gi.require_version("Gtk", "3.0")
 from gi.repository import Gtk, GLib
 from gi.repository.GdkPixbuf import Pixbuf
 from pywebp.settings import settings
+from pywebp.statusbus import status_bus
 from pywebp import helpers
+from pywebp.cache import file_digest
+from pywebp.control import BatchControl
+from pywebp.converter import ConversionJob, ConversionQueue, Converter, input_patterns
+from pywebp.dedup import find_duplicates, find_similar
+from pywebp.report import BatchReport
+from pywebp.variants import write_manifests
+from pywebp.watcher import DirectoryWatcher
 
 
 class Toolbar(Gtk.Toolbar):
@@ -49,6 +59,7 @@ class Toolbar(Gtk.Toolbar):
         self.set_style(Gtk.ToolbarStyle.BOTH_HORIZ)
         self.set_show_arrow(False)
         self._init_toolbar()
+        settings.connect("changed", self._on_setting_changed)
 
     def _init_toolbar(self):
         """Initialize toolbar gui
@@ -61,6 +72,22 @@ class Toolbar(Gtk.Toolbar):
         add_files_btn.connect('clicked', self.choose_files)
         self.add(add_files_btn)
 
+        add_folder_btn = Gtk.ToolButton()
+        add_folder_btn.set_is_important(True)
+        add_folder_btn.set_label("Add folder")
+        add_folder_btn.set_icon_name("folder-new-symbolic")
+        add_folder_btn.connect('clicked', self.choose_folders)
+        self.add(add_folder_btn)
+
+        self._watch_btn = Gtk.ToggleToolButton()
+        self._watch_btn.set_is_important(True)
+        self._watch_btn.set_label("Watch folder")
+        self._watch_btn.set_icon_name("folder-saved-search-symbolic")
+        self._watch_btn.connect('toggled', self.toggle_watch)
+        self.add(self._watch_btn)
+        self._watcher = None
+        self._watch_queue = None
+
         separator = Gtk.SeparatorToolItem()
         self.add(separator)
         separator.set_draw(False)
@@ -78,6 +105,18 @@ class Toolbar(Gtk.Toolbar):
         separator.set_draw(False)
         separator.set_expand(True)
 
+        self._duplicates_btn = Gtk.ToolButton()
+        self._duplicates_btn.set_is_important(True)
+        self._duplicates_btn.set_label_widget(Gtk.Label("Find duplicates"))
+        self._duplicates_btn.set_icon_name("edit-find-symbolic")
+        self._duplicates_btn.connect('clicked', self.find_duplicates)
+        self.add(self._duplicates_btn)
+
+        separator = Gtk.SeparatorToolItem()
+        self.add(separator)
+        separator.set_draw(False)
+        separator.set_expand(True)
+
         select_chk_btn = Gtk.ToolItem()
         select_chk_btn.set_is_important(True)
         self._chk_all = Gtk.CheckButton.new_with_label('Select All')
@@ -103,15 +142,51 @@ class Toolbar(Gtk.Toolbar):
         separator.set_draw(False)
         separator.set_expand(True)
 
-        # TODO implement conversion routines
-        convert_btn = Gtk.ToolButton()
-        convert_btn.set_is_important(True)
-        convert_btn.set_label_widget(Gtk.Label("Convert"))
-        convert_btn.set_icon_name("emblem-photos-symbolic")
-        self.add(convert_btn)
+        self._convert_btn = Gtk.ToolButton()
+        self._convert_btn.set_is_important(True)
+        self._convert_btn.set_label_widget(Gtk.Label("Convert"))
+        self._convert_btn.set_icon_name("emblem-photos-symbolic")
+        self._convert_btn.connect('clicked', self.convert_files)
+        self.add(self._convert_btn)
+
+        self._pause_btn = Gtk.ToggleToolButton()
+        self._pause_btn.set_is_important(True)
+        self._pause_btn.set_label("Pause")
+        self._pause_btn.set_icon_name("media-playback-pause-symbolic")
+        self._pause_btn.set_sensitive(False)
+        self._pause_handler = self._pause_btn.connect('toggled', self.toggle_pause)
+        self.add(self._pause_btn)
+
+        self._cancel_btn = Gtk.ToolButton()
+        self._cancel_btn.set_is_important(True)
+        self._cancel_btn.set_label_widget(Gtk.Label("Cancel"))
+        self._cancel_btn.set_icon_name("process-stop-symbolic")
+        self._cancel_btn.set_sensitive(False)
+        self._cancel_btn.connect('clicked', self.cancel_conversion)
+        self.add(self._cancel_btn)
+        self._control = None
+
+        self._report_btn = Gtk.ToolButton()
+        self._report_btn.set_is_important(True)
+        self._report_btn.set_label_widget(Gtk.Label("Save report"))
+        self._report_btn.set_icon_name("document-save-symbolic")
+        self._report_btn.set_sensitive(False)
+        self._report_btn.connect('clicked', self.save_report)
+        self.add(self._report_btn)
+        self._report = None
 
         self.show_all()
 
+    def _on_setting_changed(self, storage, key):
+        """Keep the toolbar in sync with the settings
+
+        Args:
+            storage: the SettingStorage emitting the signal
+            key: name of the changed setting
+        """
+        if key == "to_webp":
+            self._chk_to_from.set_active(storage.get_boolean(key))
+
     def choose_files(self, action):
         """Open FileChooserDialog to pick images to be converted
 
@@ -136,17 +211,12 @@ class Toolbar(Gtk.Toolbar):
             filter.add_mime_type("image/png")
             filter.add_mime_type("image/jpeg")
             filter.add_mime_type("image/gif")
-            filter.add_pattern("*.png")
-            filter.add_pattern("*.jpg")
-            filter.add_pattern("*.gif")
-            filter.add_pattern("*.tif")
-            filter.add_pattern("*.xpm")
-            dialog.add_filter(filter)
         else:
             filter.set_name("WebP")
             filter.add_mime_type("image/webp")
-            filter.add_pattern("*.webp")
-            dialog.add_filter(filter)
+        for pattern in input_patterns(to_webp):
+            filter.add_pattern(pattern)
+        dialog.add_filter(filter)
 
         dialog.set_default_size(600, 400)
         dialog.set_default_geometry(600, 400)
@@ -159,17 +229,147 @@ class Toolbar(Gtk.Toolbar):
 
         response = dialog.run()
         if response == Gtk.ResponseType.OK:
-            for img in dialog.get_filenames():
-                self._app.iconview._model.add_to_model(img)
-
-            context_id = self._app.statusbar.get_context_id("choose_files")
-            self._app.push_status_message("Selected files added", context_id, 4)
+            self._app.iconview.add_many(dialog.get_filenames(), self._files_added)
             self._chk_to_from.set_sensitive(False)
         elif response == Gtk.ResponseType.CANCEL:
             print('cancel')
 
         dialog.destroy()
 
+    def _files_added(self, count):
+        """Callback when the chosen files are inserted in the model
+
+        Args:
+            count: number of files added
+        """
+        context_id = self._app.statusbar.get_context_id("choose_files")
+        self._app.push_status_message("%d selected files added" % count, context_id, 4)
+
+    def choose_folders(self, action):
+        """Open FileChooserDialog to pick folders whose images, subfolders included, are to be converted
+
+        Args:
+            action: component that trigger this callback
+
+        """
+        dialog = Gtk.FileChooserDialog(("Choose folders"),
+                                       None,
+                                       Gtk.FileChooserAction.SELECT_FOLDER,
+                                       (Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL,
+                                        Gtk.STOCK_OPEN, Gtk.ResponseType.OK,
+                                        )
+                                       )
+        dialog.set_select_multiple(True)
+        dialog.set_default_size(600, 400)
+        hb = dialog.get_header_bar()
+        if hb is not None:
+            hb.set_show_close_button(True)
+
+        response = dialog.run()
+        folders = dialog.get_filenames()
+        dialog.destroy()
+        if response == Gtk.ResponseType.OK:
+            self.import_files(folders)
+
+    def toggle_watch(self, btn):
+        """Start watching a folder chosen by the user, converting its new images as they are written, or stop it
+
+        Args:
+            btn: toggle button that trigger the action
+        """
+        context_id = self._app.statusbar.get_context_id("watch")
+        if not btn.get_active():
+            if self._watcher is not None:
+                self._watcher.stop()
+                self._watch_queue.close()
+                self._watcher = self._watch_queue = None
+                if len(self._app.iconview._model.get_model()) == 0:
+                    self._chk_to_from.set_sensitive(True)
+                self._app.push_status_message("Folder watch stopped", context_id, 4)
+            return
+
+        dialog = Gtk.FileChooserDialog(("Choose folder to watch"),
+                                       None,
+                                       Gtk.FileChooserAction.SELECT_FOLDER,
+                                       (Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL,
+                                        Gtk.STOCK_OPEN, Gtk.ResponseType.OK,
+                                        )
+                                       )
+        response = dialog.run()
+        folder = dialog.get_filename()
+        dialog.destroy()
+        if response != Gtk.ResponseType.OK or folder is None:
+            btn.set_active(False)
+            return
+
+        to_webp = settings.get_boolean("to_webp")
+        # a converter of its own, so the watched files never share state with the batches started by the user
+        self._watch_queue = ConversionQueue(Converter(cache=self._app.converter.cache), self._on_watched_job_done,
+                                            self._write_manifests)
+        self._watcher = DirectoryWatcher(to_webp, self._on_watched_file)
+        try:
+            self._watcher.watch(folder)
+        except GLib.Error as error:
+            self._watch_queue.close()
+            self._watcher = self._watch_queue = None
+            btn.set_active(False)
+            self._app.push_status_message("Unable to watch %s: %s" % (folder, error.message), context_id, 4)
+            return
+        self._chk_to_from.set_sensitive(False)
+        self._app.push_status_message("Watching %s" % folder, context_id, 4)
+
+    def _on_watched_file(self, path):
+        """Add a new image of the watched folder to the thumbs panel and queue its conversion
+
+        Args:
+            path: full path of the image
+        """
+        self._app.iconview.add_many([path])
+        self._watch_queue.put(self._watch_queue.converter.make_jobs([path], to_webp=self._watcher.to_webp)[0])
+
+    def _on_watched_job_done(self, job):
+        """Callback from the converter thread when an image of the watched folder is converted
+
+        Args:
+            job: the ConversionJob
+        """
+        status_bus.call(self._watched_job_done, job)
+
+    def _watched_job_done(self, job):
+        """Report the conversion of an image of the watched folder in the main loop
+
+        Args:
+            job: the ConversionJob
+        """
+        if job.status == ConversionJob.FAILED:
+            msg = "Conversion of %s failed: %s" % (os.path.basename(job.src), job.error)
+        else:
+            msg = "Converted %s" % os.path.basename(job.src)
+        context_id = self._app.statusbar.get_context_id("watch")
+        self._app.push_status_message(msg, context_id, 4)
+
+    def import_files(self, paths):
+        """Stream files and the content of folders into the thumbs panel
+
+        Args:
+            paths: full paths or Gio.File of files and folders
+        """
+        self._chk_to_from.set_sensitive(False)
+        context_id = self._app.statusbar.get_context_id("import_files")
+        self._app.push_status_message("Searching images...", context_id, 4)
+        self._app.iconview.import_paths(paths, self._files_imported)
+
+    def _files_imported(self, count):
+        """Callback when the walk of the imported folders ends
+
+        Args:
+            count: number of files found
+        """
+        context_id = self._app.statusbar.get_context_id("import_files")
+        self._app.push_status_message("%d images found" % count, context_id, 4)
+        if len(self._app.iconview._model.get_model()) == 0 and self._watcher is None:
+            self._chk_to_from.set_sensitive(True)
+
     def update_preview(self, dialog, image):
         """Handle preview image widget inside FileChooserDialog
 
@@ -222,18 +422,60 @@ class Toolbar(Gtk.Toolbar):
         """
         msg = "Selected items removed"
         items = self._app.iconview.get_selected_items()
-        removed = self._app.iconview._model.remove_selected(items)
+        removed = self._app.iconview._model.remove_selected(self._app.iconview.to_store_paths(items),
+                                                            self._app.iconview)
         if not removed:
             msg = "Unable to remove some items"
 
         if len(self._app.iconview._model.get_model()) == 0:
-            self._chk_to_from.set_sensitive(True)
+            self._chk_to_from.set_sensitive(self._watcher is None)
             self._app.toolbar.set_select_all(False)
 
         context_id = self._app.statusbar.get_context_id("remove_files")
         self._app.push_status_message(msg, context_id, 4)
 
 
+    def find_duplicates(self, btn):
+        """Search the files of the thumbs panel with identical content, and similar look if enabled, in background
+
+        Args:
+            btn: button that trigger the search
+        """
+        paths = [row[2] for row in self._app.iconview._model.get_model()]
+        cache = self._app.converter.cache
+        digest = cache.input_digest if cache is not None else file_digest
+        similar = settings.get_boolean("find_similar")
+
+        def _search():
+            duplicates = find_duplicates(paths, digest)
+            similar_groups = find_similar(paths) if similar else None
+            GLib.idle_add(self._duplicates_found, duplicates, similar_groups)
+
+        btn.set_sensitive(False)
+        threading.Thread(target=_search, name="pywebp-duplicates", daemon=True).start()
+        context_id = self._app.statusbar.get_context_id("find_duplicates")
+        self._app.push_status_message("Searching duplicates in %d files..." % len(paths), context_id, 4)
+
+    def _duplicates_found(self, duplicates, similar):
+        """Show the duplicate groups in the main loop
+
+        Args:
+            duplicates: groups of file paths with identical content
+            similar: groups of file paths of images that look the same, None if not searched
+
+        Returns:
+            False to remove the idle callback
+        """
+        self._duplicates_btn.set_sensitive(True)
+        self._app.iconview.show_duplicates(duplicates, similar or [])
+        copies = sum(len(group) - 1 for group in duplicates)
+        msg = "%d copies in %d groups, %d conversions saved" % (copies, len(duplicates), copies)
+        if similar is not None:
+            msg += ", %d groups of similar images" % len(similar)
+        context_id = self._app.statusbar.get_context_id("find_duplicates")
+        self._app.push_status_message(msg, context_id, 4)
+        return False
+
     def select_all(self, checkbox):
         """
 
@@ -261,3 +503,209 @@ class Toolbar(Gtk.Toolbar):
         """
         if isinstance(value, (bool)):
             self._chk_all.set_active(value)
+
+    def convert_files(self, btn):
+        """Convert all the files in the thumbs panel in background
+
+        Args:
+            btn: button that trigger the conversion
+        """
+        context_id = self._app.statusbar.get_context_id("convert_files")
+        paths = [row[2] for row in self._app.iconview._model.get_model()]
+        if len(paths) == 0:
+            self._app.push_status_message("No files to convert", context_id, 4)
+            return
+
+        self.start_conversion(self._app.converter.make_jobs(paths))
+
+    def start_conversion(self, jobs):
+        """Convert a batch in background, recording its progress in the journal of the application
+
+        Args:
+            jobs: list of ConversionJob to run
+        """
+        self._app.apply_converter_settings()
+        converter = self._app.converter
+        control = BatchControl()
+        report = BatchReport(len(jobs))
+        if converter.start(jobs, partial(self._on_job_done, report), self._on_conversion_finished,
+                           self._app.journal, control):
+            self._control = control
+            self._report = report
+            self._report_btn.set_sensitive(False)
+            status_bus.begin_task(len(jobs), "Converting", report.describe)
+            self._convert_btn.set_sensitive(False)
+            self._pause_btn.set_sensitive(True)
+            self._cancel_btn.set_sensitive(True)
+            msg = "Converting %d files with %d workers" % (len(jobs), converter.workers)
+        else:
+            msg = "A conversion is already running"
+        context_id = self._app.statusbar.get_context_id("convert_files")
+        self._app.push_status_message(msg, context_id, 4)
+
+    def toggle_pause(self, button):
+        """Pause or resume the running batch, suspending its encoder processes
+
+        Args:
+            button: the pause toggle button
+        """
+        if self._control is None:
+            return
+        if button.get_active():
+            self._control.pause()
+            button.set_label("Resume")
+            button.set_icon_name("media-playback-start-symbolic")
+            msg = "Conversion paused: %s" % self._describe_progress()
+        else:
+            self._control.resume()
+            button.set_label("Pause")
+            button.set_icon_name("media-playback-pause-symbolic")
+            msg = "Conversion resumed: %s" % self._describe_progress()
+        context_id = self._app.statusbar.get_context_id("convert_files")
+        self._app.push_status_message(msg, context_id, 4)
+
+    def cancel_conversion(self, button):
+        """Cancel the running batch: encoder processes are terminated and partial outputs removed,
+        finished outputs are kept
+
+        Args:
+            button: the cancel button
+        """
+        if self._control is None or not self._control.cancel():
+            return
+        self._pause_btn.set_sensitive(False)
+        self._cancel_btn.set_sensitive(False)
+        context_id = self._app.statusbar.get_context_id("convert_files")
+        self._app.push_status_message("Cancelling conversion: %s" % self._describe_progress(), context_id, 4)
+
+    def _describe_progress(self) -> str:
+        """Describe the job counts of the running batch
+
+        Returns:
+            the counts of done, failed and pending jobs
+        """
+        counts = self._control.progress()
+        pending = counts.get(ConversionJob.PENDING, 0) + counts.get(ConversionJob.RUNNING, 0)
+        return "%d done, %d failed, %d pending" % (counts.get(ConversionJob.DONE, 0),
+                                                   counts.get(ConversionJob.FAILED, 0), pending)
+
+    def save_report(self, button):
+        """Export the metrics of the last batch, as CSV or JSON depending on the chosen file name
+
+        Args:
+            button: button that trigger the export
+        """
+        if self._report is None:
+            return
+        dialog = Gtk.FileChooserDialog(("Save report"),
+                                       None,
+                                       Gtk.FileChooserAction.SAVE,
+                                       (Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL,
+                                        Gtk.STOCK_SAVE, Gtk.ResponseType.OK,
+                                        )
+                                       )
+        dialog.set_do_overwrite_confirmation(True)
+        dialog.set_current_name("pywebp-report.csv")
+        for name, pattern in (("CSV", "*.csv"), ("JSON", "*.json")):
+            file_filter = Gtk.FileFilter()
+            file_filter.set_name(name)
+            file_filter.add_pattern(pattern)
+            dialog.add_filter(file_filter)
+        hb = dialog.get_header_bar()
+        if hb is not None:
+            hb.set_show_close_button(True)
+
+        response = dialog.run()
+        path = dialog.get_filename()
+        dialog.destroy()
+        if response != Gtk.ResponseType.OK or path is None:
+            return
+        context_id = self._app.statusbar.get_context_id("save_report")
+        try:
+            self._report.write(path)
+        except OSError as error:
+            self._app.push_status_message("Unable to save the report: %s" % error, context_id, 4)
+            return
+        self._app.push_status_message("Report saved to %s" % path, context_id, 4)
+
+    def shutdown(self):
+        """Stop watching folders
+        """
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watch_queue.close()
+            self._watcher = self._watch_queue = None
+
+    @staticmethod
+    def _write_manifests(jobs):
+        """Write the manifests of the responsive variants of a batch, if any
+
+        Args:
+            jobs: list of the converted ConversionJob
+        """
+        try:
+            for manifest in write_manifests(jobs):
+                print("Variants manifest written to %s" % manifest)
+        except OSError as error:
+            print("Can not write the variants manifest: %s" % error)
+
+    @staticmethod
+    def _on_job_done(report, job):
+        """Callback from the converter threads when a job of the batch ends
+
+        Args:
+            report: the BatchReport of the batch
+            job: the ConversionJob
+        """
+        report.add(job)
+        status_bus.advance(os.path.basename(job.src), job.status == ConversionJob.FAILED)
+
+    def _on_conversion_finished(self, jobs):
+        """Callback from the converter thread when a batch ends
+
+        Args:
+            jobs: list of the converted ConversionJob
+        """
+        status_bus.call(self._conversion_finished, jobs)
+
+    def _conversion_finished(self, jobs):
+        """Report the batch result in the main loop
+
+        Args:
+            jobs: list of the converted ConversionJob
+        """
+        failed = [job for job in jobs if job.status == ConversionJob.FAILED]
+        for job in failed:
+            print("Conversion of %s failed: %s" % (job.src, job.error))
+        groups = {}
+        for job in jobs:
+            if job.duplicate_of is not None and job.status == ConversionJob.DONE:
+                groups.setdefault(job.duplicate_of, [job.duplicate_of]).append(job.src)
+        if groups:
+            self._app.iconview.show_duplicates(list(groups.values()))
+        self._write_manifests(jobs)
+        cancelled = [job for job in jobs if job.status == ConversionJob.CANCELLED]
+        msg = "Converted %d files" % (len(jobs) - len(failed) - len(cancelled))
+        if len(groups) > 0:
+            msg += ", %d copied from duplicates" % sum(len(group) - 1 for group in groups.values())
+        if len(failed) > 0:
+            msg += ", %d failed" % len(failed)
+        if len(cancelled) > 0:
+            msg += ", %d cancelled" % len(cancelled)
+        self._report.finish()
+        description = self._report.describe()
+        if description:
+            msg += ": %s" % description
+        self._report_btn.set_sensitive(True)
+        self._control = None
+        self._app.apply_converter_settings()
+        status_bus.end_task()
+        with self._pause_btn.handler_block(self._pause_handler):
+            self._pause_btn.set_active(False)
+        self._pause_btn.set_label("Pause")
+        self._pause_btn.set_icon_name("media-playback-pause-symbolic")
+        self._pause_btn.set_sensitive(False)
+        self._cancel_btn.set_sensitive(False)
+        self._convert_btn.set_sensitive(True)
+        context_id = self._app.statusbar.get_context_id("convert_files")
+        self._app.push_status_message(msg, context_id, 4)
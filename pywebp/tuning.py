@@ -0,0 +1,393 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import math
+import os
+import shlex
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import gi
+
+gi.require_version("GdkPixbuf", "2.0")
+from gi.repository import GLib, GdkPixbuf
+from pywebp.backends import ConversionError
+from pywebp.settings import settings
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# cwebp quality range searched
+MIN_QUALITY = 0
+MAX_QUALITY = 100
+# maximum number of pixels of the downscaled proxies encoded by the trials
+PROXY_PIXELS = 512 * 512
+# trial encodes run at the same time
+TRIAL_WORKERS = 4
+# full size encodes allowed to bring an output over the target size back under it
+MAX_FULL_TRIALS = 4
+# side of the square windows of the SSIM
+SSIM_WINDOW = 8
+METRICS = ("ssim", "psnr")
+
+
+def with_quality(options, quality) -> str:
+    """Replace the quality of cwebp command line options
+
+    Args:
+        options: cwebp command line options
+        quality: the new quality
+
+    Returns:
+        the options with "-q quality"
+    """
+    args = shlex.split(options)
+    kept = []
+    skip = False
+    for arg in args:
+        if skip:
+            skip = False
+        elif arg == "-q":
+            skip = True
+        else:
+            kept.append(arg)
+    return " ".join([shlex.quote(arg) for arg in kept] + ["-q", str(quality)])
+
+
+def _pixels(pixbuf):
+    """RGB pixels of a Pixbuf as a float array
+
+    Args:
+        pixbuf: the GdkPixbuf.Pixbuf
+
+    Returns:
+        a numpy array of shape (height, width, 3)
+    """
+    width, height = pixbuf.get_width(), pixbuf.get_height()
+    channels, rowstride = pixbuf.get_n_channels(), pixbuf.get_rowstride()
+    data = numpy.frombuffer(pixbuf.get_pixels(), dtype=numpy.uint8)
+    # the last row is not padded to the rowstride
+    data = numpy.pad(data, (0, height * rowstride - data.size))
+    return data.reshape(height, rowstride)[:, :width * channels].reshape(height, width, channels)[..., :3] \
+        .astype(numpy.float64)
+
+
+def psnr(reference, image) -> float:
+    """Peak signal to noise ratio of an image
+
+    Args:
+        reference: RGB array of the original image
+        image: RGB array of the encoded image, same shape
+
+    Returns:
+        the PSNR in dB, 100 for identical images
+    """
+    mse = numpy.mean((reference - image) ** 2)
+    if mse == 0:
+        return 100.0
+    return 10 * math.log10(255 ** 2 / mse)
+
+
+def _window_means(values, size):
+    """Means of all the size x size windows of a 2d array, with integral images
+
+    Args:
+        values: 2d array
+        size: side of the windows
+
+    Returns:
+        2d array of the window means
+    """
+    integral = numpy.pad(values.cumsum(0).cumsum(1), ((1, 0), (1, 0)))
+    sums = integral[size:, size:] - integral[:-size, size:] - integral[size:, :-size] + integral[:-size, :-size]
+    return sums / (size * size)
+
+
+def ssim(reference, image) -> float:
+    """Structural similarity of the luma of an image, averaged over SSIM_WINDOW windows
+
+    Args:
+        reference: RGB array of the original image
+        image: RGB array of the encoded image, same shape
+
+    Returns:
+        the SSIM, 1.0 for identical images
+    """
+    weights = numpy.array([0.299, 0.587, 0.114])
+    x = reference @ weights
+    y = image @ weights
+    size = min(SSIM_WINDOW, x.shape[0], x.shape[1])
+    c1 = (0.01 * 255) ** 2
+    c2 = (0.03 * 255) ** 2
+    mu_x = _window_means(x, size)
+    mu_y = _window_means(y, size)
+    var_x = _window_means(x * x, size) - mu_x ** 2
+    var_y = _window_means(y * y, size) - mu_y ** 2
+    cov = _window_means(x * y, size) - mu_x * mu_y
+    ssim_map = ((2 * mu_x * mu_y + c1) * (2 * cov + c2)) / ((mu_x ** 2 + mu_y ** 2 + c1) * (var_x + var_y + c2))
+    return float(ssim_map.mean())
+
+
+class QualityTuner:
+    """Search the cwebp quality of each image reaching a target output size or a minimum quality score.
+
+    The search runs on a downscaled proxy of the image: each round encodes TRIAL_WORKERS qualities in parallel and
+    narrows the range to the one where the goal switches, so a few rounds find the quality to the unit. With a
+    target size, the proxy target is scaled by the ratio of the pixel counts and the full size output is checked,
+    lowering the quality while it is over the target. Scores are computed with numpy, required by the quality
+    goals. The quality found is kept in the ConversionCache by input digest and goal.
+
+    Attributes:
+        backend: the EncoderBackend encoding the trials
+        target_size: maximum output size in bytes, None for a quality goal
+        metric: "ssim" or "psnr", None for a size goal
+        min_score: minimum score of the metric
+        cache: the ConversionCache keeping the qualities found, None to always search
+    """
+
+    def __init__(self, backend, target_size=None, metric=None, min_score=None, cache=None,
+                 workers=TRIAL_WORKERS):
+        if (target_size is None) == (metric is None):
+            raise ValueError("a tuner needs either a target size or a quality metric")
+        if metric is not None:
+            if metric not in METRICS:
+                raise ValueError("unknown metric '%s', use one of %s" % (metric, ", ".join(METRICS)))
+            if numpy is None:
+                raise ValueError("numpy is required to compute %s" % metric.upper())
+        self.backend = backend
+        self.target_size = target_size
+        self.metric = metric
+        self.min_score = min_score
+        self.cache = cache
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pywebp-tuner")
+        self._workers = workers
+
+    @staticmethod
+    def from_settings(backend, cache=None):
+        """Create the tuner chosen in settings
+
+        Args:
+            backend: the EncoderBackend encoding the trials
+            cache: the ConversionCache keeping the qualities found
+
+        Returns:
+            a QualityTuner, None if the "target_size_kb" and "min_ssim" settings are both 0
+        """
+        target_size = settings.get_integer("target_size_kb")
+        min_ssim = settings.get_integer("min_ssim_permille")
+        try:
+            if target_size > 0:
+                return QualityTuner(backend, target_size=target_size * 1024, cache=cache)
+            if min_ssim > 0:
+                return QualityTuner(backend, metric="ssim", min_score=min_ssim / 1000, cache=cache)
+        except ValueError as error:
+            print("Quality tuning disabled: %s" % error, file=sys.stderr)
+        return None
+
+    def goal(self, options) -> str:
+        """Describe the search goal, used as cache key with the input digest
+
+        Args:
+            options: cwebp command line options of the job
+
+        Returns:
+            a string with the backend, the goal and the options other than the quality
+        """
+        if self.target_size is not None:
+            target = "size<=%d" % self.target_size
+        else:
+            target = "%s>=%s" % (self.metric, self.min_score)
+        return "%s %s %s" % (self.backend.name, target, with_quality(options, 0))
+
+    def tune(self, job, control=None) -> int:
+        """Find the quality of a job, from the cache or with a search
+
+        Args:
+            job: the ConversionJob, converted to webp
+            control: the BatchControl of the batch running the job, None if not controlled
+
+        Returns:
+            the cwebp quality
+
+        Raises:
+            ConversionError: if the image can not be read or encoded
+            BatchCancelled: if the batch is cancelled
+        """
+        goal = self.goal(job.options)
+        digest = None
+        if self.cache is not None:
+            digest = self.cache.input_digest(job.src)
+            quality = self.cache.tuned_quality(digest, goal)
+            if quality is not None:
+                return quality
+        try:
+            pixbuf = GdkPixbuf.Pixbuf.new_from_file(job.src)
+        except GLib.Error as error:
+            raise ConversionError(error.message)
+        with tempfile.TemporaryDirectory(prefix="pywebp-tune-") as folder:
+            quality = self._search(pixbuf, job, folder, control)
+        if digest is not None:
+            self.cache.store_tuned_quality(digest, goal, quality)
+        return quality
+
+    def _search(self, pixbuf, job, folder, control=None) -> int:
+        """Search the quality of an image on its proxy
+
+        Args:
+            pixbuf: the decoded image
+            job: the ConversionJob
+            folder: temporary folder of the trials
+            control: the BatchControl of the batch, passed to the backend
+
+        Returns:
+            the cwebp quality
+        """
+        width, height = pixbuf.get_width(), pixbuf.get_height()
+        scale = min(1.0, math.sqrt(PROXY_PIXELS / (width * height)))
+        proxy = pixbuf
+        if scale < 1.0:
+            proxy = pixbuf.scale_simple(max(1, round(width * scale)), max(1, round(height * scale)),
+                                        GdkPixbuf.InterpType.BILINEAR)
+        proxy_path = os.path.join(folder, "proxy.png")
+        try:
+            proxy.savev(proxy_path, "png", [], [])
+        except GLib.Error as error:
+            raise ConversionError(error.message)
+
+        if self.target_size is not None:
+            proxy_target = self.target_size * (proxy.get_width() * proxy.get_height()) / (width * height)
+            # smallest quality over the target, the one below fits
+            quality = self._boundary(lambda q: self._trial_size(proxy_path, job.options, q, folder, control)
+                                     > proxy_target)
+            quality = max(MIN_QUALITY, quality - 1)
+            if scale < 1.0:
+                quality = self._fit_full_size(job, quality, folder, control)
+            return quality
+
+        reference = _pixels(proxy)
+        score = psnr if self.metric == "psnr" else ssim
+        quality = self._boundary(lambda q: score(reference,
+                                                 self._trial_pixels(proxy_path, job.options, q, folder, control))
+                                 >= self.min_score)
+        return min(quality, MAX_QUALITY)
+
+    def _boundary(self, predicate, low=MIN_QUALITY, high=MAX_QUALITY) -> int:
+        """Smallest quality where a predicate, False for low qualities and True for high ones, becomes True
+
+        Each round evaluates the predicate in parallel on qualities spread over the remaining range.
+
+        Args:
+            predicate: function of the quality
+            low: lowest quality searched
+            high: highest quality searched
+
+        Returns:
+            the quality, high + 1 if the predicate is never True
+        """
+        high += 1
+        while low < high:
+            count = min(self._workers, high - low)
+            qualities = sorted({low + (high - low) * index // (count + 1) for index in range(1, count + 1)})
+            results = list(self._pool.map(predicate, qualities))
+            for quality, result in zip(qualities, results):
+                if result:
+                    high = quality
+                    break
+                low = quality + 1
+        return low
+
+    def _trial(self, src, options, quality, folder, control=None) -> str:
+        """Encode a trial
+
+        Args:
+            src: full path of the image
+            options: cwebp command line options
+            quality: cwebp quality
+            folder: temporary folder of the trials
+            control: the BatchControl of the batch, passed to the backend
+
+        Returns:
+            full path of the encoded trial
+        """
+        name = "proxy" if os.path.dirname(src) == folder else "full"
+        dst = os.path.join(folder, "%s-%d.webp" % (name, quality))
+        if not os.path.exists(dst):
+            self.backend.encode(src, dst, with_quality(options, quality), control)
+        return dst
+
+    def _trial_size(self, src, options, quality, folder, control=None) -> int:
+        """Output size of a trial
+
+        Returns:
+            the size in bytes
+        """
+        return os.path.getsize(self._trial(src, options, quality, folder, control))
+
+    def _trial_pixels(self, src, options, quality, folder, control=None):
+        """Decoded pixels of a trial
+
+        Returns:
+            RGB array of the decoded trial
+        """
+        trial = self._trial(src, options, quality, folder, control)
+        decoded = trial + ".png"
+        self.backend.decode(trial, decoded, control=control)
+        try:
+            return _pixels(GdkPixbuf.Pixbuf.new_from_file(decoded))
+        except GLib.Error as error:
+            raise ConversionError(error.message)
+
+    def _fit_full_size(self, job, quality, folder, control=None) -> int:
+        """Lower the quality found on the proxy while the full size output is over the target
+
+        Args:
+            job: the ConversionJob
+            quality: quality found on the proxy
+            folder: temporary folder of the trials
+            control: the BatchControl of the batch, passed to the backend
+
+        Returns:
+            the highest quality checked whose full size output fits, MIN_QUALITY if none fits
+        """
+        if self._trial_size(job.src, job.options, quality, folder, control) <= self.target_size:
+            return quality
+        # the proxy overestimated the quality, bisect below it
+        low, high = MIN_QUALITY, quality
+        for _ in range(MAX_FULL_TRIALS - 1):
+            if high - low <= 1:
+                break
+            middle = (low + high) // 2
+            if self._trial_size(job.src, job.options, middle, folder, control) <= self.target_size:
+                low = middle
+            else:
+                high = middle
+        return low
+
+    def shutdown(self):
+        """Stop the trial threads
+        """
+        self._pool.shutdown(wait=False)
@@ -0,0 +1,248 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import gi
+
+gi.require_version("GdkPixbuf", "2.0")
+from gi.repository import GLib, GdkPixbuf
+from pywebp.backends import ConversionError
+from pywebp.settings import settings
+
+# widths generated when variants are enabled without a list
+DEFAULT_WIDTHS = [320, 640, 1280, 2560]
+# manifest written in each output folder
+MANIFEST_NAME = "variants.json"
+# variants encoded at the same time for each image
+VARIANT_WORKERS = 4
+# lock of each manifest path, held while the manifest is read, merged and replaced
+_manifest_locks = {}
+_manifest_locks_lock = threading.Lock()
+
+
+def variant_path(dst, width) -> str:
+    """Path of a variant of an output
+
+    Args:
+        dst: full path of the output image
+        width: width of the variant
+
+    Returns:
+        full path of the variant, like "photo-640w.webp"
+    """
+    name, ext = os.path.splitext(dst)
+    return "%s-%dw%s" % (name, width, ext)
+
+
+class VariantGenerator:
+    """Encode each image at several widths for responsive pages, decoding it once.
+
+    The image is decoded once and scaled down level by level, from the widest variant to the narrowest, each level
+    from the previous one; the levels are then encoded in parallel. Widths larger than the image are skipped,
+    images are never scaled up. Backends able to encode a Pixbuf encode the levels directly, the others encode a
+    temporary lossless copy.
+
+    With those backends the Converter also encodes the full size output from the Pixbuf decoded here, so the source
+    is decoded once per image. The cwebp backend decodes the source itself for the full size output, the variants
+    then cost a second decode.
+
+    Attributes:
+        backend: the EncoderBackend encoding the variants
+        widths: widths of the variants
+    """
+
+    def __init__(self, backend, widths=None, workers=VARIANT_WORKERS):
+        self.backend = backend
+        self.widths = sorted(set(widths if widths else DEFAULT_WIDTHS), reverse=True)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pywebp-variants")
+
+    @staticmethod
+    def from_settings(backend):
+        """Create the generator chosen in settings
+
+        Args:
+            backend: the EncoderBackend encoding the variants
+
+        Returns:
+            a VariantGenerator for the "variant_widths" setting, None if "variants_enabled" is False
+        """
+        if not settings.get_boolean("variants_enabled"):
+            return None
+        return VariantGenerator(backend, [width for width in settings.get_integer_list("variant_widths") if width > 0])
+
+    @staticmethod
+    def decode(src):
+        """Decode a source image
+
+        Args:
+            src: full path of the image
+
+        Returns:
+            the GdkPixbuf.Pixbuf
+
+        Raises:
+            ConversionError: if the image can not be decoded
+        """
+        try:
+            return GdkPixbuf.Pixbuf.new_from_file(src)
+        except GLib.Error as error:
+            raise ConversionError(error.message)
+
+    def generate(self, job, control=None, pixbuf=None) -> [dict]:
+        """Write the variants of a job next to its output
+
+        Args:
+            job: the ConversionJob, converted to webp
+            control: the BatchControl of the batch running the job, None if not controlled
+            pixbuf: the source already decoded for the full size output, None to decode it
+
+        Returns:
+            a list of dict with width, height, path and bytes of each variant, widest first
+
+        Raises:
+            ConversionError: if the image can not be decoded or a variant can not be encoded
+            BatchCancelled: if the batch is cancelled
+        """
+        if pixbuf is None:
+            pixbuf = self.decode(job.src)
+        levels = []
+        level = pixbuf
+        for width in self.widths:
+            if width >= pixbuf.get_width():
+                continue
+            height = max(1, round(pixbuf.get_height() * width / pixbuf.get_width()))
+            level = level.scale_simple(width, height, GdkPixbuf.InterpType.HYPER if level is pixbuf
+                                       else GdkPixbuf.InterpType.BILINEAR)
+            levels.append(level)
+        with tempfile.TemporaryDirectory(prefix="pywebp-variants-") as folder:
+            return list(self._pool.map(lambda level: self._encode(level, job, folder, control), levels))
+
+    def _encode(self, level, job, folder, control=None) -> dict:
+        """Encode a level of the pyramid
+
+        Args:
+            level: the scaled Pixbuf
+            job: the ConversionJob
+            folder: temporary folder for the lossless copies
+            control: the BatchControl of the batch, passed to the backend
+
+        Returns:
+            dict with width, height, path and bytes of the variant
+        """
+        # imported here, the converter imports this module
+        from pywebp.converter import partial_path
+        dst = variant_path(job.dst, level.get_width())
+        partial = partial_path(dst)
+        try:
+            if hasattr(self.backend, "encode_pixbuf"):
+                self.backend.encode_pixbuf(level, partial, job.options)
+            else:
+                copy = os.path.join(folder, "%d.png" % level.get_width())
+                level.savev(copy, "png", ["compression"], ["1"])
+                self.backend.encode(copy, partial, job.options, control)
+            os.replace(partial, dst)
+        except Exception as error:
+            try:
+                os.remove(partial)
+            except OSError:
+                pass
+            if isinstance(error, (GLib.Error, OSError)):
+                raise ConversionError(getattr(error, "message", None) or str(error))
+            raise
+        return {"width": level.get_width(), "height": level.get_height(), "path": dst,
+                "bytes": os.path.getsize(dst)}
+
+    def shutdown(self):
+        """Stop the encoding threads
+        """
+        self._pool.shutdown(wait=False)
+
+
+def write_manifests(jobs, path=None) -> [str]:
+    """Write the JSON manifests mapping each source to its variants, ready for srcset attributes
+
+    Entries of sources already in a manifest are replaced, the others are kept. Paths are relative to the folder
+    of the manifest. The manifest is replaced atomically.
+
+    Args:
+        jobs: list of ConversionJob with their variants
+        path: full path of a single manifest for all the jobs. Default is a MANIFEST_NAME file in each output folder
+
+    Returns:
+        the full paths of the written manifests
+    """
+    manifests = {}
+    for job in jobs:
+        if job.variants:
+            manifest = path if path is not None else os.path.join(os.path.dirname(job.dst), MANIFEST_NAME)
+            manifests.setdefault(os.path.abspath(manifest), []).append(job)
+
+    for manifest, manifest_jobs in manifests.items():
+        with _manifest_locks_lock:
+            lock = _manifest_locks.setdefault(manifest, threading.Lock())
+        # batches and the folder watch may update the same manifest at once
+        with lock:
+            _update_manifest(manifest, manifest_jobs)
+    return list(manifests)
+
+
+def _update_manifest(manifest, jobs):
+    """Merge the variants of some jobs into a manifest and replace it atomically
+
+    Args:
+        manifest: full path of the manifest
+        jobs: list of the ConversionJob written in the manifest
+    """
+    folder = os.path.dirname(manifest)
+    try:
+        with open(manifest) as manifest_file:
+            entries = json.load(manifest_file)
+    except (OSError, ValueError):
+        entries = {}
+    for job in jobs:
+        variants = [dict(variant, path=os.path.relpath(variant["path"], folder)) for variant in job.variants]
+        entries[os.path.relpath(job.src, folder)] = {
+            "output": os.path.relpath(job.dst, folder),
+            "bytes": os.path.getsize(job.dst) if os.path.exists(job.dst) else None,
+            "variants": variants,
+            "srcset": ", ".join("%s %dw" % (variant["path"], variant["width"]) for variant in reversed(variants)),
+        }
+    # a unique temporary name, never shared with another writer
+    manifest_file = tempfile.NamedTemporaryFile("w", dir=folder, prefix=MANIFEST_NAME + ".", suffix=".tmp",
+                                                delete=False)
+    try:
+        with manifest_file:
+            json.dump(entries, manifest_file, indent=4, sort_keys=True)
+            manifest_file.write("\n")
+        # temporary files are private, the manifest is published next to the images
+        os.chmod(manifest_file.name, 0o644)
+        os.replace(manifest_file.name, manifest)
+    except BaseException:
+        os.remove(manifest_file.name)
+        raise
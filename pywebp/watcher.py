@@ -0,0 +1,206 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import os
+import sys
+import gi
+
+gi.require_version("Gtk", "3.0")
+from gi.repository import Gio, GLib
+from pywebp.converter import is_input_file
+
+# milliseconds between two checks of the size of the files being written
+SETTLE_INTERVAL = 500
+
+
+class DirectoryWatcher:
+    """Watch directories with Gio.FileMonitor and report the new images once they are completely written.
+
+    A file is ready when its writer closes it (CHANGES_DONE_HINT), when it is moved into the directory, or when
+    its size and mtime did not change for settle_interval milliseconds, for the mounts whose monitors do not send
+    hints. Only the files named in the events are checked, directories are never scanned again.
+    Callbacks are invoked in the GLib main loop, which must be running.
+
+    Attributes:
+        to_webp: True if the images are converted to webp, used to filter the files
+        recursive: True to watch the sub-directories too, including the ones created later
+    """
+
+    def __init__(self, to_webp, on_ready, recursive=False, settle_interval=SETTLE_INTERVAL):
+        """
+        Args:
+            to_webp: True if the images are converted to webp, False otherwise
+            on_ready: callback called with the full path of each new image completely written
+            recursive: True to watch the sub-directories too
+            settle_interval: milliseconds the size of a file must stay the same to consider it written
+        """
+        self.to_webp = to_webp
+        self.recursive = recursive
+        self._on_ready = on_ready
+        self._settle_interval = settle_interval
+        self._monitors = {}
+        # last (size, mtime) of the files being written, by path
+        self._pending = {}
+        self._timer_id = None
+
+    def watch(self, folder):
+        """Start watching a directory, and its sub-directories if recursive
+
+        Args:
+            folder: full path of the directory
+
+        Raises:
+            GLib.Error: if the directory can not be monitored
+        """
+        folder = os.path.abspath(folder)
+        if folder in self._monitors:
+            return
+        monitor = Gio.File.new_for_path(folder).monitor_directory(Gio.FileMonitorFlags.WATCH_MOVES, None)
+        monitor.connect("changed", self._on_changed)
+        self._monitors[folder] = monitor
+        if self.recursive:
+            try:
+                with os.scandir(folder) as entries:
+                    subfolders = [entry.path for entry in entries if entry.is_dir(follow_symlinks=False)]
+            except OSError as error:
+                print("Unable to read %s: %s" % (folder, error), file=sys.stderr)
+                return
+            for subfolder in subfolders:
+                self.watch(subfolder)
+
+    def folders(self) -> [str]:
+        """Watched directories
+
+        Returns:
+            the full paths of the watched directories
+        """
+        return list(self._monitors)
+
+    def stop(self):
+        """Stop watching every directory and forget the files being written
+        """
+        for monitor in self._monitors.values():
+            monitor.cancel()
+        self._monitors.clear()
+        self._pending.clear()
+        if self._timer_id is not None:
+            GLib.source_remove(self._timer_id)
+            self._timer_id = None
+
+    def _on_changed(self, monitor, gfile, other_file, event_type):
+        """Follow the events of a watched directory
+
+        Args:
+            monitor: the Gio.FileMonitor
+            gfile: the Gio.File of the event
+            other_file: the new Gio.File of a rename, None otherwise
+            event_type: the Gio.FileMonitorEvent
+        """
+        if event_type == Gio.FileMonitorEvent.RENAMED:
+            # the old name is gone, the new one is written
+            self._pending.pop(gfile.get_path(), None)
+            gfile, event_type = other_file, Gio.FileMonitorEvent.MOVED_IN
+        path = gfile.get_path() if gfile is not None else None
+        if path is None:
+            return
+
+        if event_type in (Gio.FileMonitorEvent.DELETED, Gio.FileMonitorEvent.MOVED_OUT):
+            self._pending.pop(path, None)
+            monitor = self._monitors.pop(path, None)
+            if monitor is not None:
+                monitor.cancel()
+        elif event_type in (Gio.FileMonitorEvent.CREATED, Gio.FileMonitorEvent.MOVED_IN) and os.path.isdir(path):
+            if self.recursive:
+                self.watch(path)
+                # files may be written before the monitor of the new directory is ready
+                self._add_existing(path)
+        elif not is_input_file(path, self.to_webp):
+            return
+        elif event_type in (Gio.FileMonitorEvent.CHANGES_DONE_HINT, Gio.FileMonitorEvent.MOVED_IN):
+            self._pending.pop(path, None)
+            if os.path.isfile(path):
+                self._on_ready(path)
+        elif event_type in (Gio.FileMonitorEvent.CREATED, Gio.FileMonitorEvent.CHANGED):
+            self._add_pending(path)
+
+    def _add_existing(self, folder):
+        """Check the images already in a new directory
+
+        Args:
+            folder: full path of the directory
+        """
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.is_file() and is_input_file(entry.name, self.to_webp):
+                        self._add_pending(entry.path)
+        except OSError as error:
+            print("Unable to read %s: %s" % (folder, error), file=sys.stderr)
+
+    def _add_pending(self, path):
+        """Wait for the size of a file to settle
+
+        Args:
+            path: full path of the file being written
+        """
+        self._pending[path] = self._stat(path)
+        if self._timer_id is None:
+            self._timer_id = GLib.timeout_add(self._settle_interval, self._check_pending)
+
+    @staticmethod
+    def _stat(path):
+        """Size and mtime of a file
+
+        Args:
+            path: full path of the file
+
+        Returns:
+            (size, mtime in nanoseconds), None if the file is missing
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def _check_pending(self):
+        """Report the pending files whose size did not change since the last check
+
+        Returns:
+            True to check again while some files are pending, False to remove the timeout
+        """
+        for path, last in list(self._pending.items()):
+            current = self._stat(path)
+            if current is None:
+                del self._pending[path]
+            elif current == last and current[0] > 0:
+                del self._pending[path]
+                self._on_ready(path)
+            else:
+                self._pending[path] = current
+        if self._pending:
+            return True
+        self._timer_id = None
+        return False
@@ -7,6 +7,7 @@ setup(
     packages=['pywebp'],
     scripts=['pywebp/pywebp'],
     install_requires=['PyGObject'],
+    extras_require={'tuning': ['numpy']},
     description="A converter for WebP image format",
     license="MIT",
     url="https://github.com/tudo75/PyWebP-Gtk",
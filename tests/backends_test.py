@@ -0,0 +1,117 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import os
+import tempfile
+from unittest import TestCase, main, mock
+
+from pywebp import converter
+from pywebp.backends import ConversionError, EncoderBackend, LibwebpBackend, WebptoolsBackend
+from pywebp.converter import ConversionJob, Converter
+
+
+class FakeBackend(EncoderBackend):
+    """Backend recording the images it is asked to convert."""
+
+    name = "fake"
+
+    def __init__(self):
+        self.converted = []
+
+    def encode(self, src, dst, options="", control=None):
+        self.converted.append(src)
+        with open(dst, "wb") as output:
+            output.write(b"webp")
+        return {}
+
+
+class BackendOptionsTest(TestCase):
+    """Encoder backend options validation Tests.
+    """
+
+    def test_check_options(self):
+        backend = EncoderBackend()
+        self.assertEqual(backend.check_options(""), [])
+        self.assertEqual(backend.check_options("-q 80 -metadata 'exif,icc'"), ["-q", "80", "-metadata", "exif,icc"])
+
+    def test_check_options_unbalanced_quote(self):
+        with self.assertRaisesRegex(ConversionError, "invalid options"):
+            EncoderBackend().check_options("-q 80 -metadata 'exif")
+
+    def test_webptools_checked_before_running(self):
+        backend = WebptoolsBackend()
+        with mock.patch.object(backend, "_run") as run:
+            with self.assertRaises(ConversionError):
+                backend.encode("a.png", "a.webp", "-q '80")
+            backend.encode("a.png", "a.webp", "-q 80")
+        run.assert_called_once_with(["cwebp", "-v", "-q", "80", "a.png", "-o", "a.webp"], None)
+
+    def test_parse_options(self):
+        backend = LibwebpBackend()
+        self.assertEqual(backend._parse_options(""), (75.0, False))
+        self.assertEqual(backend._parse_options("-q 90.5 -lossless"), (90.5, True))
+        self.assertEqual(backend._parse_options("-lossless -q 0"), (0.0, True))
+        # a trailing -q without value keeps the default quality
+        self.assertEqual(backend._parse_options("-q"), (75.0, False))
+
+    def test_parse_options_invalid_quality(self):
+        backend = LibwebpBackend()
+        with self.assertRaisesRegex(ConversionError, "invalid quality 'high'"):
+            backend._parse_options("-q high")
+        for quality in ("-1", "100.5"):
+            with self.assertRaisesRegex(ConversionError, "out of the 0-100 range"):
+                backend._parse_options("-q " + quality)
+
+    def test_libwebp_check_options(self):
+        backend = LibwebpBackend()
+        self.assertEqual(backend.check_options("-q 50 -m 6"), ["-q", "50", "-m", "6"])
+        with self.assertRaises(ConversionError):
+            backend.check_options("-q 500")
+        with self.assertRaises(ConversionError):
+            backend.check_options("-q '50")
+
+    def test_job_failed_before_encoding(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            src = os.path.join(tmp_dir, "a.png")
+            with open(src, "wb") as image_file:
+                image_file.write(b"png")
+            backend = FakeBackend()
+            with mock.patch.object(converter, "ConversionCache", lambda: None):
+                job_converter = Converter(workers=1, backend=backend)
+            job_converter.tuner = job_converter.variants = None
+            job = ConversionJob(src, os.path.join(tmp_dir, "a.webp"), True, "-q 'bad")
+            job_converter.convert_job(job)
+            self.assertEqual(job.status, ConversionJob.FAILED)
+            self.assertIn("invalid options", job.error)
+            self.assertEqual(backend.converted, [])
+            self.assertEqual(os.listdir(tmp_dir), ["a.png"])
+            job = ConversionJob(src, os.path.join(tmp_dir, "a.webp"), True, "-q 80")
+            job_converter.convert_job(job)
+            self.assertEqual(job.status, ConversionJob.DONE)
+            self.assertEqual(backend.converted, [src])
+
+
+if __name__ == '__main__':
+    main()
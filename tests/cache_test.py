@@ -0,0 +1,135 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import itertools
+import os
+import tempfile
+from types import SimpleNamespace
+from unittest import TestCase, main, mock
+
+from pywebp import cache
+from pywebp.cache import ConversionCache
+
+
+class ConversionCacheTest(TestCase):
+    """Conversion cache Tests.
+    """
+
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.folder = self._tmp_dir.name
+        self.cache = ConversionCache(os.path.join(self.folder, "cache"), max_bytes=250)
+        # strictly increasing access times
+        clock = itertools.count(1)
+        patcher = mock.patch.object(cache, "time", SimpleNamespace(time=lambda: next(clock)))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def _file(self, name, content):
+        path = os.path.join(self.folder, name)
+        with open(path, "wb") as out_file:
+            out_file.write(content)
+        return path
+
+    def _key(self, src, backend="webptools", to_webp=True, options="-q 80"):
+        return self.cache.make_key(SimpleNamespace(src=src, to_webp=to_webp, options=options), backend)
+
+    def _store(self, name, size):
+        key = self._key(self._file(name + ".png", name.encode()))
+        self.assertTrue(self.cache.store(key, self._file(name + ".webp", b"x" * size)))
+        return key
+
+    def _hit(self, key):
+        return self.cache.fetch(key, os.path.join(self.folder, "out.webp"))
+
+    def test_key(self):
+        key = self._key(self._file("a.png", b"pixels"))
+        # same bytes under another name
+        self.assertEqual(self._key(self._file("b.png", b"pixels")), key)
+        self.assertNotEqual(self._key(self._file("c.png", b"other")), key)
+        self.assertNotEqual(self._key(os.path.join(self.folder, "a.png"), backend="libwebp"), key)
+        self.assertNotEqual(self._key(os.path.join(self.folder, "a.png"), to_webp=False), key)
+        self.assertNotEqual(self._key(os.path.join(self.folder, "a.png"), options="-q 81"), key)
+
+    def test_digest_remembered(self):
+        src = self._file("a.png", b"pixels")
+        with mock.patch.object(cache, "file_digest", wraps=cache.file_digest) as digest:
+            self.cache.input_digest(src)
+            self.cache.input_digest(src)
+            self.assertEqual(digest.call_count, 1)
+            with open(src, "ab") as in_file:
+                in_file.write(b"more")
+            os.utime(src, ns=(0, 0))
+            self.cache.input_digest(src)
+            self.assertEqual(digest.call_count, 2)
+
+    def test_hit_and_miss(self):
+        key = self._store("a", 100)
+        self.assertTrue(self._hit(key))
+        with open(os.path.join(self.folder, "out.webp"), "rb") as out_file:
+            self.assertEqual(out_file.read(), b"x" * 100)
+        self.assertFalse(self._hit(self._key(self._file("b.png", b"b"))))
+
+    def test_evict_least_recently_used(self):
+        first = self._store("a", 100)
+        second = self._store("b", 100)
+        self.assertTrue(self._hit(first))
+        third = self._store("c", 100)
+        self.assertFalse(self._hit(second))
+        self.assertTrue(self._hit(first))
+        self.assertTrue(self._hit(third))
+        self.assertEqual(self.cache.info()["size"], 200)
+
+    def test_too_big(self):
+        key = self._key(self._file("a.png", b"a"))
+        self.assertFalse(self.cache.store(key, self._file("a.webp", b"x" * 300)))
+        self.assertFalse(self._hit(key))
+
+    def test_store_failure(self):
+        key = self._key(self._file("a.png", b"a"))
+        output = self._file("a.webp", b"x" * 10)
+        with mock.patch.object(cache.shutil, "copyfile", side_effect=OSError(28, "No space left on device")):
+            self.assertFalse(self.cache.store(key, output))
+        self.assertFalse(self._hit(key))
+        self.assertEqual(self.cache.info()["entries"], 0)
+
+    def test_info_and_clear(self):
+        self._store("a", 100)
+        self._store("b", 50)
+        self.cache.store_tuned_quality("digest", "goal", 42)
+        info = self.cache.info()
+        self.assertEqual((info["entries"], info["size"], info["max_size"]), (2, 150, 250))
+        self.cache.clear()
+        info = self.cache.info()
+        self.assertEqual((info["entries"], info["size"]), (0, 0))
+        self.assertIsNone(self.cache.tuned_quality("digest", "goal"))
+        self.assertEqual(os.listdir(os.path.join(self.cache.path, "objects")), [])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import contextlib
+import io
+import json
+import os
+import tempfile
+from unittest import TestCase, main, mock
+
+from pywebp import cli, converter
+from pywebp.backends import ConversionError, EncoderBackend
+
+
+class FakeBackend(EncoderBackend):
+    """Backend failing the images whose name starts with "bad"."""
+
+    name = "fake"
+
+    def encode(self, src, dst, options="", control=None):
+        if os.path.basename(src).startswith("bad"):
+            raise ConversionError("can not encode %s" % src)
+        with open(dst, "wb") as output:
+            output.write(b"webp")
+        return {}
+
+
+class CliTest(TestCase):
+    """Headless mode Tests.
+    """
+
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        for patcher in (mock.patch.object(cli, "get_backend", lambda name=None: FakeBackend()),
+                        mock.patch.object(converter, "ConversionCache", lambda: None)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def _image(self, name):
+        path = os.path.join(self._tmp_dir.name, name)
+        with open(path, "wb") as image_file:
+            image_file.write(name.encode())
+        return path
+
+    def _main(self, *args):
+        """Run the headless mode
+
+        Returns:
+            (the exit code, the list of events printed on stdout)
+        """
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            code = cli.main(list(args))
+        return code, [json.loads(line) for line in stdout.getvalue().splitlines()]
+
+    def test_is_headless(self):
+        self.assertTrue(cli.is_headless(["convert", "a.png"]))
+        self.assertTrue(cli.is_headless(["cache"]))
+        self.assertFalse(cli.is_headless([]))
+        self.assertFalse(cli.is_headless(["a.png"]))
+
+    def test_emit(self):
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            cli.emit("start", total=2)
+            cli.emit("error", message="multi\nline")
+        self.assertEqual(stdout.getvalue().splitlines(),
+                         ['{"total": 2, "event": "start"}', '{"message": "multi\\nline", "event": "error"}'])
+
+    def test_convert(self):
+        sources = [self._image("a.png"), self._image("b.png")]
+        code, events = self._main("convert", "--to-webp", "--no-cache", "-j", "2", *sources)
+        self.assertEqual(code, cli.EXIT_OK)
+        self.assertEqual([event["event"] for event in events], ["start", "job", "job", "end"])
+        self.assertEqual(events[0]["total"], 2)
+        self.assertEqual(events[0]["backend"], "fake")
+        self.assertEqual(sorted(event["src"] for event in events[1:3]), sources)
+        self.assertEqual({event["status"] for event in events[1:3]}, {"done"})
+        self.assertEqual(events[-1]["done"], 2)
+        self.assertTrue(os.path.isfile(os.path.join(self._tmp_dir.name, "a.webp")))
+
+    def test_convert_failed(self):
+        sources = [self._image("a.png"), self._image("bad.png")]
+        code, events = self._main("convert", "--to-webp", "--no-cache", *sources)
+        self.assertEqual(code, cli.EXIT_FAILED)
+        failed = [event for event in events if event["event"] == "job" and event["status"] == "failed"]
+        self.assertEqual([event["src"] for event in failed], [sources[1]])
+        self.assertIn("can not encode", failed[0]["error"])
+        self.assertEqual(events[-1]["event"], "end")
+        self.assertEqual((events[-1]["done"], events[-1]["failed"]), (1, 1))
+
+    def test_report_not_written(self):
+        source = self._image("a.png")
+        report = os.path.join(self._tmp_dir.name, "missing", "report.json")
+        code, events = self._main("convert", "--to-webp", "--no-cache", "--report", report, source)
+        self.assertEqual(code, cli.EXIT_FAILED)
+        self.assertEqual(events[-1]["event"], "error")
+
+    def test_no_input_files(self):
+        code, events = self._main("convert", "--to-webp", "--no-cache", os.path.join(self._tmp_dir.name, "*.png"))
+        self.assertEqual(code, cli.EXIT_USAGE)
+        self.assertEqual(events, [{"message": "no input files found", "event": "error"}])
+
+    def test_invalid_workers(self):
+        code, events = self._main("convert", "--to-webp", "-j", "0", self._image("a.png"))
+        self.assertEqual(code, cli.EXIT_USAGE)
+        self.assertEqual(events[0]["event"], "error")
+
+    def test_invalid_arguments(self):
+        for args in (["resize"], ["convert"], ["convert", "--widths", "0,320", "a.png"]):
+            with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit) as raised:
+                cli.main(args)
+            self.assertEqual(raised.exception.code, cli.EXIT_USAGE)
+
+    def test_watch_not_a_directory(self):
+        code, events = self._main("watch", "--no-cache", self._image("a.png"))
+        self.assertEqual(code, cli.EXIT_USAGE)
+        self.assertEqual(events[0]["event"], "error")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import sys
+import threading
+import time
+from unittest import TestCase, main
+
+from pywebp.control import BatchCancelled, BatchControl
+
+SLEEP = [sys.executable, "-c", "import time; time.sleep(10)"]
+
+
+class FakeJob:
+
+    def __init__(self, status):
+        self.status = status
+
+
+class BatchControlTest(TestCase):
+    """Batch pause and cancel Tests.
+    """
+
+    def setUp(self):
+        self.control = BatchControl()
+
+    def _run_in_thread(self, args):
+        result = {}
+
+        def _run():
+            try:
+                result["process"] = self.control.run(args)
+            except BatchCancelled:
+                result["cancelled"] = True
+
+        thread = threading.Thread(target=_run)
+        thread.start()
+        return thread, result
+
+    def test_run(self):
+        process = self.control.run([sys.executable, "-c", "print('ok')"])
+        self.assertEqual(process.returncode, 0)
+        self.assertEqual(process.stdout.strip(), b"ok")
+
+    def test_cancel_terminates(self):
+        thread, result = self._run_in_thread(SLEEP)
+        time.sleep(0.2)
+        start = time.monotonic()
+        self.assertTrue(self.control.cancel())
+        thread.join(5)
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertTrue(result.get("cancelled"))
+        self.assertFalse(self.control.wait())
+        self.assertRaises(BatchCancelled, self.control.run, SLEEP)
+
+    def test_cancel_paused(self):
+        thread, result = self._run_in_thread(SLEEP)
+        time.sleep(0.2)
+        self.assertTrue(self.control.pause())
+        self.assertFalse(self.control.pause())
+        self.control.cancel()
+        thread.join(5)
+        self.assertTrue(result.get("cancelled"))
+
+    def test_pause_holds_wait(self):
+        self.control.pause()
+        waited = []
+        thread = threading.Thread(target=lambda: waited.append(self.control.wait()))
+        thread.start()
+        thread.join(0.2)
+        self.assertEqual(waited, [])
+        self.assertTrue(self.control.resume())
+        thread.join(5)
+        self.assertEqual(waited, [True])
+
+    def test_progress(self):
+        self.control.jobs = [FakeJob("done"), FakeJob("done"), FakeJob("pending"), FakeJob("failed")]
+        self.assertEqual(self.control.progress(), {"total": 4, "done": 2, "pending": 1, "failed": 1})
+
+
+if __name__ == '__main__':
+    main()
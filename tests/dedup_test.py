@@ -0,0 +1,78 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import os
+import tempfile
+from unittest import TestCase, main
+
+from pywebp import dedup
+
+
+class DedupTest(TestCase):
+    """Duplicate detection Tests.
+    """
+
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.hashed = []
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def _file(self, name, data):
+        path = os.path.join(self._tmp_dir.name, name)
+        with open(path, "wb") as image_file:
+            image_file.write(data)
+        return path
+
+    def _digest(self, path):
+        self.hashed.append(os.path.basename(path))
+        return dedup.file_digest(path)
+
+    def test_find_duplicates(self):
+        a = self._file("a.png", b"same bytes")
+        b = self._file("b.png", b"other data")
+        c = self._file("c.png", b"same bytes")
+        d = self._file("d.png", b"unique size")
+        self.assertEqual(dedup.find_duplicates([a, b, c, d], self._digest), [[a, c]])
+        # files with a unique size are never read
+        self.assertNotIn("d.png", self.hashed)
+
+    def test_find_duplicates_missing_file(self):
+        a = self._file("a.png", b"same bytes")
+        missing = os.path.join(self._tmp_dir.name, "missing.png")
+        self.assertEqual(dedup.find_duplicates([a, missing]), [])
+
+    def test_find_similar(self):
+        hashes = {"a": 0b1011, "b": 0b1010, "c": 0xff00ff00ff00ff00, "d": 0xff00ff00ff00ffff}
+        self.assertEqual(dedup.find_similar(["a", "b", "c", "d"], hashes=hashes), [["a", "b"]])
+        self.assertEqual(dedup.find_similar(["a", "c"], hashes=hashes), [])
+
+    def test_hamming_distance(self):
+        self.assertEqual(dedup.hamming_distance(0b1011, 0b0010), 2)
+
+
+if __name__ == '__main__':
+    main()
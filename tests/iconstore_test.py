@@ -0,0 +1,196 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import contextlib
+import io
+import os
+import tempfile
+from unittest import TestCase, main
+
+import gi
+
+gi.require_version("Gtk", "3.0")
+from gi.repository import GLib, Gtk
+from pywebp.iconstore import IconStore
+
+
+class FakeView:
+    """The parts of Gtk.IconView used by iconstore.detached."""
+
+    def __init__(self, model):
+        self.model = model
+        self.selected = []
+        self.emitted = []
+        self.detaches = 0
+
+    def get_model(self):
+        return self.model
+
+    def set_model(self, model):
+        self.detaches += model is None
+        self.model = model
+        self.selected = []
+
+    def get_selected_items(self):
+        return list(self.selected)
+
+    def select_path(self, path):
+        self.selected.append(path)
+
+    def get_vadjustment(self):
+        return None
+
+    def emit(self, signal):
+        self.emitted.append(signal)
+
+
+class IconStoreTest(TestCase):
+    """Thumbs panel model Tests.
+    """
+
+    def setUp(self):
+        self.store = IconStore()
+        self.view = FakeView(self.store)
+        # (size in bytes, modification time) of the files, so that they are not read from the disk
+        self.stats = {"/photos/c.png": (300, 3), "/photos/a.png": (100, 1), "/photos/b.png": (200, 2)}
+        self.store.add_many(list(self.stats), stats=self.stats)
+
+    def _files(self):
+        return [row[2] for row in self.store]
+
+    def _selected_files(self):
+        return sorted(self.store[path][2] for path in self.view.get_selected_items())
+
+    def _select(self, *indices):
+        for index in indices:
+            self.view.select_path(Gtk.TreePath.new_from_indices([index]))
+
+    @staticmethod
+    def _run_idle():
+        context = GLib.MainContext.default()
+        while context.pending():
+            context.iteration(False)
+
+    def test_sort_keeps_selection(self):
+        self._select(0, 2)
+        self.store.sort_rows("size", view=self.view)
+        self.assertEqual(self._files(), ["/photos/a.png", "/photos/b.png", "/photos/c.png"])
+        self.assertEqual(self._selected_files(), ["/photos/b.png", "/photos/c.png"])
+        self.assertEqual(self.view.emitted, ["selection-changed"])
+
+    def test_add_many_skips_duplicates(self):
+        self.store.add_many(["/photos/a.png", "/photos/d.png", "/photos/d.png"],
+                            stats={"/photos/a.png": (100, 1), "/photos/d.png": (400, 4)})
+        self.assertEqual(self._files(), ["/photos/c.png", "/photos/a.png", "/photos/b.png", "/photos/d.png"])
+
+    def test_normalized_paths(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filepath = os.path.join(tmp_dir, "e.png")
+            with open(filepath, "wb") as image_file:
+                image_file.write(b"png")
+            link = os.path.join(tmp_dir, "link.png")
+            os.symlink(filepath, link)
+            dotted = os.path.join(tmp_dir, "sub", "..", "e.png")
+            self.store.add_many([link, dotted, filepath])
+            self.store.add_to_model(filepath)
+            self.assertEqual(self._files()[3:], [link])
+            for alias in (filepath, dotted, link):
+                self.assertTrue(self.store.is_duplicate(alias))
+            self.assertFalse(self.store.is_duplicate(os.path.join(tmp_dir, "f.png")))
+
+    def test_is_duplicate_other_column(self):
+        self.assertTrue(self.store.is_duplicate("b.png", 3))
+        self.assertFalse(self.store.is_duplicate("d.png", 3))
+
+    def test_add_many_small_batch(self):
+        done = []
+        self.store.add_many(["/photos/d.png", "/photos/e.png"], self.view, done.append,
+                            stats={"/photos/d.png": (400, 4), "/photos/e.png": (500, 5)})
+        self.assertEqual(done, [2])
+        self.assertEqual(len(self.store), 5)
+        self.assertEqual(self.view.detaches, 1)
+        self.assertIs(self.view.get_model(), self.store)
+
+    def test_add_many_chunks(self):
+        done = []
+        stats = {"/photos/%d.png" % index: (index, index) for index in range(5)}
+        self._select(1)
+        self.store.add_many(list(stats), self.view, done.append, chunk_size=2, stats=stats)
+        # large batches are inserted from idle callbacks
+        self.assertEqual(len(self.store), 3)
+        self.assertEqual(done, [])
+        self._run_idle()
+        self.assertEqual(done, [5])
+        self.assertEqual(self._files()[3:], list(stats))
+        self.assertEqual(self.view.detaches, 3)
+        self.assertIs(self.view.get_model(), self.store)
+        self.assertEqual(self._selected_files(), ["/photos/a.png"])
+
+    def test_add_many_chunks_skip_added_meanwhile(self):
+        done = []
+        stats = {"/photos/%d.png" % index: (index, index) for index in range(4)}
+        self.store.add_many(list(stats), on_done=done.append, chunk_size=2, stats=stats)
+        self.store.add_many(["/photos/3.png"], stats=stats)
+        self._run_idle()
+        self.assertEqual(done, [3])
+        self.assertEqual(self._files()[3:], ["/photos/3.png", "/photos/0.png", "/photos/1.png", "/photos/2.png"])
+
+    def test_add_many_missing_file(self):
+        done = []
+        with tempfile.TemporaryDirectory() as tmp_dir, contextlib.redirect_stdout(io.StringIO()):
+            self.store.add_many([os.path.join(tmp_dir, "missing.png")], on_done=done.append)
+        self.assertEqual(done, [0])
+        self.assertEqual(len(self.store), 3)
+
+    def test_remove_selected(self):
+        self._select(0, 2)
+        self.assertTrue(self.store.remove_selected(self.view.get_selected_items(), self.view))
+        self.assertEqual(self._files(), ["/photos/a.png"])
+        self.assertEqual(self.view.selected, [])
+        self.assertEqual(self.view.emitted, ["selection-changed"])
+        self.assertFalse(self.store.is_duplicate("/photos/c.png"))
+        self.assertTrue(self.store.is_duplicate("/photos/a.png"))
+        # removed files can be added again
+        self.store.add_many(["/photos/c.png"], stats=self.stats)
+        self.assertEqual(self._files(), ["/photos/a.png", "/photos/c.png"])
+
+    def test_remove_all(self):
+        self._select(2, 1, 0)
+        self.assertTrue(self.store.remove_selected(self.view.get_selected_items(), self.view))
+        self.assertEqual(len(self.store), 0)
+        self.assertEqual(self.view.selected, [])
+        self.assertIs(self.view.get_model(), self.store)
+        self.assertFalse(self.store.is_duplicate("/photos/a.png"))
+        self.store.add_many(list(self.stats), stats=self.stats)
+        self.assertEqual(len(self.store), 3)
+
+    def test_remove_stale_path(self):
+        items = [Gtk.TreePath.new_from_indices([index]) for index in (1, 5)]
+        self.assertFalse(self.store.remove_selected(items, self.view))
+        self.assertEqual(self._files(), ["/photos/c.png", "/photos/b.png"])
+
+
+if __name__ == '__main__':
+    main()
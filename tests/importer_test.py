@@ -0,0 +1,137 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import contextlib
+import io
+import os
+import tempfile
+from unittest import TestCase, main, mock
+
+from gi.repository import GLib
+from pywebp import importer
+from pywebp.importer import DirectoryImporter
+
+
+class RecordingImporter(DirectoryImporter):
+    """DirectoryImporter recording the most directories enumerated at the same time."""
+
+    max_open = 0
+
+    def _open_dirs(self):
+        super()._open_dirs()
+        self.max_open = max(self.max_open, self._open)
+
+
+class DirectoryImporterTest(TestCase):
+    """Asynchronous directory walk Tests.
+    """
+
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.root = self._tmp_dir.name
+        self.batches = []
+        self.done = []
+        for name, value in (("BATCH_SIZE", 2), ("MAX_OPEN_DIRS", 2), ("FLUSH_INTERVAL", 10)):
+            patcher = mock.patch.object(importer, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def _file(self, *names, data=b"image"):
+        path = os.path.join(self.root, *names)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as image_file:
+            image_file.write(data)
+        return path
+
+    def _walk(self, paths, cancel=False):
+        """Run the main loop until the importer is done
+
+        Returns:
+            the RecordingImporter
+        """
+        loop = GLib.MainLoop()
+        walker = RecordingImporter(True, self.batches.append, lambda found: (self.done.append(found), loop.quit()))
+        walker.start(paths)
+        if cancel:
+            walker.cancel()
+        if not self.done:
+            timeout = GLib.timeout_add(5000, loop.quit)
+            loop.run()
+            if not self.done:
+                self.fail("the walk did not end")
+            GLib.source_remove(timeout)
+        return walker
+
+    def test_walk_tree(self):
+        expected = [self._file("a.png", data=b"a"), self._file("b.JPG", data=b"bb")]
+        expected += [self._file("sub%d" % folder, "%d.png" % index) for folder in range(4) for index in range(5)]
+        expected.append(self._file("sub0", "deep", "c.webp.png"))
+        self._file("notes.txt")
+        self._file("sub1", "d.webp")
+        walker = self._walk([self.root])
+        found = [item for batch in self.batches for item in batch]
+        self.assertEqual(sorted(item[0] for item in found), sorted(expected))
+        self.assertEqual(self.done, [len(expected)])
+        self.assertEqual(walker.found, len(expected))
+        self.assertLessEqual(walker.max_open, importer.MAX_OPEN_DIRS)
+        for path, size, mtime in found:
+            self.assertEqual((size, mtime), (os.path.getsize(path), int(os.path.getmtime(path))))
+
+    def test_first_files_delivered_at_once(self):
+        for index in range(10):
+            self._file("%d.png" % index)
+        self._walk([self.root])
+        self.assertEqual(len(self.batches[0]), 1)
+        # the other files are buffered between the flushes
+        self.assertLess(len(self.batches), 10)
+        self.assertEqual(sum(len(batch) for batch in self.batches), 10)
+
+    def test_files_and_missing_paths(self):
+        image = self._file("a.png")
+        self._file("b.txt")
+        with contextlib.redirect_stdout(io.StringIO()) as stdout:
+            self._walk([image, os.path.join(self.root, "b.txt"), os.path.join(self.root, "missing")])
+        self.assertEqual(self.batches, [[(image, os.path.getsize(image), int(os.path.getmtime(image)))]])
+        self.assertEqual(self.done, [1])
+        self.assertIn("Unable to read", stdout.getvalue())
+
+    def test_nothing_to_walk(self):
+        self._walk([])
+        self.assertEqual(self.batches, [])
+        self.assertEqual(self.done, [0])
+
+    def test_cancel(self):
+        for index in range(10):
+            self._file("sub%d" % index, "a.png")
+        walker = self._walk([self.root], cancel=True)
+        self.assertEqual(self.done, [walker.found])
+        self.assertLess(walker.found, 10)
+
+
+if __name__ == '__main__':
+    main()
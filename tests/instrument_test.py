@@ -0,0 +1,102 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase, main, mock
+
+from pywebp import instrument
+from pywebp.instrument import MainLoopMonitor
+
+
+class MainLoopMonitorTest(TestCase):
+    """Main loop instrumentation Tests.
+    """
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.monitor = MainLoopMonitor(threshold=30, profile=["slow_handler"], profile_dir=self._tmp.name)
+        self.logs = []
+        patcher = mock.patch.object(MainLoopMonitor, "_log", staticmethod(self.logs.append))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.monitor._stop.set()
+        self._tmp.cleanup()
+
+    def test_configure_disabled(self):
+        with mock.patch.dict(os.environ, {}, clear=True):
+            self.assertEqual(instrument.configure(["convert", "a.png"]), ["convert", "a.png"])
+
+    def test_configure_not_installed(self):
+        with mock.patch.object(MainLoopMonitor, "install") as install:
+            args = instrument.configure(["--instrument", "--stall-ms=50", "convert", "a.png"], install=False)
+        self.assertEqual(args, ["convert", "a.png"])
+        install.assert_not_called()
+
+    def test_wrap(self):
+        def slow_handler(value):
+            time.sleep(0.05)
+            return value
+
+        def fast_handler():
+            return True
+
+        timed = self.monitor.wrap("slow", slow_handler)
+        self.assertIs(self.monitor.wrap("slow", timed), timed)
+        self.assertEqual(timed(42), 42)
+        self.assertTrue(self.monitor.wrap("fast", fast_handler)())
+        # calls from other threads are not timed
+        thread = threading.Thread(target=timed, args=(1,))
+        thread.start()
+        thread.join()
+
+        self.assertEqual(self.monitor._stats["slow"][0], 1)
+        self.assertGreaterEqual(self.monitor._stats["slow"][2], 50)
+        self.assertEqual(self.monitor._stats["fast"][0], 1)
+        self.assertTrue(any(log.startswith("slow handler slow") for log in self.logs))
+        self.assertEqual(len([name for name in os.listdir(self._tmp.name) if name.startswith("slow_handler-")]), 1)
+
+    def test_stall_sampled(self):
+        self.monitor._last_beat = time.monotonic()
+        self.monitor._running.append("busy handler")
+        watchdog = threading.Thread(target=self.monitor._watch)
+        watchdog.start()
+        time.sleep(0.2)
+        self.monitor._stop.set()
+        watchdog.join()
+        stalls = [log for log in self.logs if log.startswith("main loop stalled")]
+        self.assertEqual(len(stalls), 1)
+        self.assertIn("busy handler", stalls[0])
+        self.assertIn("test_stall_sampled", stalls[0])
+        self.monitor._beat()
+        self.assertTrue(self.logs[-1].startswith("main loop stall ended"))
+
+
+if __name__ == '__main__':
+    main()
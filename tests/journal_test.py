@@ -0,0 +1,87 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import os
+import tempfile
+from types import SimpleNamespace
+from unittest import TestCase, main
+
+from pywebp.journal import BatchJournal
+
+
+class BatchJournalTest(TestCase):
+    """Conversion journal Tests.
+    """
+
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.journal = BatchJournal(os.path.join(self._tmp_dir.name, "journal.jsonl"))
+        self.jobs = [SimpleNamespace(src=os.path.join(self._tmp_dir.name, "%d.png" % index),
+                                     dst=os.path.join(self._tmp_dir.name, "%d.webp" % index),
+                                     to_webp=True, options="-q 80", status="pending", error=None)
+                     for index in range(3)]
+
+    def tearDown(self):
+        self.journal.close()
+        self._tmp_dir.cleanup()
+
+    def _finish(self, job, status="done"):
+        if status == "done":
+            with open(job.dst, "wb") as output:
+                output.write(b"RIFF")
+        job.status = status
+        self.journal.job_done(job)
+
+    def test_interrupted(self):
+        self.journal.begin(self.jobs)
+        self._finish(self.jobs[0])
+        self._finish(self.jobs[1], "failed")
+        self.journal.close()
+        # a record torn by a crash
+        with open(self.journal.path, "a") as journal_file:
+            journal_file.write('{"op": "done", "src"')
+        total, unfinished = BatchJournal(self.journal.path).unfinished()
+        self.assertEqual(total, 3)
+        self.assertEqual([entry[0] for entry in unfinished], [self.jobs[1].src, self.jobs[2].src])
+
+    def test_changed_output(self):
+        self.journal.begin(self.jobs)
+        self._finish(self.jobs[0])
+        self.journal.close()
+        with open(self.jobs[0].dst, "ab") as output:
+            output.write(b"more")
+        self.assertEqual(len(self.journal.unfinished()[1]), 3)
+
+    def test_completed(self):
+        self.journal.begin(self.jobs)
+        for job in self.jobs:
+            self._finish(job)
+        self.journal.end()
+        self.assertIsNone(self.journal.unfinished())
+        self.assertFalse(os.path.exists(self.journal.path))
+
+
+if __name__ == '__main__':
+    main()
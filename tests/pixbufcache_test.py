@@ -0,0 +1,156 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+from unittest import TestCase, main, mock
+
+from pywebp import pixbufcache
+from pywebp.pixbufcache import PixbufCache
+
+
+class FakePixbuf:
+    """Pixbuf whose pixels take rowstride * height bytes."""
+
+    def __init__(self, size):
+        self.size = size
+
+    def get_rowstride(self):
+        return self.size
+
+    def get_height(self):
+        return 1
+
+
+class FakeStorage:
+
+    def __init__(self, value):
+        self.value = value
+
+    def get_integer(self, key):
+        return self.value
+
+
+class PixbufCacheTest(TestCase):
+    """Thumbnail LRU cache Tests.
+    """
+
+    def setUp(self):
+        self.cache = PixbufCache(budget=300)
+        self.evicted = []
+
+    def _put(self, key, size=100):
+        self.cache.put(key, FakePixbuf(size), self.evicted.append)
+
+    def _keys(self):
+        return list(self.cache._entries)
+
+    def test_within_budget(self):
+        for key in "abc":
+            self._put(key)
+        self.assertEqual(self._keys(), ["a", "b", "c"])
+        self.assertEqual(self.evicted, [])
+        self.assertEqual(self.cache.stats()["size"], 300)
+
+    def test_evict_least_recently_used(self):
+        for key in "abc":
+            self._put(key)
+        self.cache.get("a")
+        self._put("d")
+        self.assertEqual(self.evicted, ["b"])
+        self.assertEqual(self._keys(), ["c", "a", "d"])
+        self._put("e", 200)
+        self.assertEqual(self.evicted, ["b", "c", "a"])
+        self.assertEqual(self._keys(), ["d", "e"])
+
+    def test_replace_entry(self):
+        self._put("a")
+        self._put("b")
+        self._put("a", 200)
+        self.assertEqual(self.evicted, [])
+        self.assertEqual(self._keys(), ["b", "a"])
+        self.assertEqual(self.cache.stats()["size"], 300)
+
+    def test_too_big(self):
+        self._put("a")
+        self._put("b", 400)
+        self.assertEqual(self.evicted, ["a", "b"])
+        self.assertEqual(self.cache.stats()["entries"], 0)
+        self.assertEqual(self.cache.stats()["size"], 0)
+
+    def test_callback_per_entry(self):
+        other = []
+        self._put("a")
+        self.cache.put("b", FakePixbuf(100), other.append)
+        self.cache.put("c", FakePixbuf(100))
+        self.cache.set_budget(0)
+        self.assertEqual(self.evicted, ["a"])
+        self.assertEqual(other, ["b"])
+
+    def test_discard_without_callback(self):
+        self._put("a")
+        self.cache.discard("a")
+        self.cache.discard("missing")
+        self.assertEqual(self.evicted, [])
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.stats()["size"], 0)
+
+    def test_shrink_budget(self):
+        for key in "abc":
+            self._put(key)
+        self.cache.set_budget(150)
+        self.assertEqual(self.evicted, ["a", "b"])
+        self.assertEqual(self._keys(), ["c"])
+        self.cache.set_budget(1000)
+        self.assertEqual(self.evicted, ["a", "b"])
+
+    def test_budget_setting(self):
+        with mock.patch.object(pixbufcache, "pixbuf_cache", self.cache):
+            pixbufcache._on_setting_changed(FakeStorage(2), "thumbnail_cache_mb")
+            self.assertEqual(self.cache.budget, 2 * 1024 * 1024)
+            pixbufcache._on_setting_changed(FakeStorage(5), "thumbnail_size")
+            self.assertEqual(self.cache.budget, 2 * 1024 * 1024)
+
+    def test_budget_setting_evicts(self):
+        self._put("a")
+        with mock.patch.object(pixbufcache, "pixbuf_cache", self.cache):
+            pixbufcache._on_setting_changed(FakeStorage(0), "thumbnail_cache_mb")
+        self.assertEqual(self.evicted, ["a"])
+
+    def test_default_budget(self):
+        with mock.patch.object(pixbufcache.settings, "get_integer", return_value=3):
+            self.assertEqual(PixbufCache().budget, 3 * 1024 * 1024)
+
+    def test_stats(self):
+        self._put("a")
+        self._put("b")
+        self.cache.get("a")
+        self.cache.get("a")
+        self.cache.get("missing")
+        self._put("c", 200)
+        self.assertEqual(self.cache.stats(), {"hits": 2, "misses": 1, "evictions": 1, "entries": 2,
+                                              "size": 300, "budget": 300})
+
+
+if __name__ == '__main__':
+    main()
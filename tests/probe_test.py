@@ -0,0 +1,119 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2019-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import os
+import struct
+import tempfile
+import zlib
+from unittest import TestCase, main
+
+from pywebp import probe
+
+
+def png_chunk(chunk_type, data):
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+def riff(*chunks):
+    body = b"WEBP" + b"".join(fourcc + struct.pack("<I", len(data)) + data + b"\0" * (len(data) & 1)
+                              for fourcc, data in chunks)
+    return b"RIFF" + struct.pack("<I", len(body)) + body
+
+
+class ProbeTest(TestCase):
+    """Header prober Tests.
+    """
+
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def _probe(self, data, **kwargs):
+        path = os.path.join(self._tmp_dir.name, "image")
+        with open(path, "wb") as image_file:
+            image_file.write(data)
+        return probe.probe(path, **kwargs)
+
+    def test_png(self):
+        """Size and alpha of png, frames of animated png."""
+        ihdr = png_chunk(b"IHDR", struct.pack(">IIBBBBB", 640, 480, 8, 6, 0, 0, 0))
+        still = b"\x89PNG\r\n\x1a\n" + ihdr + png_chunk(b"IDAT", b"\0" * 10) + png_chunk(b"IEND", b"")
+        self.assertEqual(self._probe(still), probe.ImageInfo("png", 640, 480, True, False, 1))
+        actl = png_chunk(b"acTL", struct.pack(">II", 3, 0))
+        animated = b"\x89PNG\r\n\x1a\n" + ihdr + actl + png_chunk(b"IDAT", b"\0" * 10)
+        self.assertEqual(self._probe(animated), probe.ImageInfo("png", 640, 480, True, True, 3))
+
+    def test_jpeg(self):
+        """Size of jpeg after an APP0 segment."""
+        app0 = b"\xff\xe0" + struct.pack(">H", 16) + b"JFIF\0" + b"\0" * 9
+        sof0 = b"\xff\xc0" + struct.pack(">HBHHB", 17, 8, 600, 800, 3) + b"\0" * 9
+        info = self._probe(b"\xff\xd8" + app0 + sof0 + b"\xff\xd9")
+        self.assertEqual(info, probe.ImageInfo("jpeg", 800, 600, False, False, 1))
+
+    def test_gif(self):
+        """Size, transparency and frames of gif."""
+        header = b"GIF89a" + struct.pack("<HHBBB", 32, 16, 0x80, 0, 0) + b"\0" * 6
+        control = b"\x21\xf9\x04\x01\x00\x00\x00\x00"
+        image = b"\x2c" + struct.pack("<HHHHB", 0, 0, 32, 16, 0) + b"\x02\x01\x00\x00"
+        info = self._probe(header + control + image + control + image + b"\x3b")
+        self.assertEqual(info, probe.ImageInfo("gif", 32, 16, True, True, 2))
+
+    def test_webp(self):
+        """Lossy, lossless and animated webp."""
+        vp8 = b"\0\0\0\x9d\x01\x2a" + struct.pack("<HH", 320, 200) + b"\0" * 4
+        self.assertEqual(self._probe(riff((b"VP8 ", vp8))), probe.ImageInfo("webp", 320, 200, False, False, 1))
+        bits = (99 & 0x3fff) | ((49 & 0x3fff) << 14) | (1 << 28)
+        vp8l = b"\x2f" + struct.pack("<I", bits)
+        self.assertEqual(self._probe(riff((b"VP8L", vp8l))), probe.ImageInfo("webp", 100, 50, True, False, 1))
+        vp8x = bytes([0x12, 0, 0, 0]) + (199).to_bytes(3, "little") + (99).to_bytes(3, "little")
+        animated = riff((b"VP8X", vp8x), (b"ANIM", b"\0" * 6), (b"ANMF", b"\0" * 16), (b"ANMF", b"\0" * 16),
+                        (b"ANMF", b"\0" * 16))
+        self.assertEqual(self._probe(animated), probe.ImageInfo("webp", 200, 100, True, True, 3))
+        self.assertEqual(self._probe(animated, count_frames=False).frames, 2)
+
+    def test_tiff(self):
+        """Size, extra samples and pages of tiff."""
+        first = struct.pack("<H", 3) + struct.pack("<HHIHH", 256, 3, 1, 64, 0) \
+            + struct.pack("<HHII", 257, 4, 1, 48) + struct.pack("<HHIHH", 338, 3, 1, 2, 0)
+        second_offset = 8 + len(first) + 4
+        second = struct.pack("<H", 0) + struct.pack("<I", 0)
+        data = b"II*\0" + struct.pack("<I", 8) + first + struct.pack("<I", second_offset) + second
+        self.assertEqual(self._probe(data), probe.ImageInfo("tiff", 64, 48, True, False, 2))
+
+    def test_unsupported(self):
+        """Unknown formats and truncated headers raise ProbeError."""
+        self.assertRaises(probe.ProbeError, self._probe, b"not an image")
+        self.assertRaises(probe.ProbeError, self._probe, b"\x89PNG\r\n\x1a\n" + b"\0\0\0\x0dIHDR")
+        self.assertRaises(probe.ProbeError, self._probe, b"RIFF\x10\x00\x00\x00WEBPVP8L")
+        self.assertRaises(probe.ProbeError, self._probe, b"RIFF\x10\x00\x00\x00WEBPVP8X")
+        self.assertRaises(probe.ProbeError, self._probe, riff((b"VP8L", b"\x2f\0")))
+        self.assertRaises(probe.ProbeError, self._probe, riff((b"VP8X", b"\x12\0\0\0\0")))
+        self.assertRaises(probe.ProbeError, self._probe, riff((b"VP8 ", b"\0\0\0\x9d\x01\x2a")))
+
+
+if __name__ == "__main__":
+    main()
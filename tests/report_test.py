@@ -0,0 +1,97 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import csv
+import json
+import os
+import tempfile
+from unittest import TestCase, main
+
+from pywebp.report import JOB_FIELDS, BatchReport, job_metrics
+
+
+class FakeJob:
+
+    def __init__(self, name, status="done", bytes_in=1000, bytes_out=400, cached=False, duplicate_of=None):
+        self.src = "/in/%s.png" % name
+        self.dst = "/out/%s.webp" % name
+        self.status = status
+        self.error = None if status != "failed" else "broken"
+        self.cached = cached
+        self.duplicate_of = duplicate_of
+        self.options = "-q 80"
+        self.quality = None
+        self.wait_time = 0.5
+        self.decode_time = 0.01
+        self.encode_time = 0.2
+        self.elapsed = 0.25
+        self.bytes_in = bytes_in
+        self.bytes_out = bytes_out if status == "done" else None
+
+
+class BatchReportTest(TestCase):
+    """Conversion metrics Tests.
+    """
+
+    def setUp(self):
+        self.report = BatchReport(4)
+        for job in (FakeJob("a"), FakeJob("b", bytes_in=3000, bytes_out=1600, cached=True),
+                    FakeJob("c", status="failed"), FakeJob("d", duplicate_of="/in/a.png")):
+            self.report.add(job)
+        self.report.finish()
+
+    def test_job_metrics(self):
+        record = job_metrics(FakeJob("a"))
+        self.assertEqual(list(record), JOB_FIELDS)
+        self.assertEqual(record["ratio"], 0.4)
+        self.assertIsNone(job_metrics(FakeJob("c", status="failed"))["ratio"])
+
+    def test_summary(self):
+        summary = self.report.summary()
+        self.assertEqual((summary["total"], summary["finished"]), (4, 4))
+        self.assertEqual((summary["done"], summary["failed"], summary["cancelled"]), (3, 1, 0))
+        self.assertEqual((summary["cached"], summary["duplicates"]), (1, 1))
+        self.assertEqual((summary["bytes_in"], summary["bytes_out"], summary["saved"]), (5000, 2400, 2600))
+        self.assertEqual(summary["ratio"], 0.48)
+        self.assertEqual(summary["total_encode_time"], 0.8)
+        self.assertEqual(summary, self.report.summary())
+
+    def test_export(self):
+        with tempfile.TemporaryDirectory() as folder:
+            self.report.write(os.path.join(folder, "report.csv"))
+            with open(os.path.join(folder, "report.csv"), newline="") as report_file:
+                rows = list(csv.DictReader(report_file))
+            self.assertEqual([row["src"] for row in rows], ["/in/a.png", "/in/b.png", "/in/c.png", "/in/d.png"])
+            self.assertEqual(rows[2]["error"], "broken")
+
+            self.report.write(os.path.join(folder, "report.json"))
+            with open(os.path.join(folder, "report.json")) as report_file:
+                exported = json.load(report_file)
+            self.assertEqual(exported["summary"]["bytes_out"], 2400)
+            self.assertEqual(len(exported["jobs"]), 4)
+
+
+if __name__ == '__main__':
+    main()
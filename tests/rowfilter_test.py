@@ -0,0 +1,71 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+from unittest import TestCase, main
+
+from pywebp.rowfilter import parse_filter, parse_size, uses_dimensions
+
+
+class RowFilterTest(TestCase):
+    """Filter expressions Tests.
+    """
+
+    def test_parse_size(self):
+        self.assertEqual(parse_size("1024"), 1024)
+        self.assertEqual(parse_size("5 MB"), 5 * 1024 ** 2)
+        self.assertEqual(parse_size("1.5k"), 1536)
+        self.assertRaises(ValueError, parse_size, "big")
+
+    def test_size(self):
+        predicate = parse_filter("> 5 MB")
+        self.assertTrue(predicate("a.png", 6 * 1024 ** 2, 0, 0))
+        self.assertFalse(predicate("a.png", 5 * 1024 ** 2, 0, 0))
+
+    def test_dimensions(self):
+        predicate = parse_filter(">= 1920x1080")
+        self.assertTrue(predicate("a.png", 1, 1920, 1080))
+        self.assertFalse(predicate("a.png", 1, 1920, 1000))
+        # not probed yet
+        self.assertFalse(parse_filter("width < 100")("a.png", 1, 0, 0))
+
+    def test_name_and_conditions(self):
+        predicate = parse_filter("Holiday and size < 1K")
+        self.assertTrue(predicate("holiday-01.png", 100, 0, 0))
+        self.assertFalse(predicate("holiday-01.png", 2048, 0, 0))
+        self.assertFalse(predicate("work.png", 100, 0, 0))
+
+    def test_empty_and_invalid(self):
+        self.assertIsNone(parse_filter("  "))
+        self.assertRaises(ValueError, parse_filter, "depth > 3")
+        self.assertRaises(ValueError, parse_filter, "width > 1x2")
+
+    def test_uses_dimensions(self):
+        self.assertTrue(uses_dimensions("height > 10"))
+        self.assertTrue(uses_dimensions("< 640x480"))
+        self.assertFalse(uses_dimensions("> 5 MB, photo"))
+
+
+if __name__ == '__main__':
+    main()
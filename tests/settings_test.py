@@ -0,0 +1,112 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import os
+import tempfile
+import time
+from unittest import TestCase, main, mock
+
+from gi.repository import GLib
+from pywebp import settings as settings_module
+from pywebp.settings import DEFAULTS, SETTINGS_GROUP_NAME, SettingStorage
+
+
+class SettingStorageTest(TestCase):
+    """Settings storage Tests.
+    """
+
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp_dir.name, "pywebp_gtk.ini")
+        for name, value in (("DATA_DIR", self._tmp_dir.name), ("CONFIG_FILE", self.path), ("SAVE_DELAY", 0.05)):
+            patcher = mock.patch.object(settings_module, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def _storage(self):
+        storage = SettingStorage()
+        self.addCleanup(storage.flush)
+        return storage
+
+    def _saved(self, key):
+        keyfile = GLib.KeyFile()
+        keyfile.load_from_file(self.path, GLib.KeyFileFlags.NONE)
+        return keyfile.get_integer(SETTINGS_GROUP_NAME, key)
+
+    def _write(self, content):
+        # a modification time surely different from the one of the previous save
+        mtime = os.stat(self.path).st_mtime_ns if os.path.exists(self.path) else time.time_ns()
+        with open(self.path, "w") as config_file:
+            config_file.write(content)
+        os.utime(self.path, ns=(mtime + 10 ** 9, mtime + 10 ** 9))
+
+    def test_module_settings(self):
+        self.assertIsInstance(settings_module.settings, SettingStorage)
+        self.assertIn(settings_module.settings.get_string("backend"), ("webptools", "libwebp"))
+
+    def test_defaults(self):
+        storage = self._storage()
+        self.assertTrue(os.path.exists(self.path))
+        self.assertEqual(storage.get_integer("cache_size_mb"), DEFAULTS["cache_size_mb"])
+        self.assertEqual(storage.get_integer_list("variant_widths"), DEFAULTS["variant_widths"])
+        self.assertEqual(storage.get_string("cwebp_options"), DEFAULTS["cwebp_options"])
+
+    def test_missing_defaults_added(self):
+        self._write("[%s]\nworkers=3\n" % SETTINGS_GROUP_NAME)
+        storage = self._storage()
+        self.assertEqual(storage.get_integer("workers"), 3)
+        self.assertEqual(storage.get_string("backend"), DEFAULTS["backend"])
+
+    def test_debounced_save(self):
+        storage = self._storage()
+        storage.set_integer("workers", 2)
+        storage.set_integer("workers", 5)
+        # nothing written before SAVE_DELAY, then only the last value
+        self.assertEqual(self._saved("workers"), 0)
+        time.sleep(0.3)
+        self.assertEqual(self._saved("workers"), 5)
+
+    def test_reload_when_changed_on_disk(self):
+        storage = self._storage()
+        self.assertEqual(storage.get_integer("workers"), 0)
+        self._write("[%s]\nworkers=7\n" % SETTINGS_GROUP_NAME)
+        self.assertEqual(storage.get_integer("workers"), 7)
+
+    def test_changed_signal(self):
+        storage = self._storage()
+        changed = []
+        storage.connect("changed", lambda storage, key: changed.append(key))
+        self.assertTrue(storage.set_integer("workers", 4))
+        self.assertTrue(storage.set_integer("workers", 4))
+        self.assertFalse(storage.set_integer("workers", "4"))
+        self.assertTrue(storage.set_boolean("darkmode", not DEFAULTS["darkmode"]))
+        self.assertEqual(changed, ["workers", "darkmode"])
+
+
+if __name__ == '__main__':
+    main()
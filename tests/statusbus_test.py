@@ -0,0 +1,138 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import threading
+from unittest import TestCase, main, mock
+
+from pywebp import statusbus
+from pywebp.statusbus import StatusBus
+
+
+class FakeGLib:
+
+    def __init__(self):
+        self.sources = []
+
+    def timeout_add(self, interval, callback):
+        self.sources.append((interval, callback))
+        return len(self.sources)
+
+    def source_remove(self, source):
+        pass
+
+
+class FakeStatusbar:
+
+    def __init__(self):
+        self.stack = []
+
+    def push(self, context_id, message):
+        self.stack.append((context_id, message))
+
+    def pop(self, context_id):
+        for index in reversed(range(len(self.stack))):
+            if self.stack[index][0] == context_id:
+                del self.stack[index]
+                return
+
+
+class FakeProgressbar:
+
+    def __init__(self):
+        self.updates = []
+        self.visible = False
+
+    def set_fraction(self, fraction):
+        self.updates.append(fraction)
+
+    def set_text(self, text):
+        self.text = text
+
+    def show(self):
+        self.visible = True
+
+    def hide(self):
+        self.visible = False
+
+
+class StatusBusTest(TestCase):
+    """Status updates coalescing Tests.
+    """
+
+    def setUp(self):
+        self.glib = FakeGLib()
+        patcher = mock.patch.object(statusbus, "GLib", self.glib)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.bus = StatusBus()
+        self.statusbar = FakeStatusbar()
+        self.progressbar = FakeProgressbar()
+        self.bus.attach(self.statusbar, self.progressbar)
+
+    def _run_sources(self):
+        sources, self.glib.sources = self.glib.sources, []
+        for interval, callback in sources:
+            callback()
+
+    def test_calls_coalesced(self):
+        delivered = []
+        threads = [threading.Thread(target=lambda n=n: [self.bus.call(delivered.append, (n, i)) for i in range(100)])
+                   for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.glib.sources), 1)
+        self._run_sources()
+        self.assertEqual(len(delivered), 400)
+        self.assertEqual([i for n, i in delivered if n == 2], list(range(100)))
+
+    def test_last_message_shown(self):
+        for count in range(50):
+            self.bus.post_message("message %d" % count, 1)
+        self.bus.post_message("other", 2)
+        self._run_sources()
+        self.assertEqual(self.statusbar.stack, [(1, ">>  message 49"), (2, ">>  other")])
+        self.bus.post_message("replaced", 1)
+        self._run_sources()
+        self.assertEqual(self.statusbar.stack, [(2, ">>  other"), (1, ">>  replaced")])
+
+    def test_progress(self):
+        self.bus.begin_task(1000, "Converting")
+        for count in range(1000):
+            self.bus.advance("file%d.png" % count, failed=count % 100 == 0)
+        self.assertEqual(self.bus.progress(), (1000, 10, 1000))
+        self._run_sources()
+        self.assertEqual(self.progressbar.updates, [1.0])
+        self.assertEqual(self.progressbar.text, "Converting 1000/1000, 10 failed - file999.png")
+        self.assertTrue(self.progressbar.visible)
+        self.bus.end_task()
+        self._run_sources()
+        self.assertFalse(self.progressbar.visible)
+        self.assertIsNone(self.bus.progress())
+
+
+if __name__ == '__main__':
+    main()
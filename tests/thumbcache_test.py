@@ -0,0 +1,94 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import os
+import tempfile
+from unittest import TestCase, main, mock
+
+from pywebp import thumbcache
+from pywebp.thumbcache import ThumbnailCache, flavour_for
+
+
+class FakePixbuf:
+    """Pixbuf class whose decodes only record the requested size."""
+
+    image_size = (0, 0)
+    decoded = []
+
+    @classmethod
+    def get_file_info(cls, filepath):
+        return "png", cls.image_size[0], cls.image_size[1]
+
+    @classmethod
+    def new_from_file_at_scale(cls, filepath, width, height, preserve_aspect_ratio):
+        cls.decoded.append((width, height))
+        return FakePixbuf()
+
+    def get_width(self):
+        return 1
+
+    def get_height(self):
+        return 1
+
+
+class ThumbnailCacheTest(TestCase):
+    """Persistent thumbnail cache Tests.
+    """
+
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = ThumbnailCache(os.path.join(self._tmp_dir.name, "shared"),
+                                    os.path.join(self._tmp_dir.name, "private"))
+        self.path = os.path.join(self._tmp_dir.name, "a.png")
+        with open(self.path, "wb") as image_file:
+            image_file.write(b"png")
+        FakePixbuf.decoded = []
+        for patcher in (mock.patch.object(thumbcache, "Pixbuf", FakePixbuf), mock.patch.object(self.cache, "save")):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def test_flavour_for(self):
+        self.assertEqual(flavour_for(100), ("normal", 128))
+        self.assertEqual(flavour_for(129), ("large", 256))
+        self.assertEqual(flavour_for(5000), ("xx-large", 1024))
+
+    def test_not_upscaled(self):
+        FakePixbuf.image_size = (40, 30)
+        self.cache.load(self.path, 128, 128)
+        self.assertEqual(FakePixbuf.decoded, [(40, 30)])
+        self.assertEqual(self.cache.save.call_args[0][2], "normal")
+
+    def test_scaled_down(self):
+        FakePixbuf.image_size = (1000, 500)
+        self.cache.load(self.path, 200, 200)
+        self.assertEqual(FakePixbuf.decoded, [(256, 256)])
+        self.assertEqual(self.cache.save.call_args[0][2], "large")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import os
+import tempfile
+from unittest import TestCase, main, mock
+
+from gi.repository import GLib
+from pywebp import thumbnailer
+from pywebp.thumbnailer import Thumbnailer
+
+
+class FakeCache:
+
+    def __init__(self, error=None):
+        self.error = error
+
+    def load(self, filepath, width, height):
+        if self.error is not None:
+            raise self.error
+        return "pixbuf of %s" % os.path.basename(filepath)
+
+
+class FakeStatusBus:
+
+    def call(self, callback, *args):
+        callback(*args)
+
+
+class ThumbnailerTest(TestCase):
+    """Thumbnail decoding Tests.
+    """
+
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp_dir.name, "a.png")
+        with open(self.path, "wb") as image_file:
+            image_file.write(b"not an image")
+        patcher = mock.patch.object(thumbnailer, "status_bus", FakeStatusBus())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def _decode(self, cache):
+        delivered = []
+        tool = Thumbnailer(workers=1, cache=cache)
+        self.addCleanup(tool.shutdown)
+        tool.request(self.path, 128, 128, lambda pixbuf, row: delivered.append((pixbuf, row)), 7)._future.result()
+        return delivered
+
+    def test_delivered(self):
+        self.assertEqual(self._decode(FakeCache()), [("pixbuf of a.png", 7)])
+
+    def test_failure_delivered(self):
+        for error in (GLib.Error("corrupt"), OSError("unreadable"), MemoryError(), ValueError("bad pixbuf")):
+            with mock.patch("builtins.print"):
+                self.assertEqual(self._decode(FakeCache(error)), [(None, 7)])
+
+    def test_cancelled(self):
+        delivered = []
+        tool = Thumbnailer(workers=1, cache=FakeCache())
+        self.addCleanup(tool.shutdown)
+        request = tool.request(self.path, 128, 128, lambda pixbuf: delivered.append(pixbuf))
+        request.cancel()
+        tool._deliver(request, "late")
+        self.assertEqual(delivered, [])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+from unittest import TestCase, main
+
+from pywebp.tuning import MAX_QUALITY, MIN_QUALITY, QualityTuner, with_quality
+
+
+class FakeBackend:
+    name = "fake"
+
+
+class QualityTunerTest(TestCase):
+    """Quality search Tests.
+    """
+
+    def setUp(self):
+        self.tuner = QualityTuner(FakeBackend(), target_size=1000)
+
+    def tearDown(self):
+        self.tuner.shutdown()
+
+    def test_with_quality(self):
+        self.assertEqual(with_quality("-q 80 -m 6", 42), "-m 6 -q 42")
+        self.assertEqual(with_quality("", 7), "-q 7")
+
+    def test_boundary(self):
+        for expected in (MIN_QUALITY, 1, 37, 63, MAX_QUALITY):
+            tried = []
+
+            def _predicate(quality):
+                tried.append(quality)
+                return quality >= expected
+            self.assertEqual(self.tuner._boundary(_predicate), expected)
+            # far less trials than a linear scan
+            self.assertLess(len(tried), 20)
+
+    def test_boundary_never_true(self):
+        self.assertEqual(self.tuner._boundary(lambda quality: False), MAX_QUALITY + 1)
+
+    def test_goal(self):
+        self.assertEqual(self.tuner.goal("-q 80 -m 6"), "fake size<=1000 -m 6 -q 0")
+        self.assertRaises(ValueError, QualityTuner, FakeBackend())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import json
+import os
+import tempfile
+import threading
+from unittest import TestCase, main
+
+from pywebp.variants import MANIFEST_NAME, variant_path, write_manifests
+
+
+class FakeJob:
+
+    def __init__(self, src, dst, variants):
+        self.src = src
+        self.dst = dst
+        self.variants = variants
+
+
+class VariantsTest(TestCase):
+    """Responsive variants Tests.
+    """
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.folder = self._tmp.name
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _job(self, name, widths):
+        dst = os.path.join(self.folder, name + ".webp")
+        with open(dst, "wb") as output:
+            output.write(b"x" * 100)
+        variants = [{"width": width, "height": width // 2, "path": variant_path(dst, width), "bytes": width}
+                    for width in widths]
+        return FakeJob(os.path.join(self.folder, name + ".png"), dst, variants)
+
+    def test_variant_path(self):
+        self.assertEqual(variant_path("/a/photo.webp", 640), "/a/photo-640w.webp")
+
+    def test_write_manifests(self):
+        manifests = write_manifests([self._job("a", [640, 320]), self._job("b", []), self._job("c", [320])])
+        self.assertEqual(manifests, [os.path.join(self.folder, MANIFEST_NAME)])
+        with open(manifests[0]) as manifest:
+            entries = json.load(manifest)
+        self.assertEqual(sorted(entries), ["a.png", "c.png"])
+        self.assertEqual(entries["a.png"]["output"], "a.webp")
+        self.assertEqual(entries["a.png"]["bytes"], 100)
+        self.assertEqual(entries["a.png"]["srcset"], "a-320w.webp 320w, a-640w.webp 640w")
+
+        # later batches update their sources and keep the others
+        write_manifests([self._job("a", [1280])])
+        with open(manifests[0]) as manifest:
+            entries = json.load(manifest)
+        self.assertEqual(sorted(entries), ["a.png", "c.png"])
+        self.assertEqual(entries["a.png"]["srcset"], "a-1280w.webp 1280w")
+
+    def test_concurrent_writers(self):
+        jobs = [self._job("image%d" % index, [320]) for index in range(20)]
+        threads = [threading.Thread(target=write_manifests, args=([job],)) for job in jobs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with open(os.path.join(self.folder, MANIFEST_NAME)) as manifest:
+            entries = json.load(manifest)
+        # no update lost, no temporary file left
+        self.assertEqual(len(entries), 20)
+        self.assertEqual([name for name in os.listdir(self.folder) if name.endswith(".tmp")], [])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+#
+#  MIT License
+#
+#  Copyright (c) 2020-2021 Nicola Tudino aka tudo75
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+
+import os
+import tempfile
+from unittest import TestCase, main
+
+from gi.repository import Gio, GLib
+from pywebp.watcher import DirectoryWatcher
+
+
+class DirectoryWatcherTest(TestCase):
+    """New image detection Tests.
+    """
+
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.root = self._tmp_dir.name
+        self.ready = []
+        self.watcher = DirectoryWatcher(True, self.ready.append, settle_interval=20)
+        self.addCleanup(self.watcher.stop)
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def _file(self, name, data=b"image"):
+        path = os.path.join(self.root, name)
+        with open(path, "ab") as image_file:
+            image_file.write(data)
+        return path
+
+    def _event(self, path, event_type, other_path=None):
+        other_file = Gio.File.new_for_path(other_path) if other_path is not None else None
+        self.watcher._on_changed(None, Gio.File.new_for_path(path), other_file, event_type)
+
+    def test_changes_done(self):
+        path = self._file("a.png")
+        self._event(path, Gio.FileMonitorEvent.CREATED)
+        self._event(path, Gio.FileMonitorEvent.CHANGES_DONE_HINT)
+        self.assertEqual(self.ready, [path])
+        self.assertEqual(self.watcher._pending, {})
+
+    def test_settle(self):
+        path = self._file("a.png")
+        self._event(path, Gio.FileMonitorEvent.CREATED)
+        self.assertEqual(self.ready, [])
+        # still growing
+        self._file("a.png", b"more")
+        os.utime(path, ns=(1, 1))
+        self.assertTrue(self.watcher._check_pending())
+        self.assertEqual(self.ready, [])
+        self.assertFalse(self.watcher._check_pending())
+        self.assertEqual(self.ready, [path])
+        self.assertIsNone(self.watcher._timer_id)
+
+    def test_empty_file_not_ready(self):
+        path = self._file("a.png", b"")
+        self._event(path, Gio.FileMonitorEvent.CREATED)
+        self.assertTrue(self.watcher._check_pending())
+        self.assertEqual(self.ready, [])
+
+    def test_deleted_while_written(self):
+        path = self._file("a.png")
+        self._event(path, Gio.FileMonitorEvent.CHANGED)
+        os.remove(path)
+        self._event(path, Gio.FileMonitorEvent.DELETED)
+        self.assertEqual(self.watcher._pending, {})
+        self._event(path, Gio.FileMonitorEvent.CHANGES_DONE_HINT)
+        self.assertEqual(self.ready, [])
+
+    def test_renamed(self):
+        partial = self._file("a.png.part")
+        self._event(partial, Gio.FileMonitorEvent.CREATED)
+        path = os.path.join(self.root, "a.png")
+        os.rename(partial, path)
+        self._event(partial, Gio.FileMonitorEvent.RENAMED, path)
+        self.assertEqual(self.ready, [path])
+        self.assertEqual(self.watcher._pending, {})
+
+    def test_not_an_input_file(self):
+        for name in ("a.txt", "b.webp"):
+            path = self._file(name)
+            self._event(path, Gio.FileMonitorEvent.CREATED)
+            self._event(path, Gio.FileMonitorEvent.CHANGES_DONE_HINT)
+        self.assertEqual(self.ready, [])
+        self.assertEqual(self.watcher._pending, {})
+
+    def test_new_folder(self):
+        self.watcher.recursive = True
+        self.watcher.watch(self.root)
+        folder = os.path.join(self.root, "sub")
+        os.mkdir(folder)
+        path = self._file(os.path.join("sub", "a.png"))
+        self._event(folder, Gio.FileMonitorEvent.CREATED)
+        self.assertEqual(sorted(self.watcher.folders()), [self.root, folder])
+        self.assertEqual(list(self.watcher._pending), [path])
+        self._event(folder, Gio.FileMonitorEvent.DELETED)
+        self.assertEqual(self.watcher.folders(), [self.root])
+
+    def test_watch(self):
+        loop = GLib.MainLoop()
+        self.watcher._on_ready = lambda path: (self.ready.append(path), loop.quit())
+        self.watcher.watch(self.root)
+        path = self._file("a.png")
+        timeout = GLib.timeout_add(5000, loop.quit)
+        loop.run()
+        GLib.source_remove(timeout)
+        self.assertEqual(self.ready, [path])
+
+
+if __name__ == '__main__':
+    main()